@@ -0,0 +1,457 @@
+"""
+In-process benchmark and load test: drives the ASGI app directly (no network,
+no uvicorn) across every route and reports throughput, p50/p95/p99 latency and
+peak RSS per scenario.
+
+Usage:
+    python bench.py                                  # all scenarios, table output
+    python bench.py --only impact --requests 5000 --concurrency 20
+    python bench.py --json results.json              # also write machine-readable results
+    python bench.py --baseline bench_baseline.json   # compare; exit 1 on regression
+    python bench.py --micro                          # compute_impact alone, no framework
+    python bench.py --fast-codec off --cache hit     # A/B the FAST_CODEC path / cached responses
+    python bench.py --admission off                  # route cost without admission control shedding
+
+Because the app runs in-process, the numbers isolate application cost. To
+include uvicorn and the serving mode (WORKERS, limit_concurrency, keep-alive),
+point it at a running server instead; each concurrent client then holds one
+keep-alive connection:
+
+    WORKERS=4 python run_server.py &
+    python bench.py --url http://127.0.0.1:8000 --only impact-compute-small --concurrency 32
+
+--concurrency mimics concurrent in-flight requests.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import random
+import sys
+import time
+import timeit
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlsplit
+
+try:
+    import resource
+except ImportError:  # Windows: peak RSS is not reported
+    resource = None
+
+import main
+
+DEFAULT_REQUESTS = 2000
+DEFAULT_CONCURRENCY = 10
+DEFAULT_TOLERANCE = 0.15
+MIN_REQUESTS = 20
+
+_SOLVENT_NAMES = ["water", "ethyl acetate", "toluene", "ethanol", "dichloromethane", "heptane"]
+
+
+def peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+# ------------------------------------------------------------------------------
+# Payloads (deterministic per request index, so cache misses are reproducible)
+# ------------------------------------------------------------------------------
+def impact_payload(i: int, n_reactants: int, n_solvents: int) -> Dict[str, Any]:
+    rng = random.Random(i * 7919 + n_reactants)
+    return {
+        "product": {"mw": rng.uniform(100, 600), "actual_mass_g": rng.uniform(1, 50), "carbon_atoms": rng.randint(4, 30)},
+        "reactants": [
+            {"name": f"r{j}", "mw": rng.uniform(20, 500), "mass_g": rng.uniform(0.5, 100), "carbon_atoms": rng.randint(0, 20),
+             "eq_used": rng.uniform(1, 2), "eq_stoich": 1.0}
+            for j in range(n_reactants)
+        ],
+        "solvents": [
+            {"name": rng.choice(_SOLVENT_NAMES), "mass_g": rng.uniform(10, 1000), "recovery_pct": rng.uniform(0, 90)}
+            for _ in range(n_solvents)
+        ],
+        "catalysts": [{"mw": 224.5, "mass_g": rng.uniform(0.01, 1)}],
+        "workup": {"aqueous_washes_g": rng.uniform(0, 500), "drying_agents_g": rng.uniform(0, 20)},
+        "conditions": {"time_h": rng.uniform(0.5, 24), "mode": rng.choice(["hotplate", "microwave", "reflux", "other"])},
+    }
+
+
+IMPACT_SIZES = {"tiny": (1, 0), "small": (3, 2), "medium": (25, 25), "large": (300, 300)}
+
+
+def _u(i: int, lo: float, hi: float) -> float:
+    return random.Random(i).uniform(lo, hi)
+
+
+class Scenario:
+    def __init__(self, name: str, path: str, make: Optional[Callable[[int], Any]] = None, method: str = "POST",
+                 query: str = "", weight: float = 1.0, content_type: str = "application/json"):
+        self.name = name
+        self.path = path
+        self.make = make  # request index -> JSON-able body (or bytes); None for GET
+        self.method = method
+        self.query = query
+        self.weight = weight  # fraction of --requests for expensive scenarios
+        self.content_type = content_type
+
+    def body(self, i: int) -> bytes:
+        if self.make is None:
+            return b""
+        data = self.make(i)
+        return data if isinstance(data, bytes) else json.dumps(data).encode()
+
+
+def _stream_body(i: int) -> bytes:
+    return "".join(json.dumps(impact_payload(i * 1000 + k, 3, 2)) + "\n" for k in range(200)).encode()
+
+
+SCENARIOS: List[Scenario] = [
+    Scenario("health", "/api/health", method="GET"),
+    Scenario("cache-stats", "/api/cache/stats", method="GET"),
+    Scenario("atom-economy", "/api/atom-economy", lambda i: {"mw_product": _u(i, 50, 100), "mw_reactants_total": _u(i, 100, 300)}),
+    Scenario("e-factor", "/api/e-factor", lambda i: {"total_mass_in": _u(i, 100, 300), "product_mass": _u(i, 10, 100)}),
+    Scenario("e-factor-direct", "/api/e-factor-direct", lambda i: {"waste_mass": _u(i, 0, 300), "product_mass": _u(i, 10, 100)}),
+    Scenario("pmi", "/api/pmi", lambda i: {"total_mass_in": _u(i, 100, 300), "product_mass": _u(i, 10, 100)}),
+    Scenario("water-impact", "/api/water-impact", lambda i: {"water_liters": _u(i, 0, 50), "product_mass_g": _u(i, 1, 100)}),
+    Scenario("energy-impact", "/api/energy-impact", lambda i: {"kwh": _u(i, 0, 5), "product_mass_g": _u(i, 1, 100)}),
+    Scenario("rme", "/api/rme", lambda i: {"reactant_masses_g": [_u(i, 1, 50), _u(i + 1, 1, 50)], "product_mass_g": _u(i, 1, 40)}),
+    Scenario("carbon-efficiency", "/api/carbon-efficiency", lambda i: {
+        "product": {"mass_g": _u(i, 1, 20), "mw": 180.16, "carbon_atoms": 6},
+        "reactants": [{"mass_g": _u(i, 10, 40), "mw": 138.12, "carbon_atoms": 7}, {"mass_g": 5.0, "mw": 102.09, "carbon_atoms": 4}],
+    }),
+    Scenario("stoichiometric-factor", "/api/stoichiometric-factor", lambda i: {
+        "species": [{"name": "A", "eq_used": _u(i, 1, 2), "eq_stoich": 1}, {"name": "B", "eq_used": 1.5, "eq_stoich": 1}],
+    }),
+    *[
+        Scenario(f"impact-compute-{size}", "/api/impact/compute",
+                 lambda i, nr=nr, ns=ns: impact_payload(i, nr, ns), weight=0.25 if size == "large" else 1.0)
+        for size, (nr, ns) in IMPACT_SIZES.items()
+    ],
+    Scenario("impact-batch-100", "/api/impact/compute-batch",
+             lambda i: {"items": [impact_payload(i * 100 + k, 3, 2) for k in range(100)]}, weight=0.05),
+    Scenario("impact-metrics-100", "/api/impact/metrics", lambda i: {
+        "items": [impact_payload(i * 100 + k, 3, 2) for k in range(100)],
+        "formulas": [{"name": "solvent_weighted_pmi", "params": {"hazard": {"toluene": 3, "dichloromethane": 5, "water": 0.1}},
+                      "formula": "(total_input_mass_g - solvent_mass_total_g + sum_solvents(mass_g * lookup(\"hazard\", 1))) / product_mass_g"},
+                     {"name": "co2_g_per_g", "formula": "energy_kWh_per_g * 380"}],
+    }, weight=0.05),
+    Scenario("impact-sweep-400", "/api/impact/sweep", lambda i: {
+        "base": impact_payload(i, 3, 2),
+        "axes": [{"field": "solvents.0.recovery_pct", "start": 0, "stop": 95, "num": 20},
+                 {"field": "conditions.time_h", "start": 0.5, "stop": 24, "num": 20}],
+    }, weight=0.05),
+    Scenario("impact-uncertainty-2k", "/api/impact/uncertainty", lambda i: {
+        "base": impact_payload(i, 3, 2), "samples": 2000, "seed": i,
+        "distributions": [{"field": "product.actual_mass_g", "dist": "normal", "sd": 0.5},
+                          {"field": "solvents.0.recovery_pct", "dist": "uniform", "low": 50, "high": 90}],
+    }, weight=0.05),
+    Scenario("impact-pareto-5k", "/api/impact/pareto", lambda i: {
+        "base": impact_payload(i, 3, 2),
+        "overrides": {"solvents.0.mass_g": [_u(i * 5000 + k, 10, 1000) for k in range(5000)],
+                      "product.actual_mass_g": [_u(i * 5000 + k + 1, 1, 50) for k in range(5000)],
+                      "conditions.time_h": [_u(i * 5000 + k + 2, 0.5, 24) for k in range(5000)]},
+        "fronts": 3,
+    }, weight=0.02),
+    Scenario("impact-stream-200", "/api/impact/stream", _stream_body, weight=0.02, content_type="application/x-ndjson"),
+    Scenario("route-compute-10", "/api/route/compute", lambda i: {
+        "steps": [{"id": f"s{k}", "reaction": impact_payload(i * 10 + k, 3, 2),
+                   "intermediates": [{"step": f"s{k - 1}", "reactant": 0}] if k else []} for k in range(10)],
+    }, weight=0.25),
+    Scenario("molecules-resolve", "/api/molecules/resolve", lambda i: {
+        "smiles": ["CCO", "c1ccccc1", "CC(=O)Oc1ccccc1C(=O)O", f"C{'C' * (i % 20)}O"], "formulas": ["C6H12O6", "H2SO4"],
+    }),
+    Scenario("chemicals-lookup", "/api/chemicals/lookup", method="GET", query="name=ethyl%20acetate"),
+    Scenario("chemicals-autocomplete", "/api/chemicals/autocomplete", method="GET", query="q=eth&limit=10"),
+    Scenario("page-home", "/", method="GET"),
+    Scenario("page-tools", "/tools", method="GET"),
+    Scenario("page-gamification", "/gamification", method="GET"),
+    Scenario("page-simulate", "/simulate", method="GET"),
+]
+
+
+# ------------------------------------------------------------------------------
+# In-process ASGI driver
+# ------------------------------------------------------------------------------
+async def asgi_request(app, method: str, path: str, query: str = "", body: bytes = b"",
+                       content_type: str = "application/json") -> int:
+    """Run one request through the ASGI app; returns the status code once the body is complete."""
+    done = asyncio.Event()
+    status = 0
+    sent_body = False
+
+    async def receive():
+        nonlocal sent_body
+        if not sent_body:
+            sent_body = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body" and not message.get("more_body", False):
+            done.set()
+
+    headers = [(b"host", b"bench"), (b"accept-encoding", b"gzip, br")]
+    if body:
+        headers += [(b"content-type", content_type.encode()), (b"content-length", str(len(body)).encode())]
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method, "scheme": "http",
+        "path": path, "raw_path": path.encode(), "root_path": "", "query_string": query.encode(),
+        "headers": headers, "client": ("127.0.0.1", 50000), "server": ("bench", 80),
+    }
+    await app(scope, receive, send)
+    return status
+
+
+class HTTPClient:
+    """One keep-alive HTTP/1.1 connection to a running server (--url runs); same call signature as asgi_request."""
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def _read_response(self) -> Optional[int]:
+        status_line = await self.reader.readline()
+        if not status_line:
+            return None  # server closed the idle connection (e.g. a recycled worker)
+        status = int(status_line.split()[1])
+        headers = {}
+        while (line := await self.reader.readline()) not in (b"\r\n", b""):
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        if "content-length" in headers:
+            await self.reader.readexactly(int(headers["content-length"]))
+        elif headers.get("transfer-encoding") == "chunked":
+            while (size := int((await self.reader.readline()).strip(), 16)) > 0:
+                await self.reader.readexactly(size + 2)
+            await self.reader.readexactly(2)
+        if headers.get("connection") == "close":
+            self.close()
+        return status
+
+    async def __call__(self, method: str, path: str, query: str = "", body: bytes = b"",
+                       content_type: str = "application/json") -> int:
+        target = f"{path}?{query}" if query else path
+        head = f"{method} {target} HTTP/1.1\r\nHost: {self.host}\r\nAccept-Encoding: gzip, br\r\n"
+        if body:
+            head += f"Content-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+        for _ in range(2):
+            if self.writer is None:
+                self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+            self.writer.write(head.encode() + b"\r\n" + body)
+            status = await self._read_response()
+            if status is not None:
+                return status
+            self.close()
+        raise ConnectionError(f"{self.host}:{self.port} closed the connection twice")
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    # Nearest-rank percentile.
+    k = max(0, min(len(sorted_values) - 1, int(round(q / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+
+async def run_scenario(new_client: Callable[[], Callable], sc: Scenario, n: int, concurrency: int,
+                       cache_hits: bool, remote: bool = False) -> Dict[str, Any]:
+    """new_client() returns a request function (asgi_request bound to the app, or an HTTPClient)."""
+    bodies = [sc.body(0 if cache_hits else i) for i in range(n)]
+    warm = min(n, 50)
+    request = new_client()
+    for i in range(warm):
+        # A remote server's cache cannot be cleared, so misses warm up on payloads outside the run.
+        body = sc.body(n + i) if remote and not cache_hits and sc.make is not None else bodies[i]
+        await request(sc.method, sc.path, sc.query, body, sc.content_type)
+    if not cache_hits and not remote:
+        main.result_cache.clear()
+
+    latencies: List[float] = []
+    errors = 0
+    next_index = iter(range(n))
+
+    async def worker():
+        nonlocal errors
+        request = new_client()
+        for i in next_index:
+            t = time.perf_counter()
+            status = await request(sc.method, sc.path, sc.query, bodies[i], sc.content_type)
+            latencies.append(time.perf_counter() - t)
+            if status >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": n,
+        "errors": errors,
+        "rps": round(n / elapsed, 1),
+        "mean_ms": round(sum(latencies) / n * 1000, 3),
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(_percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 3),
+        "peak_rss_mb": None if remote else peak_rss_mb(),
+    }
+
+
+# ------------------------------------------------------------------------------
+# Micro-benchmark: compute cost without the framework
+# ------------------------------------------------------------------------------
+def _per_call_us(fn: Callable[[], Any]) -> float:
+    timer = timeit.Timer(fn)
+    loops, _ = timer.autorange()
+    return round(min(timer.repeat(repeat=5, number=loops)) / loops * 1e6, 2)
+
+
+def run_micro() -> Dict[str, Any]:
+    results = {}
+    for size, (nr, ns) in IMPACT_SIZES.items():
+        raw = json.dumps(impact_payload(0, nr, ns)).encode()
+        payload = main.ReactionImpactIn.model_validate_json(raw)
+        result = main.compute_impact_dict(payload)
+        results[f"impact-{size}"] = {
+            "validate_us": _per_call_us(lambda: main.ReactionImpactIn.model_validate_json(raw)),
+            "compute_us": _per_call_us(lambda: main.compute_impact_dict(payload)),
+            "compute_model_us": _per_call_us(lambda: main.compute_impact(payload)),
+            "encode_us": _per_call_us(lambda: main._encode_json(result)),
+            "cache_key_us": _per_call_us(lambda: main._payload_key("bench", payload)),
+        }
+    return results
+
+
+# ------------------------------------------------------------------------------
+# Reporting / baseline comparison
+# ------------------------------------------------------------------------------
+def _compared_metrics(section: str, row: Dict[str, Any]) -> List[tuple]:
+    # (metric, lower_is_better)
+    if section == "scenarios":
+        return [("rps", False), ("p95_ms", True)]
+    return [(key, True) for key in row]
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Returns human-readable regressions (throughput drop or latency rise beyond tolerance)."""
+    regressions = []
+    for section in ("scenarios", "micro"):
+        for name, cur in results.get(section, {}).items():
+            base = baseline.get(section, {}).get(name)
+            if not base:
+                continue
+            for key, lower_is_better in _compared_metrics(section, cur):
+                b, c = base.get(key), cur.get(key)
+                if not b or c is None:
+                    continue
+                change = (c - b) / b
+                if (change if lower_is_better else -change) > tolerance:
+                    regressions.append(f"{section}/{name} {key}: {b} -> {c} ({change:+.0%})")
+    return regressions
+
+
+def print_table(results: Dict[str, Any]) -> None:
+    meta = results["meta"]
+    print(f"target={meta.get('target', 'in-process')} fast_codec={meta['fast_codec']} admission={meta.get('admission')} cache={meta['cache']} concurrency={meta['concurrency']} "
+          f"python={meta['python']}")
+    if results.get("scenarios"):
+        print(f"\n{'scenario':26} {'req':>6} {'err':>4} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'RSS MB':>7}")
+        for name, r in results["scenarios"].items():
+            print(f"{name:26} {r['requests']:6} {r['errors']:4} {r['rps']:9.1f} {r['p50_ms']:8.3f} "
+                  f"{r['p95_ms']:8.3f} {r['p99_ms']:8.3f} {r['peak_rss_mb'] if r['peak_rss_mb'] is not None else '-':>7}")
+    if results.get("micro"):
+        print(f"\n{'micro (us/call)':26} {'validate':>9} {'compute':>9} {'+model':>9} {'encode':>9} {'cache key':>9}")
+        for name, r in results["micro"].items():
+            print(f"{name:26} {r['validate_us']:9.2f} {r['compute_us']:9.2f} {r['compute_model_us']:9.2f} "
+                  f"{r['encode_us']:9.2f} {r['cache_key_us']:9.2f}")
+
+
+def main_cli(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="In-process benchmark of the Green Toolkit backend.")
+    parser.add_argument("--requests", type=int, default=DEFAULT_REQUESTS, help="Requests per scenario (scaled down for heavy ones)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Concurrent in-flight requests")
+    parser.add_argument("--only", action="append", help="Run scenarios whose name contains this (repeatable)")
+    parser.add_argument("--cache", choices=["miss", "hit"], default="miss", help="Distinct payloads (miss) or one repeated payload (hit)")
+    parser.add_argument("--fast-codec", choices=["on", "off"], help="Override FAST_CODEC")
+    parser.add_argument("--admission", choices=["on", "off"], help="Override ADMISSION_ENABLED (off: route cost without queueing / shedding)")
+    parser.add_argument("--micro", action="store_true", help="Only micro-benchmark compute_impact (no ASGI)")
+    parser.add_argument("--json", help="Write results to this file")
+    parser.add_argument("--baseline", help="Compare with a results file written by --json")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="Allowed relative regression (default 0.15)")
+    parser.add_argument("--list", action="store_true", help="List scenarios and exit")
+    parser.add_argument("--url", help="Benchmark a running server over HTTP (e.g. http://127.0.0.1:8000) instead of in-process")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for sc in SCENARIOS:
+            print(f"{sc.name:26} {sc.method:4} {sc.path}")
+        return 0
+    if args.url and (args.fast_codec or args.admission or args.micro):
+        parser.error("--fast-codec, --admission and --micro apply to in-process runs only; configure the server instead")
+    if args.fast_codec:
+        main.FAST_CODEC = args.fast_codec == "on"
+    if args.admission:
+        main.ADMISSION_ENABLED = args.admission == "on"
+    if not args.url:
+        main._warm_up()
+
+    results: Dict[str, Any] = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "target": args.url or "in-process",
+            "fast_codec": main.FAST_CODEC if not args.url else None,
+            "admission": main.ADMISSION_ENABLED if not args.url else None,
+            "prerender_pages": main.PRERENDER_PAGES,
+            "cache": args.cache,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+        },
+    }
+    if args.micro:
+        results["micro"] = run_micro()
+    else:
+        scenarios = [sc for sc in SCENARIOS if not args.only or any(o in sc.name for o in args.only)]
+        if args.url:
+            target = urlsplit(args.url)
+            new_client = lambda: HTTPClient(target.hostname, target.port or 80)
+        else:
+            app = main.create_app()
+            new_client = lambda: lambda *a: asgi_request(app, *a)
+
+        async def run_all():
+            out = {}
+            for sc in scenarios:
+                n = max(MIN_REQUESTS, int(args.requests * sc.weight))
+                out[sc.name] = await run_scenario(new_client, sc, n, args.concurrency, args.cache == "hit", bool(args.url))
+            return out
+        results["scenarios"] = asyncio.run(run_all())
+        results["meta"]["peak_rss_mb"] = None if args.url else peak_rss_mb()
+
+    print_table(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        print(f"\nBaseline {args.baseline} (tolerance {args.tolerance:.0%}): "
+              f"{len(regressions)} regression(s)")
+        for line in regressions:
+            print(f"  {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
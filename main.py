@@ -1,51 +1,953 @@
-from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi import FastAPI, APIRouter, Request, HTTPException, Query, WebSocket, WebSocketDisconnect
+from fastapi.routing import APIRoute
+from fastapi.responses import HTMLResponse, FileResponse, StreamingResponse, Response, PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
+from starlette.requests import ClientDisconnect
 from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
-from typing import List, Optional, Literal, Dict, Any
+from pydantic import BaseModel, Field, ValidationError, ConfigDict, model_validator
+from typing import List, Optional, Literal, Dict, Any, Union, Callable
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from bisect import bisect_left, insort
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
-from math import isfinite
+from math import ceil, isfinite
 import os
 import sys
+import ast
 import asyncio
+import codecs
+import csv
+import json
+import re
+import time
+import hashlib
+import base64
+import sqlite3
+import secrets
+import inspect
+import functools
+import threading
+import gzip
+import importlib
+import multiprocessing
+import tempfile
+import logging
+
+try:
+    import brotli
+except ImportError:  # optional: without it pages and assets are served gzip-compressed only
+    brotli = None
 
 
 
 # ------------------------------------------------------------------------------
 # App & paths
 # ------------------------------------------------------------------------------
+# Routes are registered on `router`; create_app() at the bottom of this module
+# builds the FastAPI app. Cold start is user-visible on Render's free plan, so
+# heavy or optional subsystems (numpy, Jinja templates, static mounts, lookup
+# tables, pre-rendered pages) are set up on first use, or by a background
+# warm-up once the server is already accepting connections.
 BASE_DIR = Path(__file__).parent.resolve()
+WARM_UP_ON_STARTUP = os.getenv("WARM_UP_ON_STARTUP", "1") == "1"
+
+logger = logging.getLogger(__name__)
+
+class _LazyModule:
+    """Module proxy that imports on first attribute access."""
+    def __init__(self, name: str):
+        self._name = name
+
+    def __getattr__(self, attr):
+        return getattr(importlib.import_module(self._name), attr)
+
+np = _LazyModule("numpy")
+
+# ------------------------------------------------------------------------------
+# Fast codec path for compute endpoints
+# ------------------------------------------------------------------------------
+# The calculators do microseconds of arithmetic, so the default FastAPI pipeline
+# dominates their cost: json.loads + model validation, a thread-pool hop for the
+# sync handler, then response_model validation and encoding. Endpoints decorated
+# with @cached_result carry a `fast_codec` responder; for them FastCodecRoute
+# decodes and validates the raw body in one pass with the model's compiled
+# pydantic-core validator, calls the handler inline on the event loop (small
+# bodies only) and encodes its plain-dict result without validating it again.
+# Anything unusual (non-JSON content type, empty or invalid body) falls back to
+# the default handler, so error responses are unchanged. Response bytes are the
+# same in both modes; the stdlib C encoder is kept on purpose because orjson and
+# pydantic's Rust serializer print floats differently (5e-6 vs 5e-06).
+FAST_CODEC = os.getenv("FAST_CODEC", "1") == "1"
+FAST_CODEC_INLINE_MAX_BYTES = int(os.getenv("FAST_CODEC_INLINE_MAX_BYTES", str(64 * 1024)))
+
+_json_encoder = json.JSONEncoder(ensure_ascii=False, allow_nan=False, separators=(",", ":"))
+
+def _is_json_content_type(content_type: Optional[str]) -> bool:
+    # Mirrors FastAPI: a missing content type, application/json and application/*+json are parsed as JSON.
+    if not content_type:
+        return True
+    mime = content_type.split(";", 1)[0].strip().lower()
+    return mime == "application/json" or (mime.startswith("application/") and mime.endswith("+json"))
+
+class FastCodecRoute(APIRoute):
+    """APIRoute that times endpoints for /metrics and serves `fast_codec` endpoints without the generic pipeline."""
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs):
+        super().__init__(path, _timed_endpoint(endpoint), **kwargs)
+
+    def get_route_handler(self):
+        default_handler = super().get_route_handler()
+        fast_codec = getattr(self.endpoint, "fast_codec", None)
+        if fast_codec is None:
+            return default_handler
+        validator, respond = fast_codec
+
+        async def handler(request: Request) -> Response:
+            # FAST_CODEC is read per request so the switch can be flipped at runtime (benchmarks).
+            if not FAST_CODEC or not _is_json_content_type(request.headers.get("content-type")):
+                return await default_handler(request)
+            body = await request.body()
+            try:
+                payload = validator.validate_json(body)
+            except ValidationError:
+                return await default_handler(request)  # re-validates to build the standard 422
+            if_none_match = request.headers.get("if-none-match")
+            _mark("endpoint_start")
+            try:
+                if len(body) <= FAST_CODEC_INLINE_MAX_BYTES:
+                    return respond(payload, if_none_match)
+                return await run_in_threadpool(respond, payload, if_none_match)
+            finally:
+                _mark("endpoint_end")
+        return handler
+
+router = APIRouter(route_class=FastCodecRoute)
+
+# ------------------------------------------------------------------------------
+# Metrics (Prometheus text format at /metrics)
+# ------------------------------------------------------------------------------
+# access_log is off in production, so request counts, latency and error rates
+# come from here. MetricsMiddleware times each request and hands it a timing
+# dict through a context variable (shared with thread-pool calls); routes mark
+# when the endpoint starts and ends, and @cached_result adds the time spent
+# rendering JSON. Stages add up to the request latency:
+#   parse     - request start -> endpoint start (body read, JSON decode,
+#               validation, thread-pool dispatch)
+#   compute   - endpoint time minus rendering (handler, cache lookup)
+#   serialize - rendering inside the endpoint plus everything after it
+#               (response_model, encoding, sending)
+# Everything is recorded on the event loop once the request finishes, so the
+# fixed-bucket histograms need no locks.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+METRICS_LOOP_LAG_INTERVAL_S = float(os.getenv("METRICS_LOOP_LAG_INTERVAL_S", "0.5"))
+LIMIT_CONCURRENCY = int(os.getenv("LIMIT_CONCURRENCY", "0"))  # exported by run_server.py; 0 = unknown
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", "1"))  # set by run_server.py before forking pre-fork workers
+_LATENCY_BUCKETS_S = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+_UNMATCHED_ROUTE = "unmatched"
+
+_request_timing: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timing", default=None)
+
+def _require_single_worker(feature: str) -> None:
+    """Refuses features whose state lives in one process when pre-fork workers would split it."""
+    if WEB_WORKERS > 1:
+        raise HTTPException(status_code=503, detail=f"{feature} keep state in one process and are disabled with "
+                                                    f"{WEB_WORKERS} pre-fork workers; run with WORKERS=1.")
+
+def _mark(name: str) -> None:
+    timing = _request_timing.get()
+    if timing is not None:
+        timing[name] = time.perf_counter()
+
+def _add_stage_time(name: str, seconds: float) -> None:
+    timing = _request_timing.get()
+    if timing is not None:
+        timing[name] = timing.get(name, 0.0) + seconds
+
+def _timed_endpoint(fn):
+    """Wraps an endpoint so it marks endpoint_start / endpoint_end for the stage split."""
+    if getattr(fn, "_timed", False):  # include_router re-creates routes from the wrapped endpoint
+        return fn
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            _mark("endpoint_start")
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                _mark("endpoint_end")
+    else:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            _mark("endpoint_start")
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _mark("endpoint_end")
+    wrapper._timed = True
+    return wrapper
+
+class Histogram:
+    """Fixed-bucket histogram; counts are per bucket and made cumulative when rendered."""
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple = _LATENCY_BUCKETS_S):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+def _label_str(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in labels.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + "}"
+
+def _histogram_lines(name: str, series) -> List[str]:
+    lines = []
+    for labels, h in series:
+        cumulative = 0
+        for le, n in zip((*h.buckets, "+Inf"), h.counts):
+            cumulative += n
+            lines.append(f"{name}_bucket{_label_str({**labels, 'le': le})} {cumulative}")
+        lines.append(f"{name}_sum{_label_str(labels)} {h.sum!r}")
+        lines.append(f"{name}_count{_label_str(labels)} {h.count}")
+    return lines
+
+class Metrics:
+    def __init__(self):
+        self.requests: Dict[tuple, int] = {}         # (route, method, status) -> count
+        self.latency: Dict[str, Histogram] = {}      # route -> request latency
+        self.stages: Dict[tuple, Histogram] = {}     # (route, stage) -> stage latency
+        self.in_flight = 0
+        self.loop_lag = Histogram()
+        self.loop_lag_last = 0.0
+
+    def _observe(self, table: Dict, key, value: float) -> None:
+        hist = table.get(key)
+        if hist is None:
+            hist = table[key] = Histogram()
+        hist.observe(value)
+
+    def record(self, route: str, method: str, status: int, start: float, end: float,
+               timing: Dict[str, float], matched: bool) -> None:
+        key = (route, method, status)
+        self.requests[key] = self.requests.get(key, 0) + 1
+        self._observe(self.latency, route, end - start)
+        endpoint_start, endpoint_end = timing.get("endpoint_start"), timing.get("endpoint_end")
+        if endpoint_start is None or endpoint_end is None:
+            if matched:  # rejected before the endpoint ran (e.g. 422): all parse
+                self._observe(self.stages, (route, "parse"), end - start)
+            return
+        rendered = timing.get("serialize", 0.0)
+        self._observe(self.stages, (route, "parse"), endpoint_start - start)
+        self._observe(self.stages, (route, "compute"), endpoint_end - endpoint_start - rendered)
+        self._observe(self.stages, (route, "serialize"), rendered + end - endpoint_end)
+
+    def render(self) -> str:
+        lines = [
+            "# HELP http_requests_total Requests by route, method and status code.",
+            "# TYPE http_requests_total counter",
+        ]
+        for (route, method, status), n in sorted(self.requests.items()):
+            lines.append(f"http_requests_total{_label_str({'route': route, 'method': method, 'status': status})} {n}")
+        lines += [
+            "# HELP http_request_duration_seconds Request latency by route.",
+            "# TYPE http_request_duration_seconds histogram",
+            *_histogram_lines("http_request_duration_seconds",
+                              (({"route": r}, h) for r, h in sorted(self.latency.items()))),
+            "# HELP http_request_stage_duration_seconds Request latency by route and stage (parse, compute, serialize).",
+            "# TYPE http_request_stage_duration_seconds histogram",
+            *_histogram_lines("http_request_stage_duration_seconds",
+                              (({"route": r, "stage": st}, h) for (r, st), h in sorted(self.stages.items()))),
+            "# HELP http_requests_in_flight Requests currently being served.",
+            "# TYPE http_requests_in_flight gauge",
+            f"http_requests_in_flight {self.in_flight}",
+        ]
+        if LIMIT_CONCURRENCY:
+            lines += [
+                "# HELP http_requests_in_flight_limit LIMIT_CONCURRENCY: requests run at once (admission control queues or sheds the rest).",
+                "# TYPE http_requests_in_flight_limit gauge",
+                f"http_requests_in_flight_limit {LIMIT_CONCURRENCY}",
+            ]
+        lines += [
+            "# HELP event_loop_lag_seconds Delay of a periodic event-loop timer beyond its schedule.",
+            "# TYPE event_loop_lag_seconds histogram",
+            *_histogram_lines("event_loop_lag_seconds", [({}, self.loop_lag)]),
+            "# HELP event_loop_lag_last_seconds Most recent event-loop lag sample.",
+            "# TYPE event_loop_lag_last_seconds gauge",
+            f"event_loop_lag_last_seconds {self.loop_lag_last!r}",
+        ]
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
 
-app = FastAPI(title="Green Toolkit")
+def _route_label(scope, root_path: str) -> tuple:
+    """(label, matched): the route template, a mount prefix, or 'unmatched' (keeps label cardinality bounded)."""
+    route = scope.get("route")
+    if route is not None:
+        return route.path, True
+    mount = scope.get("root_path", "")[len(root_path):]
+    return (f"{mount}/{{path}}", False) if mount else (_UNMATCHED_ROUTE, False)
 
-# Add CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # Allow all origins for now
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+class MetricsMiddleware:
+    """Pure ASGI middleware (no BaseHTTPMiddleware task overhead) feeding `metrics`."""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        timing: Dict[str, float] = {}
+        token = _request_timing.set(timing)
+        root_path = scope.get("root_path", "")
+        status = 500  # unless a response starts, ServerErrorMiddleware answers 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        metrics.in_flight += 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            end = time.perf_counter()
+            metrics.in_flight -= 1
+            _request_timing.reset(token)
+            route, matched = _route_label(scope, root_path)
+            metrics.record(route, scope["method"], status, start, end, timing, matched)
+
+async def _monitor_loop_lag(interval_s: float) -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        scheduled = loop.time() + interval_s
+        await asyncio.sleep(interval_s)
+        lag = max(0.0, loop.time() - scheduled)
+        metrics.loop_lag.observe(lag)
+        metrics.loop_lag_last = lag
+
+@router.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    # async: renders on the event loop, where all metrics are written, for a consistent snapshot
+    text = metrics.render()
+    if ADMISSION_ENABLED:
+        text += "\n".join(admission.render()) + "\n"
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
+
+# ------------------------------------------------------------------------------
+# Admission control (priority classes, per-client token buckets, load shedding)
+# ------------------------------------------------------------------------------
+# The app, not uvicorn, bounds how many requests run at once (LIMIT_CONCURRENCY;
+# run_server.py gives uvicorn a looser connection backstop), so overload queues
+# here where requests can be prioritized:
+#   critical - /api/health, /metrics: never queued or rate-limited, so platform
+#              health checks keep passing under load
+#   light    - calculators, lookups, pages, library, leaderboards, job control
+#   heavy    - /api/impact/*, /api/route/*, molecule batches; may hold at most
+#              ADMISSION_HEAVY_SHARE of the slots and queue behind light requests
+#   stream   - long-lived job event streams: rate-limited but hold no slot
+# A request that has to queue is shed with 503 + Retry-After right away when
+# the oldest request already waiting in its class (or, for heavy, in any
+# class) has waited past ADMISSION_QUEUE_TARGET_MS - a standing queue means
+# waiting longer will not help - or when the queue ahead of it cannot drain
+# within ADMISSION_MAX_WAIT_MS at the recent service time; a queued request
+# that still waits ADMISSION_MAX_WAIT_MS is shed then. Per-client token buckets answer 429; heavy
+# requests cost ADMISSION_HEAVY_COST tokens. A client is the socket peer, or,
+# behind ADMISSION_PROXY_HOPS trusted proxies, the X-Forwarded-For entry the
+# outermost of them appended (counted from the right: entries further left
+# are whatever the client sent). Loopback peers (local tools, bench.py) are
+# not rate-limited when no proxy is configured; a header never earns the
+# exemption. Everything runs on the event loop, so there are no locks.
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") == "1"
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", str(LIMIT_CONCURRENCY or 20)))
+ADMISSION_HEAVY_SHARE = float(os.getenv("ADMISSION_HEAVY_SHARE", "0.5"))
+ADMISSION_QUEUE_TARGET_MS = float(os.getenv("ADMISSION_QUEUE_TARGET_MS", "100"))
+ADMISSION_MAX_WAIT_MS = float(os.getenv("ADMISSION_MAX_WAIT_MS", "1000"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "200"))
+ADMISSION_CLIENT_RATE = float(os.getenv("ADMISSION_CLIENT_RATE", "50"))    # tokens per second, 0 = off
+ADMISSION_CLIENT_BURST = float(os.getenv("ADMISSION_CLIENT_BURST", "100"))
+ADMISSION_HEAVY_COST = float(os.getenv("ADMISSION_HEAVY_COST", "5"))
+ADMISSION_MAX_CLIENTS = int(os.getenv("ADMISSION_MAX_CLIENTS", "10000"))
+ADMISSION_PROXY_HOPS = int(os.getenv("ADMISSION_PROXY_HOPS", "1" if os.getenv("ENV") == "production" else "0"))
+
+_ADMISSION_CRITICAL_PATHS = frozenset({"/api/health", "/metrics"})
+_ADMISSION_HEAVY_PREFIXES = ("/api/impact/", "/api/route/", "/api/molecules/resolve", "/api/jobs/upload")
+_ADMISSION_STREAM_RE = re.compile(r"^/api/jobs/[^/]+/events$")
+_ADMISSION_CLASSES = ("critical", "light", "heavy", "stream")
+_ADMISSION_DECISIONS = ("admitted", "rate_limited", "shed_queue_full", "shed_queue_delay", "shed_timeout")
+_LOOPBACK_HOSTS = frozenset({"127.0.0.1", "::1", "localhost", "testclient"})
+
+def admission_class(path: str) -> str:
+    if path in _ADMISSION_CRITICAL_PATHS:
+        return "critical"
+    if path.startswith(_ADMISSION_HEAVY_PREFIXES):
+        return "heavy"
+    if _ADMISSION_STREAM_RE.match(path):
+        return "stream"
+    return "light"
+
+def _client_key(scope, proxy_hops: int) -> Optional[str]:
+    """Rate-limit key for the request; None for an exempt (local, unproxied) client."""
+    client = scope.get("client")
+    peer = client[0] if client else ""
+    if proxy_hops <= 0:
+        return None if peer in _LOOPBACK_HOSTS else peer
+    hops = [hop.strip() for name, value in scope.get("headers", ()) if name == b"x-forwarded-for"
+            for hop in value.decode("latin-1").split(",")]
+    # Fewer entries than proxies: the request skipped part of the chain, so key on the peer.
+    return hops[-proxy_hops] if len(hops) >= proxy_hops and hops[-proxy_hops] else peer
+
+class TokenBuckets:
+    """Per-client token buckets in an LRU (least recently seen clients are dropped first)."""
+    def __init__(self, rate: float, burst: float, max_clients: int):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()  # key -> [tokens, updated_at]
+
+    def take(self, key: str, cost: float) -> float:
+        """Takes `cost` tokens; returns 0 on success, else seconds until they would be available."""
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [self.burst, now]
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        cost = min(cost, self.burst)
+        if bucket[0] >= cost:
+            bucket[0] -= cost
+            return 0.0
+        return (cost - bucket[0]) / self.rate
+
+class _Waiter:
+    __slots__ = ("cls", "enqueued", "future")
+
+    def __init__(self, cls: str, future: asyncio.Future):
+        self.cls = cls
+        self.enqueued = time.monotonic()
+        self.future = future
+
+class AdmissionController:
+    def __init__(self, max_concurrent: int, heavy_share: float, queue_target_s: float, max_wait_s: float,
+                 max_queue: int, buckets: Optional[TokenBuckets], heavy_cost: float):
+        self.max_concurrent = max(1, max_concurrent)
+        self.heavy_max = max(1, int(self.max_concurrent * heavy_share))
+        self.queue_target_s = queue_target_s
+        self.max_wait_s = max_wait_s
+        self.max_queue = max_queue
+        self.buckets = buckets
+        self.heavy_cost = heavy_cost
+        self.in_use = {"light": 0, "heavy": 0}
+        self.queues: Dict[str, deque] = {"light": deque(), "heavy": deque()}
+        self.service_s = {"light": 0.0, "heavy": 0.0}   # EWMA of time a slot is held
+        self.decisions: Dict[tuple, int] = {}          # (class, decision) -> count
+        self.wait = {cls: Histogram() for cls in ("light", "heavy")}
+
+    def _count(self, cls: str, decision: str) -> None:
+        key = (cls, decision)
+        self.decisions[key] = self.decisions.get(key, 0) + 1
+
+    def _can_run(self, cls: str) -> bool:
+        if self.in_use["light"] + self.in_use["heavy"] >= self.max_concurrent:
+            return False
+        return cls == "light" or self.in_use["heavy"] < self.heavy_max
+
+    def _oldest_wait(self, cls: str, now: float) -> float:
+        queue = self.queues[cls]
+        while queue and queue[0].future.done():  # expired or disconnected
+            queue.popleft()
+        return now - queue[0].enqueued if queue else 0.0
+
+    def _expected_wait(self, cls: str) -> float:
+        """Rough wait of a new arrival: requests served ahead of it x mean service time / slots."""
+        ahead = len(self.queues["light"]) + (len(self.queues["heavy"]) if cls == "heavy" else 0)
+        slots = self.heavy_max if cls == "heavy" else self.max_concurrent
+        return (ahead + 1) * self.service_s[cls] / slots
+
+    def _dispatch(self) -> None:
+        """Hands free slots to waiters: light first, then heavy while under its share."""
+        for cls in ("light", "heavy"):
+            queue = self.queues[cls]
+            while queue and self._can_run(cls):
+                waiter = queue.popleft()
+                if not waiter.future.done():
+                    self.in_use[cls] += 1
+                    waiter.future.set_result(True)
+
+    def release(self, cls: str, service_s: Optional[float] = None) -> None:
+        self.in_use[cls] -= 1
+        if service_s is not None:
+            prev = self.service_s[cls]
+            self.service_s[cls] = service_s if not prev else prev + 0.1 * (service_s - prev)  # EWMA
+        self._dispatch()
+
+    def check_rate(self, cls: str, client: Optional[str]) -> float:
+        """Seconds the client has to wait (0 = allowed); client None is exempt."""
+        if self.buckets is None or cls == "critical" or client is None:
+            return 0.0
+        delay = self.buckets.take(client, self.heavy_cost if cls == "heavy" else 1.0)
+        if delay:
+            self._count(cls, "rate_limited")
+        return delay
+
+    def try_acquire(self, cls: str) -> bool:
+        """Takes a free slot without queueing (the common, non-overloaded case)."""
+        if self.queues[cls] or not self._can_run(cls):
+            return False
+        self.in_use[cls] += 1
+        self.wait[cls].observe(0.0)
+        self._count(cls, "admitted")
+        return True
+
+    async def acquire(self, cls: str) -> Optional[str]:
+        """Queues for a slot after try_acquire failed; returns None once admitted, or the shed decision."""
+        now = time.monotonic()
+        if sum(len(q) for q in self.queues.values()) >= self.max_queue:
+            self._count(cls, "shed_queue_full")
+            return "shed_queue_full"
+        oldest = max(self._oldest_wait(c, now) for c in self.queues) if cls == "heavy" else self._oldest_wait(cls, now)
+        if oldest > self.queue_target_s or self._expected_wait(cls) > self.max_wait_s:
+            self._count(cls, "shed_queue_delay")
+            return "shed_queue_delay"
+
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(cls, loop.create_future())
+        self.queues[cls].append(waiter)
+        self._dispatch()  # a request of the other class may have left a slot this one can use
+        timer = loop.call_later(self.max_wait_s, lambda: waiter.future.done() or waiter.future.set_result(False))
+        try:
+            granted = await waiter.future
+        except asyncio.CancelledError:  # client went away while queued
+            if waiter.future.done() and not waiter.future.cancelled() and waiter.future.result():
+                self.release(cls)
+            raise
+        finally:
+            timer.cancel()
+            try:  # timed out or went away: stop counting against max_queue now (granted ones were popped)
+                self.queues[cls].remove(waiter)
+            except ValueError:
+                pass
+        if not granted:
+            self._count(cls, "shed_timeout")
+            return "shed_timeout"
+        self.wait[cls].observe(time.monotonic() - waiter.enqueued)
+        self._count(cls, "admitted")
+        return None
+
+    def retry_after_s(self) -> int:
+        return max(1, ceil(self.max_wait_s))
+
+    def render(self) -> List[str]:
+        lines = [
+            "# HELP admission_requests_total Admission decisions by priority class.",
+            "# TYPE admission_requests_total counter",
+        ]
+        for (cls, decision), n in sorted(self.decisions.items()):
+            lines.append(f"admission_requests_total{_label_str({'class': cls, 'decision': decision})} {n}")
+        lines += [
+            "# HELP admission_queue_wait_seconds Time admitted requests spent queued, by class.",
+            "# TYPE admission_queue_wait_seconds histogram",
+            *_histogram_lines("admission_queue_wait_seconds", (({"class": c}, h) for c, h in self.wait.items())),
+            "# HELP admission_in_use Slots held by running requests, by class.",
+            "# TYPE admission_in_use gauge",
+            *(f"admission_in_use{_label_str({'class': c})} {n}" for c, n in self.in_use.items()),
+            "# HELP admission_queued Requests waiting for a slot, by class.",
+            "# TYPE admission_queued gauge",
+            *(f"admission_queued{_label_str({'class': c})} {len(q)}" for c, q in self.queues.items()),
+            "# HELP admission_slots Concurrent request slots.",
+            "# TYPE admission_slots gauge",
+            f"admission_slots {self.max_concurrent}",
+            "# HELP admission_heavy_slots Slots heavy requests may hold at once.",
+            "# TYPE admission_heavy_slots gauge",
+            f"admission_heavy_slots {self.heavy_max}",
+        ]
+        return lines
+
+admission = AdmissionController(
+    ADMISSION_MAX_CONCURRENT, ADMISSION_HEAVY_SHARE, ADMISSION_QUEUE_TARGET_MS / 1000, ADMISSION_MAX_WAIT_MS / 1000,
+    ADMISSION_MAX_QUEUE,
+    TokenBuckets(ADMISSION_CLIENT_RATE, ADMISSION_CLIENT_BURST, ADMISSION_MAX_CLIENTS) if ADMISSION_CLIENT_RATE > 0 else None,
+    ADMISSION_HEAVY_COST,
 )
 
+async def _reject(send, status: int, detail: str, retry_after_s: int) -> None:
+    body = json.dumps({"detail": detail}).encode()
+    await send({"type": "http.response.start", "status": status, "headers": [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode()),
+        (b"retry-after", str(retry_after_s).encode()),
+    ]})
+    await send({"type": "http.response.body", "body": body})
+
+class AdmissionMiddleware:
+    """Pure ASGI middleware applying `admission` to HTTP requests (WebSockets pass through)."""
+    def __init__(self, app, controller: AdmissionController = admission, proxy_hops: int = ADMISSION_PROXY_HOPS):
+        self.app = app
+        self.controller = controller
+        self.proxy_hops = proxy_hops
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        cls = admission_class(scope["path"])
+        if cls == "critical":
+            return await self.app(scope, receive, send)
+        delay = self.controller.check_rate(cls, _client_key(scope, self.proxy_hops))
+        if delay:
+            return await _reject(send, 429, "Rate limit exceeded", max(1, ceil(delay)))
+        if cls == "stream":
+            return await self.app(scope, receive, send)
+        if not self.controller.try_acquire(cls) and await self.controller.acquire(cls) is not None:
+            return await _reject(send, 503, "Server overloaded, retry later", self.controller.retry_after_s())
+        start = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(cls, time.monotonic() - start)
+
+# ------------------------------------------------------------------------------
+# Precompressed responses (pages & static assets)
+# ------------------------------------------------------------------------------
+# Pages and assets are compressed once (gzip, and brotli when installed), kept
+# in memory and served by Accept-Encoding with a strong per-encoding ETag.
+# Content-hashed asset names (Vite's assets/index-3f9a1c2b.js) are immutable.
+PRERENDER_PAGES = os.getenv("PRERENDER_PAGES", "1" if os.getenv("ENV") == "production" else "0") == "1"
+STATIC_COMPRESS_MAX_FILE_BYTES = int(os.getenv("STATIC_COMPRESS_MAX_FILE_BYTES", str(4 * 1024 * 1024)))
+STATIC_COMPRESS_CACHE_BYTES = int(os.getenv("STATIC_COMPRESS_CACHE_BYTES", str(32 * 1024 * 1024)))
+_MIN_COMPRESS_BYTES = 512
+_COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "application/xml",
+                       "application/manifest+json", "image/svg+xml", "application/wasm")
+_HASHED_ASSET_RE = re.compile(r"[.-][A-Za-z0-9_]{8,}\.(?:m?js|css|woff2?|ttf|png|jpe?g|gif|svg|webp|avif|ico|wasm|map)$")
+_IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+_REVALIDATE_CACHE_CONTROL = "public, no-cache"
+_ENCODING_SUFFIX = {"br": "br", "gzip": "gz"}
+
+class CompressedBody:
+    """A response body with its identity, gzip and (optional) brotli variants."""
+    __slots__ = ("variants", "etag", "media_type")
+
+    def __init__(self, body: bytes, media_type: str, etag: Optional[str] = None):
+        self.media_type = media_type
+        self.etag = (etag or hashlib.sha256(body).hexdigest()[:32]).strip('"')
+        self.variants = {"identity": body}
+        if len(body) >= _MIN_COMPRESS_BYTES:
+            gz = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(gz) < len(body):
+                self.variants["gzip"] = gz
+            if brotli is not None:
+                br = brotli.compress(body, quality=11)
+                if len(br) < len(body):
+                    self.variants["br"] = br
+
+    def etag_for(self, encoding: str) -> str:
+        suffix = _ENCODING_SUFFIX.get(encoding)
+        return f'"{self.etag}-{suffix}"' if suffix else f'"{self.etag}"'
+
+    @property
+    def nbytes(self) -> int:
+        return sum(len(v) for v in self.variants.values())
+
+def _pick_encoding(accept_encoding: str, available) -> str:
+    """Best of br > gzip > identity that the client accepts (q > 0) and we have."""
+    q: Dict[str, float] = {}
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        weight = 1.0
+        if params.strip().startswith("q="):
+            try:
+                weight = float(params.strip()[2:])
+            except ValueError:
+                weight = 0.0
+        q[name.strip()] = weight
+    for enc in ("br", "gzip"):
+        if enc in available and q.get(enc, q.get("*", 0.0)) > 0:
+            return enc
+    return "identity"
+
+def compressed_response(request: Request, asset: CompressedBody, cache_control: str) -> Response:
+    enc = _pick_encoding(request.headers.get("accept-encoding", ""), asset.variants)
+    etag = asset.etag_for(enc)
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    if enc != "identity":
+        headers["Content-Encoding"] = enc
+    return Response(asset.variants[enc], media_type=asset.media_type, headers=headers)
+
+class PrecompressedStaticFiles(StaticFiles):
+    """StaticFiles with cached gzip/brotli variants and Cache-Control headers."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._compressed: Dict[tuple, CompressedBody] = {}
+        self._compressed_bytes = 0
+
+    async def get_response(self, path: str, scope) -> Response:
+        response = await super().get_response(path, scope)
+        cache_control = _IMMUTABLE_CACHE_CONTROL if _HASHED_ASSET_RE.search(path) else _REVALIDATE_CACHE_CONTROL
+        if response.status_code in (200, 304):
+            response.headers["Cache-Control"] = cache_control
+        if not isinstance(response, FileResponse) or response.status_code != 200:
+            return response
+
+        request = Request(scope)
+        size = int(response.headers.get("content-length", 0))
+        media_type = response.media_type or ""
+        if ("range" in request.headers or not media_type.startswith(_COMPRESSIBLE_TYPES)
+                or not _MIN_COMPRESS_BYTES <= size <= STATIC_COMPRESS_MAX_FILE_BYTES
+                or _pick_encoding(request.headers.get("accept-encoding", ""), ("br", "gzip")) == "identity"):
+            return response
+
+        key = (str(response.path), response.headers.get("etag"))
+        asset = self._compressed.get(key)
+        if asset is None:
+            body = await run_in_threadpool(Path(response.path).read_bytes)
+            asset = await run_in_threadpool(CompressedBody, body, response.headers["content-type"], key[1])
+            if self._compressed_bytes + asset.nbytes <= STATIC_COMPRESS_CACHE_BYTES:
+                self._compressed[key] = asset
+                self._compressed_bytes += asset.nbytes
+        return compressed_response(request, asset, cache_control)
+
+class _LazyASGIApp:
+    """ASGI app built by `factory` on first use; a factory returning None means 404."""
+    def __init__(self, factory: Callable[[], Any]):
+        self._factory = factory
+        self._app = None
+        self._lock = threading.Lock()
+
+    def resolve(self):
+        if self._app is None:
+            with self._lock:
+                if self._app is None:
+                    self._app = self._factory() or PlainTextResponse("Not Found", status_code=404)
+        return self._app
+
+    async def __call__(self, scope, receive, send):
+        await self.resolve()(scope, receive, send)
+
 # Serve /static (if present)
 static_dir = BASE_DIR / "static"
-if static_dir.is_dir():
-    app.mount("/static", StaticFiles(directory=str(static_dir)), name="static")
+_static_app = _LazyASGIApp(
+    lambda: PrecompressedStaticFiles(directory=str(static_dir)) if static_dir.is_dir() else None
+)
 
 # Templates
-templates = Jinja2Templates(directory=str(BASE_DIR / "templates"))
+@functools.lru_cache(maxsize=None)
+def get_templates():
+    from fastapi.templating import Jinja2Templates
+    return Jinja2Templates(directory=str(BASE_DIR / "templates"))
 
 
 
 # ------------------------------------------------------------------------------
 # Health
 # ------------------------------------------------------------------------------
-@app.get("/api/health")
+@router.get("/api/health")
 def health():
     return {"ok": True}
 
+# ------------------------------------------------------------------------------
+# Result cache (content-addressed, LRU + TTL, ETag / 304)
+# ------------------------------------------------------------------------------
+# Users re-run the same reaction constantly (example payload, notebook re-opens,
+# reloads). Compute endpoints decorated with @cached_result key their rendered
+# JSON by a hash of the *validated* payload, so key order, whitespace and omitted
+# defaults do not matter. The key doubles as a strong ETag: a matching
+# If-None-Match gets 304 without touching the cache. Identical requests that
+# arrive while a result is being computed wait for that computation instead of
+# repeating it. Bump IMPACT_FORMULA_VERSION whenever a formula changes so old
+# ETags and cache entries stop matching.
+IMPACT_FORMULA_VERSION = "1"
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "4096"))
+RESULT_CACHE_TTL_S = float(os.getenv("RESULT_CACHE_TTL_S", "600"))
+_CACHE_ENTRY_OVERHEAD_BYTES = 200  # key, tuple and OrderedDict node, roughly
+
+class ResultCache:
+    """Thread-safe LRU+TTL cache of rendered response bodies with request coalescing."""
+    def __init__(self, max_bytes: int, max_entries: int, ttl_s: float):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, body)
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.not_modified = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0 and self.max_entries > 0
+
+    def _size(self, key: str, body: bytes) -> int:
+        return len(key) + len(body) + _CACHE_ENTRY_OVERHEAD_BYTES
+
+    def _drop(self, key: str) -> None:
+        _, body = self._data.pop(key)
+        self.bytes -= self._size(key, body)
+
+    def _lookup(self, key: str) -> Optional[bytes]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            self._drop(key)
+            self.expirations += 1
+            return None
+        self._data.move_to_end(key)
+        return entry[1]
+
+    def _store(self, key: str, body: bytes) -> None:
+        size = self._size(key, body)
+        if size > self.max_bytes:
+            return
+        if key in self._data:
+            self._drop(key)
+        self._data[key] = (time.monotonic() + self.ttl_s, body)
+        self.bytes += size
+        while self.bytes > self.max_bytes or len(self._data) > self.max_entries:
+            self._drop(next(iter(self._data)))
+            self.evictions += 1
+
+    def get_or_compute(self, key: str, compute: Callable[[], bytes]) -> tuple:
+        """Returns (body, "HIT" | "MISS" | "COALESCED"). Exceptions from compute are not cached."""
+        if not self.enabled:
+            return compute(), "MISS"
+        with self._lock:
+            body = self._lookup(key)
+            if body is not None:
+                self.hits += 1
+                return body, "HIT"
+            fut = self._inflight.get(key)
+            leader = fut is None
+            if leader:
+                self.misses += 1
+                fut = self._inflight[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return fut.result(), "COALESCED"
+        try:
+            body = compute()
+        except BaseException as e:
+            with self._lock:
+                del self._inflight[key]
+            fut.set_exception(e)
+            raise
+        with self._lock:
+            del self._inflight[key]
+            self._store(key, body)
+        fut.set_result(body)
+        return body, "MISS"
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._data),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "max_entries": self.max_entries,
+                "ttl_s": self.ttl_s,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "not_modified": self.not_modified,
+            }
+
+result_cache = ResultCache(RESULT_CACHE_MAX_BYTES, RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_TTL_S)
+
+def _payload_key(route: str, payload: BaseModel) -> str:
+    canonical = json.dumps(payload.model_dump(mode="json"), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(f"{IMPACT_FORMULA_VERSION}|{route}|{canonical}".encode()).hexdigest()[:32]
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+def _render_json(model, result: Any) -> bytes:
+    # Same validation and encoding FastAPI applies through response_model + JSONResponse.
+    content = model.model_validate(result).model_dump(mode="json")
+    return _json_encoder.encode(content).encode("utf-8")
+
+def _encode_json(result: Any) -> bytes:
+    # Fast codec: the handler already returned response-model-shaped, JSON-native data.
+    if isinstance(result, BaseModel):
+        result = result.model_dump(mode="json")
+    return _json_encoder.encode(result).encode("utf-8")
+
+def cached_result(model):
+    """Decorator for sync `def handler(payload)` endpoints: adds result caching and ETag/304.
+
+    `model` is the endpoint's response_model; it is used to render the cached body.
+    Handlers must return dicts already in response-model shape (field order,
+    floats as floats) so the fast codec path can skip re-validating them.
+    """
+    def decorator(fn):
+        route = fn.__qualname__
+        sig = inspect.signature(fn)
+        payload_model = next(iter(sig.parameters.values())).annotation
+
+        def respond(payload, if_none_match: Optional[str], render: Callable[[Any], bytes]) -> Response:
+            key = _payload_key(route, payload)
+            etag = f'"{key}"'
+            if _etag_matches(if_none_match, etag):
+                result_cache.not_modified += 1
+                return Response(status_code=304, headers={"ETag": etag})
+            def compute() -> bytes:
+                result = fn(payload)
+                started = time.perf_counter()
+                body = render(result)
+                _add_stage_time("serialize", time.perf_counter() - started)
+                return body
+
+            body, status = result_cache.get_or_compute(key, compute)
+            return Response(body, media_type="application/json", headers={"ETag": etag, "X-Cache": status})
+
+        @functools.wraps(fn)
+        def wrapper(payload, request: Request):
+            return respond(payload, request.headers.get("if-none-match"), functools.partial(_render_json, model))
+
+        request_param = inspect.Parameter("request", inspect.Parameter.KEYWORD_ONLY, annotation=Request)
+        wrapper.__signature__ = sig.replace(parameters=[*sig.parameters.values(), request_param])
+        wrapper.fast_codec = (
+            payload_model.__pydantic_validator__,
+            lambda payload, if_none_match: respond(payload, if_none_match, _encode_json),
+        )
+        return wrapper
+    return decorator
+
+@router.get("/api/cache/stats")
+def cache_stats():
+    return result_cache.stats()
+
 # ------------------------------------------------------------------------------
 # Atom Economy API
 # ------------------------------------------------------------------------------
@@ -56,7 +958,8 @@ class AtomEconomyIn(BaseModel):
 class AtomEconomyOut(BaseModel):
     atom_economy_pct: float
 
-@app.post("/api/atom-economy", response_model=AtomEconomyOut)
+@router.post("/api/atom-economy", response_model=AtomEconomyOut)
+@cached_result(AtomEconomyOut)
 def calc_atom_economy(payload: AtomEconomyIn):
     if payload.mw_product > payload.mw_reactants_total:
         raise HTTPException(status_code=400, detail="Product MW cannot exceed sum of reactants MW.")
@@ -73,7 +976,8 @@ class EFactorIn(BaseModel):
 class EFactorOut(BaseModel):
     e_factor: float
 
-@app.post("/api/e-factor", response_model=EFactorOut)
+@router.post("/api/e-factor", response_model=EFactorOut)
+@cached_result(EFactorOut)
 def calc_e_factor(payload: EFactorIn):
     if payload.total_mass_in < payload.product_mass:
         raise HTTPException(status_code=400, detail="Total mass in must be ≥ product mass.")
@@ -87,7 +991,8 @@ class EFactorDirectIn(BaseModel):
 class EFactorDirectOut(BaseModel):
     e_factor: float
 
-@app.post("/api/e-factor-direct", response_model=EFactorDirectOut)
+@router.post("/api/e-factor-direct", response_model=EFactorDirectOut)
+@cached_result(EFactorDirectOut)
 def calc_e_factor_direct(payload: EFactorDirectIn):
     e = payload.waste_mass / payload.product_mass
     return {"e_factor": round(e, 4)}
@@ -102,7 +1007,8 @@ class PMIIn(BaseModel):
 class PMIOut(BaseModel):
     pmi: float
 
-@app.post("/api/pmi", response_model=PMIOut)
+@router.post("/api/pmi", response_model=PMIOut)
+@cached_result(PMIOut)
 def calc_pmi(payload: PMIIn):
     pmi = payload.total_mass_in / payload.product_mass
     return {"pmi": round(pmi, 4)}
@@ -118,7 +1024,8 @@ class WaterImpactOut(BaseModel):
     liters_per_g: float
     liters_per_kg: float
 
-@app.post("/api/water-impact", response_model=WaterImpactOut)
+@router.post("/api/water-impact", response_model=WaterImpactOut)
+@cached_result(WaterImpactOut)
 def calc_water_impact(payload: WaterImpactIn):
     lpg = payload.water_liters / payload.product_mass_g
     lpk = lpg * 1000.0
@@ -135,7 +1042,8 @@ class EnergyImpactOut(BaseModel):
     kwh_per_g: float
     kwh_per_kg: float
 
-@app.post("/api/energy-impact", response_model=EnergyImpactOut)
+@router.post("/api/energy-impact", response_model=EnergyImpactOut)
+@cached_result(EnergyImpactOut)
 def calc_energy_impact(payload: EnergyImpactIn):
     kwhpg = payload.kwh / payload.product_mass_g
     kwhpk = kwhpg * 1000.0
@@ -149,7 +1057,8 @@ class RMEIn(BaseModel):
 class RMEOut(BaseModel):
     rme_pct: float
 
-@app.post("/api/rme", response_model=RMEOut)
+@router.post("/api/rme", response_model=RMEOut)
+@cached_result(RMEOut)
 def calc_rme(payload: RMEIn):
     total_reactants = sum(m for m in payload.reactant_masses_g if m is not None)
     if total_reactants <= 0:
@@ -170,7 +1079,8 @@ class CarbonEfficiencyIn(BaseModel):
 class CarbonEfficiencyOut(BaseModel):
     carbon_efficiency_pct: float
 
-@app.post("/api/carbon-efficiency", response_model=CarbonEfficiencyOut)
+@router.post("/api/carbon-efficiency", response_model=CarbonEfficiencyOut)
+@cached_result(CarbonEfficiencyOut)
 def calc_carbon_efficiency(payload: CarbonEfficiencyIn):
     nP = payload.product.mass_g / payload.product.mw
     totalC_in = sum((r.mass_g / r.mw) * r.carbon_atoms for r in payload.reactants)
@@ -197,7 +1107,8 @@ class StoichiometricFactorOut(BaseModel):
     sf_overall: float
     details: List[SFDetail]
 
-@app.post("/api/stoichiometric-factor", response_model=StoichiometricFactorOut)
+@router.post("/api/stoichiometric-factor", response_model=StoichiometricFactorOut)
+@cached_result(StoichiometricFactorOut)
 def calc_stoichiometric_factor(payload: StoichiometricFactorIn):
     used = sum(s.eq_used for s in payload.species)
     req  = sum(s.eq_stoich for s in payload.species)
@@ -208,43 +1119,554 @@ def calc_stoichiometric_factor(payload: StoichiometricFactorIn):
                for i, s in enumerate(payload.species)]
     return {"sf_overall": round(overall, 4), "details": details}
 
+# ------------------------------------------------------------------------------
+# Molecules (SMILES / molecular formula -> MW, composition, carbon count)
+# ------------------------------------------------------------------------------
+# Pure-Python parsers, no external services. Results are memoized process-wide
+# (solvents and common reagents repeat constantly), and Product / Reactant use
+# them to fill in a missing mw or carbon_atoms from their smiles.
+MOLECULE_CACHE_SIZE = int(os.getenv("MOLECULE_CACHE_SIZE", "4096"))
+MOLECULE_RESOLVE_MAX_ITEMS = int(os.getenv("MOLECULE_RESOLVE_MAX_ITEMS", "1000"))
+
+# Standard atomic weights (IUPAC, abridged); mass number of the longest-lived
+# isotope for elements without a standard weight.
+_ATOMIC_WEIGHTS = {
+    "H": 1.008, "He": 4.0026, "Li": 6.94, "Be": 9.0122, "B": 10.81, "C": 12.011, "N": 14.007,
+    "O": 15.999, "F": 18.998, "Ne": 20.180, "Na": 22.990, "Mg": 24.305, "Al": 26.982, "Si": 28.085,
+    "P": 30.974, "S": 32.06, "Cl": 35.45, "Ar": 39.95, "K": 39.098, "Ca": 40.078, "Sc": 44.956,
+    "Ti": 47.867, "V": 50.942, "Cr": 51.996, "Mn": 54.938, "Fe": 55.845, "Co": 58.933, "Ni": 58.693,
+    "Cu": 63.546, "Zn": 65.38, "Ga": 69.723, "Ge": 72.630, "As": 74.922, "Se": 78.971, "Br": 79.904,
+    "Kr": 83.798, "Rb": 85.468, "Sr": 87.62, "Y": 88.906, "Zr": 91.224, "Nb": 92.906, "Mo": 95.95,
+    "Tc": 98.0, "Ru": 101.07, "Rh": 102.91, "Pd": 106.42, "Ag": 107.87, "Cd": 112.41, "In": 114.82,
+    "Sn": 118.71, "Sb": 121.76, "Te": 127.60, "I": 126.90, "Xe": 131.29, "Cs": 132.91, "Ba": 137.33,
+    "La": 138.91, "Ce": 140.12, "Pr": 140.91, "Nd": 144.24, "Pm": 145.0, "Sm": 150.36, "Eu": 151.96,
+    "Gd": 157.25, "Tb": 158.93, "Dy": 162.50, "Ho": 164.93, "Er": 167.26, "Tm": 168.93, "Yb": 173.05,
+    "Lu": 174.97, "Hf": 178.49, "Ta": 180.95, "W": 183.84, "Re": 186.21, "Os": 190.23, "Ir": 192.22,
+    "Pt": 195.08, "Au": 196.97, "Hg": 200.59, "Tl": 204.38, "Pb": 207.2, "Bi": 208.98, "Po": 209.0,
+    "At": 210.0, "Rn": 222.0, "Fr": 223.0, "Ra": 226.0, "Ac": 227.0, "Th": 232.04, "Pa": 231.04,
+    "U": 238.03, "Np": 237.0, "Pu": 244.0,
+}
+_ISOTOPE_MASSES = {
+    ("H", 2): 2.0141, ("H", 3): 3.0160, ("C", 13): 13.0034, ("C", 14): 14.0032,
+    ("N", 15): 15.0001, ("O", 17): 16.9991, ("O", 18): 17.9992,
+}
+# Normal valences of the SMILES organic subset, used for implicit hydrogens.
+_ORGANIC_VALENCES = {
+    "B": (3,), "C": (4,), "N": (3, 5), "O": (2,), "P": (3, 5), "S": (2, 4, 6),
+    "F": (1,), "Cl": (1,), "Br": (1,), "I": (1,),
+}
+_BOND_ORDERS = {"-": 1, "=": 2, "#": 3, "$": 4, ":": 1, "/": 1, "\\": 1}
+_BRACKET_ATOM_RE = re.compile(
+    r"(?P<isotope>\d+)?(?P<symbol>se|as|[A-Z][a-z]?|[bcnops]|\*)"
+    r"(?P<chiral>@@?(?:TH[12]|AL[12]|SP[123]|TB\d\d?|OH\d\d?)?)?"
+    r"(?P<hcount>H\d*)?(?P<charge>\++\d*|-+\d*)?(?::\d+)?$"
+)
+_FORMULA_TOKEN_RE = re.compile(r"([A-Z][a-z]?)(\d*)|([(\[])|([)\]])(\d*)")
+
+class MolecularProperties(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
+    formula: str
+    mw: float
+    composition: Dict[str, int]
+    carbon_atoms: int
+    charge: int = 0
+
+def _hill_formula(counts: Dict[str, int]) -> str:
+    if "C" in counts:
+        order = ["C"] + (["H"] if "H" in counts else []) + sorted(k for k in counts if k not in ("C", "H"))
+    else:
+        order = sorted(counts)
+    return "".join(f"{el}{counts[el] if counts[el] != 1 else ''}" for el in order)
+
+def _properties(counts: Dict[str, int], mass: float, charge: int = 0) -> MolecularProperties:
+    counts = {el: n for el, n in counts.items() if n}
+    if not counts:
+        raise ValueError("no atoms")
+    return MolecularProperties(
+        formula=_hill_formula(counts),
+        mw=round(mass, 4),
+        composition=dict(sorted(counts.items())),
+        carbon_atoms=counts.get("C", 0),
+        charge=charge,
+    )
+
+def _parse_charge(text: Optional[str]) -> int:
+    if not text:
+        return 0
+    sign = 1 if text[0] == "+" else -1
+    digits = text.lstrip("+-")
+    return sign * (int(digits) if digits else len(text))
+
+@functools.lru_cache(maxsize=MOLECULE_CACHE_SIZE)
+def parse_smiles(smiles: str) -> MolecularProperties:
+    """MW, elemental composition and carbon count of a SMILES string.
+
+    Supports the OpenSMILES organic subset with implicit hydrogens, bracket
+    atoms (isotope, H count, charge, chirality), branches, ring closures
+    (digits and %nn), aromatic atoms and disconnected components ('.').
+    Raises ValueError on anything it cannot interpret.
+    """
+    s = smiles.strip()
+    if not s:
+        raise ValueError("empty SMILES")
+
+    # Per atom: [symbol, aromatic, explicit_h (None = implicit), bond_order_sum, isotope, charge]
+    atoms: List[list] = []
+    prev: Optional[int] = None
+    branches: List[Optional[int]] = []
+    rings: Dict[str, tuple] = {}
+    bond: Optional[int] = None
+    i = 0
+
+    def add_atom(symbol, aromatic, explicit_h, isotope, charge):
+        nonlocal prev, bond
+        atoms.append([symbol, aromatic, explicit_h, 0, isotope, charge])
+        cur = len(atoms) - 1
+        if prev is not None:
+            order = bond or 1
+            atoms[prev][3] += order
+            atoms[cur][3] += order
+        prev, bond = cur, None
+
+    while i < len(s):
+        ch = s[i]
+        if ch == "[":
+            end = s.find("]", i)
+            if end < 0:
+                raise ValueError(f"unclosed '[' at {i}")
+            m = _BRACKET_ATOM_RE.match(s[i + 1:end])
+            if not m:
+                raise ValueError(f"bad bracket atom '{s[i:end + 1]}'")
+            sym = m.group("symbol")
+            if sym == "*":
+                raise ValueError("wildcard atom '*' has no mass")
+            aromatic = sym.islower()
+            sym = sym.capitalize()
+            if sym not in _ATOMIC_WEIGHTS:
+                raise ValueError(f"unknown element '{sym}'")
+            h = m.group("hcount")
+            add_atom(sym, aromatic, int(h[1:] or 1) if h else 0,
+                     int(m.group("isotope")) if m.group("isotope") else None, _parse_charge(m.group("charge")))
+            i = end + 1
+        elif s.startswith(("Cl", "Br"), i):
+            add_atom(s[i:i + 2], False, None, None, 0)
+            i += 2
+        elif ch in "BCNOPSFI":
+            add_atom(ch, False, None, None, 0)
+            i += 1
+        elif ch in "bcnops":
+            add_atom(ch.upper(), True, None, None, 0)
+            i += 1
+        elif ch in _BOND_ORDERS:
+            bond = _BOND_ORDERS[ch]
+            i += 1
+        elif ch == "(":
+            if prev is None:
+                raise ValueError(f"branch without atom at {i}")
+            branches.append(prev)
+            i += 1
+        elif ch == ")":
+            if not branches:
+                raise ValueError(f"unbalanced ')' at {i}")
+            prev = branches.pop()
+            i += 1
+        elif ch == ".":
+            prev, bond = None, None
+            i += 1
+        elif ch.isdigit() or ch == "%":
+            if ch == "%":
+                label, i = s[i + 1:i + 3], i + 3
+                if len(label) != 2 or not label.isdigit():
+                    raise ValueError("ring label after '%' must be two digits")
+            else:
+                label, i = ch, i + 1
+            if prev is None:
+                raise ValueError(f"ring closure {label} without atom")
+            if label in rings:
+                other, open_bond = rings.pop(label)
+                order = bond or open_bond or 1
+                atoms[other][3] += order
+                atoms[prev][3] += order
+                bond = None
+            else:
+                rings[label] = (prev, bond)
+                bond = None
+        else:
+            raise ValueError(f"unexpected character '{ch}' at {i}")
+
+    if branches:
+        raise ValueError("unbalanced '('")
+    if rings:
+        raise ValueError(f"unclosed ring(s): {', '.join(sorted(rings))}")
+    if not atoms:
+        raise ValueError("no atoms")
+
+    counts: Dict[str, int] = {}
+    mass = 0.0
+    charge = 0
+    for sym, aromatic, explicit_h, bond_sum, isotope, atom_charge in atoms:
+        if explicit_h is None:
+            valences = _ORGANIC_VALENCES[sym]
+            used = bond_sum + (1 if aromatic else 0)
+            if aromatic:
+                explicit_h = max(0, valences[0] - used)
+            else:
+                explicit_h = next((v - used for v in valences if v >= used), 0)
+        counts[sym] = counts.get(sym, 0) + 1
+        counts["H"] = counts.get("H", 0) + explicit_h
+        mass += _ISOTOPE_MASSES.get((sym, isotope), float(isotope)) if isotope else _ATOMIC_WEIGHTS[sym]
+        mass += explicit_h * _ATOMIC_WEIGHTS["H"]
+        charge += atom_charge
+    return _properties(counts, mass, charge)
+
+@functools.lru_cache(maxsize=MOLECULE_CACHE_SIZE)
+def parse_formula(formula: str) -> MolecularProperties:
+    """MW and composition of a molecular formula such as 'C9H8O4', 'Ca(OH)2' or 'CuSO4·5H2O'."""
+    text = formula.strip().replace(" ", "")
+    if not text:
+        raise ValueError("empty formula")
+    total: Dict[str, int] = {}
+    for part in re.split(r"[·.*]", text):
+        coef_match = re.match(r"\d+", part)
+        coef = int(coef_match.group()) if coef_match else 1
+        body = part[coef_match.end():] if coef_match else part
+        stack: List[Dict[str, int]] = [{}]
+        pos = 0
+        while pos < len(body):
+            m = _FORMULA_TOKEN_RE.match(body, pos)
+            if not m:
+                raise ValueError(f"unexpected character '{body[pos]}' in formula")
+            el, n, opening, closing, group_n = m.groups()
+            if el:
+                if el not in _ATOMIC_WEIGHTS:
+                    raise ValueError(f"unknown element '{el}'")
+                stack[-1][el] = stack[-1].get(el, 0) + int(n or 1)
+            elif opening:
+                stack.append({})
+            else:
+                if len(stack) == 1:
+                    raise ValueError("unbalanced ')' in formula")
+                group = stack.pop()
+                for k, v in group.items():
+                    stack[-1][k] = stack[-1].get(k, 0) + v * int(group_n or 1)
+            pos = m.end()
+        if len(stack) != 1:
+            raise ValueError("unbalanced '(' in formula")
+        for k, v in stack[0].items():
+            total[k] = total.get(k, 0) + v * coef
+    mass = sum(_ATOMIC_WEIGHTS[el] * n for el, n in total.items())
+    return _properties(total, mass)
+
+def _fill_from_smiles(m):
+    """Model validator: derive a missing mw / carbon_atoms from smiles."""
+    if m.smiles and (m.mw is None or m.carbon_atoms is None):
+        try:
+            props = parse_smiles(m.smiles)
+        except ValueError as e:
+            if m.mw is None:
+                raise ValueError(f"Could not derive mw from smiles: {e}")
+            return m
+        if m.mw is None:
+            m.mw = props.mw
+        if m.carbon_atoms is None:
+            m.carbon_atoms = props.carbon_atoms
+    if m.mw is None:
+        raise ValueError("Provide mw or a parseable smiles.")
+    return m
+
+class MoleculeResolveIn(BaseModel):
+    smiles: List[str] = Field(default_factory=list)
+    formulas: List[str] = Field(default_factory=list)
+
+class MoleculeResult(BaseModel):
+    input: str
+    ok: bool
+    properties: Optional[MolecularProperties] = None
+    error: Optional[str] = None
+
+class MoleculeResolveOut(BaseModel):
+    smiles: List[MoleculeResult]
+    formulas: List[MoleculeResult]
+    cache: Dict[str, Any]
+
+def _resolve_molecules(texts: List[str], parser) -> List[Dict[str, Any]]:
+    out = []
+    for text in texts:
+        try:
+            out.append({"input": text, "ok": True, "properties": parser(text)})
+        except ValueError as e:
+            out.append({"input": text, "ok": False, "error": str(e)})
+    return out
+
+def _molecule_cache_stats() -> Dict[str, Any]:
+    return {name: fn.cache_info()._asdict() for name, fn in (("smiles", parse_smiles), ("formulas", parse_formula))}
+
+@router.post("/api/molecules/resolve", response_model=MoleculeResolveOut)
+def resolve_molecules(payload: MoleculeResolveIn):
+    if len(payload.smiles) + len(payload.formulas) > MOLECULE_RESOLVE_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Too many molecules (max {MOLECULE_RESOLVE_MAX_ITEMS}).")
+    return {
+        "smiles": _resolve_molecules(payload.smiles, parse_smiles),
+        "formulas": _resolve_molecules(payload.formulas, parse_formula),
+        "cache": _molecule_cache_stats(),
+    }
+
+# ------------------------------------------------------------------------------
+# Chemical property index (solvents & common reagents)
+# ------------------------------------------------------------------------------
+# Compiled once at import into array columns plus a character trie over the
+# normalized names and synonyms, so exact and prefix lookups cost O(len(key)).
+# The impact engine uses it to recognise water under any common name and to
+# turn solvent volumes into masses.
+CHEMICAL_AUTOCOMPLETE_MAX = 25
+
+_HAZARD_FLAGS = ("flammable", "toxic", "corrosive", "irritant", "health", "environmental",
+                 "peroxide", "carcinogen", "reprotoxic", "explosive")
+# CHEM21 solvent selection guide ranking.
+_CHEM21_CLASSES = ("recommended", "problematic", "hazardous", "highly hazardous")
+_CHEMICAL_KINDS = ("solvent", "reagent")
+
+# name, synonyms, kind, density (g/mL, ~20 °C), boiling point (°C), MW (g/mol), CHEM21 class, hazards
+_CHEMICAL_DATA = (
+    ("water", ("h2o", "h₂o", "di water", "deionized water", "deionised water", "distilled water", "purified water", "milli q water", "aqua"),
+     "solvent", 0.998, 100.0, 18.015, "recommended", ()),
+    ("methanol", ("meoh", "methyl alcohol"), "solvent", 0.792, 64.7, 32.042, "recommended", ("flammable", "toxic")),
+    ("ethanol", ("etoh", "ethyl alcohol", "absolute ethanol"), "solvent", 0.789, 78.4, 46.069, "recommended", ("flammable",)),
+    ("isopropanol", ("ipa", "2-propanol", "propan-2-ol", "isopropyl alcohol", "iproh"), "solvent", 0.786, 82.5, 60.096, "recommended", ("flammable", "irritant")),
+    ("1-butanol", ("n-butanol", "butanol", "nbuoh", "buoh"), "solvent", 0.810, 117.7, 74.123, "recommended", ("flammable", "irritant")),
+    ("tert-butanol", ("t-butanol", "tbuoh", "2-methyl-2-propanol"), "solvent", 0.781, 82.4, 74.123, "recommended", ("flammable",)),
+    ("ethylene glycol", ("meg", "1,2-ethanediol", "glycol"), "solvent", 1.113, 197.3, 62.068, "recommended", ("toxic",)),
+    ("ethyl acetate", ("etoac", "ethyl ethanoate"), "solvent", 0.902, 77.1, 88.106, "recommended", ("flammable", "irritant")),
+    ("isopropyl acetate", ("ipac", "iproac"), "solvent", 0.872, 88.6, 102.133, "recommended", ("flammable",)),
+    ("n-butyl acetate", ("butyl acetate", "nbuoac", "buoac"), "solvent", 0.882, 126.1, 116.160, "recommended", ("flammable",)),
+    ("dimethyl carbonate", ("dmc",), "solvent", 1.069, 90.0, 90.078, "recommended", ("flammable",)),
+    ("acetone", ("propanone", "dimethyl ketone"), "solvent", 0.784, 56.1, 58.080, "recommended", ("flammable", "irritant")),
+    ("methyl ethyl ketone", ("mek", "2-butanone", "butanone"), "solvent", 0.805, 79.6, 72.107, "recommended", ("flammable", "irritant")),
+    ("anisole", ("methoxybenzene",), "solvent", 0.995, 153.7, 108.140, "recommended", ("flammable",)),
+    ("methyl isobutyl ketone", ("mibk",), "solvent", 0.802, 116.5, 100.161, "problematic", ("flammable", "health")),
+    ("toluene", ("phme", "methylbenzene"), "solvent", 0.867, 110.6, 92.141, "problematic", ("flammable", "health")),
+    ("xylene", ("xylenes", "dimethylbenzene"), "solvent", 0.860, 139.0, 106.168, "problematic", ("flammable", "health")),
+    ("heptane", ("n-heptane",), "solvent", 0.684, 98.4, 100.205, "problematic", ("flammable", "environmental")),
+    ("cyclohexane", ("chx",), "solvent", 0.779, 80.7, 84.162, "problematic", ("flammable", "environmental")),
+    ("tetrahydrofuran", ("thf", "oxolane"), "solvent", 0.889, 66.0, 72.107, "problematic", ("flammable", "peroxide")),
+    ("2-methyltetrahydrofuran", ("2-methf", "me-thf", "2-mthf"), "solvent", 0.854, 80.2, 86.134, "problematic", ("flammable", "peroxide")),
+    ("cyclopentyl methyl ether", ("cpme",), "solvent", 0.860, 106.0, 100.161, "problematic", ("flammable",)),
+    ("acetonitrile", ("mecn", "acn", "methyl cyanide"), "solvent", 0.786, 81.6, 41.053, "problematic", ("flammable", "toxic")),
+    ("dimethyl sulfoxide", ("dmso",), "solvent", 1.100, 189.0, 78.130, "problematic", ()),
+    ("acetic acid", ("acoh", "hoac", "glacial acetic acid", "ethanoic acid"), "solvent", 1.049, 118.1, 60.052, "problematic", ("flammable", "corrosive")),
+    ("formic acid", ("hcooh", "methanoic acid"), "solvent", 1.220, 100.8, 46.025, "problematic", ("corrosive",)),
+    ("limonene", ("d-limonene",), "solvent", 0.841, 176.0, 136.238, "problematic", ("flammable", "environmental")),
+    ("hexane", ("n-hexane", "hexanes"), "solvent", 0.655, 68.7, 86.178, "hazardous", ("flammable", "health", "environmental")),
+    ("pentane", ("n-pentane",), "solvent", 0.626, 36.1, 72.151, "hazardous", ("flammable", "environmental")),
+    ("dichloromethane", ("dcm", "methylene chloride", "ch2cl2"), "solvent", 1.326, 39.6, 84.930, "hazardous", ("health", "carcinogen")),
+    ("methyl tert-butyl ether", ("mtbe", "tbme", "tert-butyl methyl ether"), "solvent", 0.740, 55.2, 88.150, "hazardous", ("flammable",)),
+    ("1,4-dioxane", ("dioxane",), "solvent", 1.033, 101.1, 88.106, "hazardous", ("flammable", "carcinogen", "peroxide")),
+    ("1,2-dimethoxyethane", ("dme", "glyme", "monoglyme"), "solvent", 0.868, 85.0, 90.122, "hazardous", ("flammable", "reprotoxic")),
+    ("dimethylformamide", ("dmf", "n,n-dimethylformamide"), "solvent", 0.944, 153.0, 73.095, "hazardous", ("reprotoxic",)),
+    ("dimethylacetamide", ("dmac", "n,n-dimethylacetamide"), "solvent", 0.937, 165.0, 87.122, "hazardous", ("reprotoxic",)),
+    ("n-methyl-2-pyrrolidone", ("nmp", "n-methylpyrrolidone"), "solvent", 1.028, 202.0, 99.133, "hazardous", ("reprotoxic",)),
+    ("pyridine", ("py",), "solvent", 0.982, 115.2, 79.102, "hazardous", ("flammable", "toxic")),
+    ("diethyl ether", ("ether", "et2o", "ethyl ether"), "solvent", 0.713, 34.6, 74.123, "highly hazardous", ("flammable", "peroxide")),
+    ("chloroform", ("chcl3", "trichloromethane"), "solvent", 1.489, 61.2, 119.378, "highly hazardous", ("toxic", "carcinogen")),
+    ("1,2-dichloroethane", ("dce", "edc", "ethylene dichloride"), "solvent", 1.253, 83.5, 98.959, "highly hazardous", ("flammable", "toxic", "carcinogen")),
+    ("carbon tetrachloride", ("ccl4", "tetrachloromethane"), "solvent", 1.594, 76.7, 153.823, "highly hazardous", ("toxic", "carcinogen", "environmental")),
+    ("benzene", ("phh",), "solvent", 0.876, 80.1, 78.114, "highly hazardous", ("flammable", "carcinogen")),
+    ("nitromethane", ("meno2",), "solvent", 1.137, 101.2, 61.040, "highly hazardous", ("flammable", "explosive")),
+    ("triethylamine", ("tea", "et3n", "net3"), "reagent", 0.726, 89.5, 101.193, None, ("flammable", "corrosive")),
+    ("acetic anhydride", ("ac2o",), "reagent", 1.082, 139.8, 102.089, None, ("flammable", "corrosive")),
+    ("sulfuric acid", ("h2so4",), "reagent", 1.830, 337.0, 98.079, None, ("corrosive",)),
+    ("sodium hydroxide", ("naoh", "caustic soda"), "reagent", 2.130, 1388.0, 39.997, None, ("corrosive",)),
+    ("sodium bicarbonate", ("nahco3", "sodium hydrogen carbonate"), "reagent", 2.200, None, 84.007, None, ()),
+    ("sodium chloride", ("nacl", "salt"), "reagent", 2.165, 1465.0, 58.440, None, ()),
+    ("sodium sulfate", ("na2so4", "anhydrous sodium sulfate"), "reagent", 2.664, None, 142.040, None, ()),
+    ("magnesium sulfate", ("mgso4", "anhydrous magnesium sulfate"), "reagent", 2.660, None, 120.366, None, ()),
+    ("salicylic acid", ("2-hydroxybenzoic acid",), "reagent", 1.443, None, 138.121, None, ("irritant",)),
+)
+
+_NAME_SEPARATORS_RE = re.compile(r"[\s_]+")
+
+def normalize_chemical_name(name: str) -> str:
+    """Case- and spacing-insensitive key: 'DI  Water' -> 'di water'."""
+    return _NAME_SEPARATORS_RE.sub(" ", name.strip().lower())
+
+class _TrieNode:
+    __slots__ = ("children", "row", "completions")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.row: int = -1
+        self.completions: tuple = ()
+
+class ChemicalIndex:
+    """Column-oriented property table with a trie over normalized names and synonyms."""
+    def __init__(self, data):
+        self.names = tuple(row[0] for row in data)
+        self.synonyms = tuple(row[1] for row in data)
+        self.kind = np.array([_CHEMICAL_KINDS.index(row[2]) for row in data], dtype=np.int8)
+        nan = float("nan")
+        self.density_g_per_mL = np.array([nan if row[3] is None else row[3] for row in data], dtype=np.float64)
+        self.boiling_point_C = np.array([nan if row[4] is None else row[4] for row in data], dtype=np.float64)
+        self.mw = np.array([nan if row[5] is None else row[5] for row in data], dtype=np.float64)
+        self.chem21 = np.array([-1 if row[6] is None else _CHEM21_CLASSES.index(row[6]) for row in data], dtype=np.int8)
+        self.hazards = np.array([sum(1 << _HAZARD_FLAGS.index(h) for h in row[7]) for row in data], dtype=np.uint16)
+
+        self._root = _TrieNode()
+        for row, (name, synonyms, *_) in enumerate(data):
+            for key in (name, *synonyms):
+                node = self._root
+                for ch in normalize_chemical_name(key):
+                    node = node.children.setdefault(ch, _TrieNode())
+                node.row = row
+        self._fill_completions(self._root, "")
+        self.water_row = self.lookup("water")
+
+    def _fill_completions(self, node: _TrieNode, prefix: str) -> list:
+        """Precompute, per node, the best CHEMICAL_AUTOCOMPLETE_MAX (key, row) pairs below it."""
+        found = [(prefix, node.row)] if node.row >= 0 else []
+        for ch, child in node.children.items():
+            found.extend(self._fill_completions(child, prefix + ch))
+        found.sort(key=lambda kr: (len(kr[0]), kr[0]))
+        node.completions = tuple(found[:CHEMICAL_AUTOCOMPLETE_MAX * 2])
+        return list(node.completions)
+
+    def _walk(self, key: str) -> Optional[_TrieNode]:
+        node = self._root
+        for ch in key:
+            node = node.children.get(ch)
+            if node is None:
+                return None
+        return node
+
+    def lookup(self, name: str) -> int:
+        """Row of the exact (normalized) name or synonym, or -1."""
+        node = self._walk(normalize_chemical_name(name))
+        return node.row if node is not None else -1
+
+    def complete(self, prefix: str, limit: int = 10) -> List[tuple]:
+        """Up to `limit` distinct (matched_key, row) pairs whose key starts with prefix, shortest first."""
+        node = self._walk(normalize_chemical_name(prefix))
+        if node is None:
+            return []
+        out, seen = [], set()
+        for key, row in node.completions:
+            if row not in seen:
+                seen.add(row)
+                out.append((key, row))
+                if len(out) == limit:
+                    break
+        return out
+
+    def density(self, name: str) -> Optional[float]:
+        row = self.lookup(name)
+        if row < 0 or self.density_g_per_mL[row] != self.density_g_per_mL[row]:
+            return None
+        return float(self.density_g_per_mL[row])
+
+    def record(self, row: int) -> Dict[str, Any]:
+        val = lambda arr: None if arr[row] != arr[row] else float(arr[row])
+        return {
+            "name": self.names[row],
+            "synonyms": list(self.synonyms[row]),
+            "kind": _CHEMICAL_KINDS[self.kind[row]],
+            "density_g_per_mL": val(self.density_g_per_mL),
+            "boiling_point_C": val(self.boiling_point_C),
+            "mw": val(self.mw),
+            "chem21_class": _CHEM21_CLASSES[self.chem21[row]] if self.chem21[row] >= 0 else None,
+            "hazards": [h for i, h in enumerate(_HAZARD_FLAGS) if self.hazards[row] & (1 << i)],
+        }
+
+@functools.lru_cache(maxsize=None)
+def get_chemical_index() -> ChemicalIndex:
+    return ChemicalIndex(_CHEMICAL_DATA)
+
+@functools.lru_cache(maxsize=64)
+def _water_name_set(names: tuple) -> frozenset:
+    return frozenset(n.lower() for n in names)
+
+def solvent_is_water(name: str, water_name_set: frozenset) -> bool:
+    """Water if listed in options.water_names, or a synonym of water in the chemical index
+    whose canonical name is listed (so narrowing water_names also narrows the synonyms)."""
+    if name.strip().lower() in water_name_set:
+        return True
+    index = get_chemical_index()
+    return index.lookup(name) == index.water_row and index.names[index.water_row].lower() in water_name_set
+
+class ChemicalRecord(BaseModel):
+    name: str
+    synonyms: List[str]
+    kind: str
+    density_g_per_mL: Optional[float] = None
+    boiling_point_C: Optional[float] = None
+    mw: Optional[float] = None
+    chem21_class: Optional[str] = None
+    hazards: List[str] = []
+
+class ChemicalMatch(BaseModel):
+    matched: str
+    chemical: ChemicalRecord
+
+@router.get("/api/chemicals/lookup", response_model=ChemicalRecord)
+def chemical_lookup(name: str):
+    index = get_chemical_index()
+    row = index.lookup(name)
+    if row < 0:
+        raise HTTPException(status_code=404, detail=f"Unknown chemical '{name}'.")
+    return index.record(row)
+
+@router.get("/api/chemicals/autocomplete", response_model=List[ChemicalMatch])
+def chemical_autocomplete(q: str, limit: int = Query(default=10, ge=1, le=CHEMICAL_AUTOCOMPLETE_MAX)):
+    index = get_chemical_index()
+    return [{"matched": key, "chemical": index.record(row)} for key, row in index.complete(q, limit)]
+
 # ------------------------------------------------------------------------------
 # Reaction Impact Report (single JSON -> all metrics)
 # ------------------------------------------------------------------------------
 class Product(BaseModel):
     name: Optional[str] = None
     smiles: Optional[str] = None
-    mw: float = Field(gt=0, description="Molecular weight of desired product (g/mol)")
+    mw: Optional[float] = Field(default=None, gt=0, description="Molecular weight of desired product (g/mol); derived from smiles when omitted")
     actual_mass_g: float = Field(gt=0, description="Isolated product mass (g)")
-    carbon_atoms: Optional[int] = Field(default=None, ge=0, description="Number of carbon atoms in product molecule")
+    carbon_atoms: Optional[int] = Field(default=None, ge=0, description="Number of carbon atoms in product molecule; derived from smiles when omitted")
+
+    _fill_from_smiles = model_validator(mode="after")(_fill_from_smiles)
 
 class Reactant(BaseModel):
     name: Optional[str] = None
     smiles: Optional[str] = None
-    mw: float = Field(gt=0, description="Molecular weight (g/mol)")
+    mw: Optional[float] = Field(default=None, gt=0, description="Molecular weight (g/mol); derived from smiles when omitted")
     mass_g: float = Field(ge=0, description="Mass charged (g)")
-    carbon_atoms: Optional[int] = Field(default=None, ge=0, description="Number of carbon atoms per molecule")
+    carbon_atoms: Optional[int] = Field(default=None, ge=0, description="Number of carbon atoms per molecule; derived from smiles when omitted")
     eq_used: Optional[float]   = Field(default=None, ge=0, description="Equivalents actually used vs limiting reagent = 1")
     eq_stoich: Optional[float] = Field(default=None, gt=0, description="Stoichiometric equivalents required by balanced equation")
 
+    _fill_from_smiles = model_validator(mode="after")(_fill_from_smiles)
+
 class Solvent(BaseModel):
     name: str
-    mass_g: float = Field(ge=0, description="Mass of solvent (g)")
+    mass_g: Optional[float] = Field(default=None, ge=0, description="Mass of solvent (g); derived from volume_mL when omitted")
+    volume_mL: Optional[float] = Field(default=None, ge=0, description="Volume of solvent (mL), used when mass_g is omitted")
     recovery_pct: float = Field(default=0, ge=0, le=100)
 
+    @model_validator(mode="after")
+    def _require_amount(self):
+        if self.mass_g is None and self.volume_mL is None:
+            raise ValueError("Provide mass_g or volume_mL.")
+        return self
+
 class Catalyst(BaseModel):
     name: Optional[str] = None
     mw: float = Field(gt=0, description="Molecular weight (g/mol)")
     mass_g: float = Field(ge=0, description="Mass of catalyst (g)")
 
 class Workup(BaseModel):
-    aqueous_washes_g: float = Field(default=0, ge=0)
-    organic_rinses_g: float = Field(default=0, ge=0)
-    drying_agents_g: float = Field(default=0, ge=0)
+    aqueous_washes_g: float = Field(default=0.0, ge=0)
+    organic_rinses_g: float = Field(default=0.0, ge=0)
+    drying_agents_g: float = Field(default=0.0, ge=0)
 
 class Conditions(BaseModel):
     temp_C: Optional[float] = None
-    time_h: float = Field(default=0, ge=0)
+    time_h: float = Field(default=0.0, ge=0)
     mode: Literal["hotplate", "microwave", "reflux", "other"] = "hotplate"
 
 class Options(BaseModel):
@@ -267,6 +1689,15 @@ class ReactionImpactIn(BaseModel):
     conditions: Conditions = Conditions()
     options: Options = Options()
 
+    @model_validator(mode="after")
+    def _solvent_volumes_to_mass(self):
+        # Density from the chemical index, else options.default_density_g_per_mL.
+        for s in self.solvents:
+            if s.mass_g is None:
+                density = get_chemical_index().density(s.name) or self.options.default_density_g_per_mL
+                s.mass_g = s.volume_mL * density
+        return self
+
 class ReactionImpactOut(BaseModel):
     atom_economy_pct: Optional[float]
     pmi: Optional[float]
@@ -280,14 +1711,12 @@ class ReactionImpactOut(BaseModel):
     breakdown: Dict[str, Any]
     ai_suggestions: List[str] = []
 
-def compute_impact(payload: ReactionImpactIn) -> ReactionImpactOut:
-    if not payload.reactants:
-        raise HTTPException(status_code=400, detail="Provide at least one reactant.")
-    p = payload.product
+def _impact_totals(payload: ReactionImpactIn) -> Dict[str, float]:
+    """Unrounded mass (g), water (g) and energy (kWh) totals behind compute_impact."""
     opts = payload.options
 
     # Masses (g)
-    reactant_mass_g = sum(r.mass_g for r in payload.reactants)
+    reactant_mass_g = sum((r.mass_g for r in payload.reactants), 0.0)
 
     # Solvent mass (g) with recovery
     solvent_mass_total_g = 0.0
@@ -295,7 +1724,7 @@ def compute_impact(payload: ReactionImpactIn) -> ReactionImpactOut:
     
     # Track water separately for water intensity metric (includes aqueous washes + water solvents)
     water_g_total = float(payload.workup.aqueous_washes_g)
-    water_name_set = {n.lower() for n in opts.water_names}
+    water_name_set = _water_name_set(tuple(opts.water_names))
 
     for s in payload.solvents:
         mass_g = s.mass_g
@@ -303,23 +1732,56 @@ def compute_impact(payload: ReactionImpactIn) -> ReactionImpactOut:
         nonrec_g = mass_g * (1.0 - s.recovery_pct/100.0)
         solvent_mass_nonrecovered_g += nonrec_g
         # Count reaction solvent water into water usage for water intensity metric only
-        if s.name.strip().lower() in water_name_set:
+        if solvent_is_water(s.name, water_name_set):
             water_g_total += s.mass_g
 
     auxiliaries_g = payload.workup.drying_agents_g
 
     # Catalyst mass
-    catalyst_mass_g = sum(c.mass_g for c in payload.catalysts)
-
-    product_mass_g = p.actual_mass_g
-    if product_mass_g <= 0:
-        raise HTTPException(status_code=400, detail="Product mass must be > 0.")
+    catalyst_mass_g = sum((c.mass_g for c in payload.catalysts), 0.0)
 
     # PMI (Process Mass Intensity) = Total Mass of All Input Materials / Mass of Final Product
     # Total Input = Reactants + Catalysts + ALL Solvents + Aqueous washes + auxiliaries (drying agents)
     # PMI counts ALL materials that enter the process, regardless of recovery
     total_input_mass_g = reactant_mass_g + catalyst_mass_g + solvent_mass_total_g + payload.workup.aqueous_washes_g + auxiliaries_g
 
+    mode = payload.conditions.mode
+    time_h = payload.conditions.time_h or 0.0
+    preset = opts.energy_presets_kw.get(mode, opts.energy_presets_kw["other"])
+    kwh = preset["kw"] * preset["duty"] * time_h
+
+    return {
+        "reactant_mass_g": reactant_mass_g,
+        "solvent_mass_total_g": solvent_mass_total_g,
+        "solvent_mass_nonrecovered_g": solvent_mass_nonrecovered_g,
+        "water_g_total": water_g_total,
+        "auxiliaries_g": auxiliaries_g,
+        "catalyst_mass_g": catalyst_mass_g,
+        "total_input_mass_g": total_input_mass_g,
+        "kwh": kwh,
+    }
+
+def _check_impact_input(payload: ReactionImpactIn) -> None:
+    if not payload.reactants:
+        raise HTTPException(status_code=400, detail="Provide at least one reactant.")
+    if payload.product.actual_mass_g <= 0:
+        raise HTTPException(status_code=400, detail="Product mass must be > 0.")
+
+def _mass_metrics(payload: ReactionImpactIn) -> Dict[str, Any]:
+    """PMI, E-factor, water and energy intensity and the mass breakdown."""
+    opts = payload.options
+    product_mass_g = payload.product.actual_mass_g
+
+    totals = _impact_totals(payload)
+    reactant_mass_g = totals["reactant_mass_g"]
+    solvent_mass_total_g = totals["solvent_mass_total_g"]
+    solvent_mass_nonrecovered_g = totals["solvent_mass_nonrecovered_g"]
+    water_g_total = totals["water_g_total"]
+    auxiliaries_g = totals["auxiliaries_g"]
+    catalyst_mass_g = totals["catalyst_mass_g"]
+    total_input_mass_g = totals["total_input_mass_g"]
+    kwh = totals["kwh"]
+
     pmi = total_input_mass_g / product_mass_g if product_mass_g > 0 else 0
     
     # E-factor = (Total mass in - Product mass out) / Product mass out
@@ -327,16 +1789,10 @@ def compute_impact(payload: ReactionImpactIn) -> ReactionImpactOut:
     # E-factor represents waste generation: higher E-factor = more waste per unit product
     e_factor = (total_input_mass_g - product_mass_g) / product_mass_g
 
-    sum_reactant_mw = sum(r.mw for r in payload.reactants)
-    atom_economy = (100.0 * p.mw / sum_reactant_mw) if sum_reactant_mw > 0 else None
-
     # Water intensity (mL/g) - water_g_total in grams = mL (since water density = 1 g/mL)
     water_mL_per_g = (water_g_total / product_mass_g) if product_mass_g > 0 else 0
 
     mode = payload.conditions.mode
-    time_h = payload.conditions.time_h or 0.0
-    preset = opts.energy_presets_kw.get(mode, opts.energy_presets_kw["other"])
-    kwh = preset["kw"] * preset["duty"] * time_h
     energy_kWh_per_g = kwh / product_mass_g if product_mass_g > 0 else None
 
     breakdown = {
@@ -355,12 +1811,28 @@ def compute_impact(payload: ReactionImpactIn) -> ReactionImpactOut:
             "count_recovered_solvent_in_pmi": opts.count_recovered_solvent_in_pmi
         }
     }
+    return {
+        "pmi": round(pmi, 3),
+        "e_factor": round(e_factor, 3),
+        "water_mL_per_g": round(water_mL_per_g, 2),
+        "energy_kWh_per_g": round(energy_kWh_per_g, 6) if energy_kWh_per_g is not None else None,
+        "breakdown": breakdown,
+    }
+
+def _atom_economy_metrics(payload: ReactionImpactIn) -> Dict[str, Any]:
+    sum_reactant_mw = sum(r.mw for r in payload.reactants)
+    atom_economy = (100.0 * payload.product.mw / sum_reactant_mw) if sum_reactant_mw > 0 else None
+    return {"atom_economy_pct": round(atom_economy, 2) if atom_economy is not None else None}
 
+def _rme_metrics(payload: ReactionImpactIn) -> Dict[str, Any]:
+    product_mass_g = payload.product.actual_mass_g
     rme_pct = None
     reactant_mass_g = sum(r.mass_g for r in payload.reactants)
     if product_mass_g > 0 and reactant_mass_g > 0:
         rme_pct = round((product_mass_g / reactant_mass_g) * 100.0, 2)
+    return {"rme_pct": rme_pct}
 
+def _carbon_efficiency_metrics(payload: ReactionImpactIn) -> Dict[str, Any]:
     carbon_efficiency_pct = None
     try:
         if payload.product.carbon_atoms is not None and all(
@@ -376,7 +1848,9 @@ def compute_impact(payload: ReactionImpactIn) -> ReactionImpactOut:
                 carbon_efficiency_pct = round((totalC_out / totalC_in) * 100.0, 2)
     except Exception:
         pass
+    return {"carbon_efficiency_pct": carbon_efficiency_pct}
 
+def _stoichiometric_factor_metrics(payload: ReactionImpactIn) -> Dict[str, Any]:
     sf_overall = None
     sf_details = None
     try:
@@ -391,93 +1865,3111 @@ def compute_impact(payload: ReactionImpactIn) -> ReactionImpactOut:
                 sf_details = per
     except Exception:
         pass
+    return {"sf_overall": sf_overall, "sf_details": sf_details}
 
-    return ReactionImpactOut(
-        atom_economy_pct = round(atom_economy, 2) if atom_economy is not None else None,
-        pmi = round(pmi, 3),
-        e_factor = round(e_factor, 3),
-        water_mL_per_g = round(water_mL_per_g, 2),
-        energy_kWh_per_g = round(energy_kWh_per_g, 6) if energy_kWh_per_g is not None else None,
-        rme_pct = rme_pct,
-        carbon_efficiency_pct = carbon_efficiency_pct,
-        sf_overall = sf_overall,
-        sf_details = sf_details,
-        breakdown = breakdown,
-        ai_suggestions = []
-    )
+# compute_impact in independent groups, so callers that know which inputs
+# changed (the live simulation socket) can recompute only what depends on them.
+IMPACT_METRIC_GROUPS: Dict[str, Callable[[ReactionImpactIn], Dict[str, Any]]] = {
+    "mass": _mass_metrics,
+    "atom_economy": _atom_economy_metrics,
+    "rme": _rme_metrics,
+    "carbon_efficiency": _carbon_efficiency_metrics,
+    "stoichiometric_factor": _stoichiometric_factor_metrics,
+}
+
+def _assemble_impact(values: Dict[str, Any]) -> Dict[str, Any]:
+    # ReactionImpactOut field order, so the dict renders exactly like the model.
+    return {
+        "atom_economy_pct": values["atom_economy_pct"],
+        "pmi": values["pmi"],
+        "e_factor": values["e_factor"],
+        "water_mL_per_g": values["water_mL_per_g"],
+        "energy_kWh_per_g": values["energy_kWh_per_g"],
+        "rme_pct": values["rme_pct"],
+        "carbon_efficiency_pct": values["carbon_efficiency_pct"],
+        "sf_overall": values["sf_overall"],
+        "sf_details": values["sf_details"],
+        "breakdown": values["breakdown"],
+        "ai_suggestions": [],
+    }
+
+def _check_finite(report: Dict[str, Any]) -> Dict[str, Any]:
+    """Returns the report, or raises ValueError naming outputs that overflowed (JSON has no inf / nan)."""
+    def walk(obj, path):
+        if isinstance(obj, float):
+            if not isfinite(obj):
+                yield path
+        elif isinstance(obj, dict):
+            for key, value in obj.items():
+                yield from walk(value, f"{path}.{key}" if path else key)
+        elif isinstance(obj, list):
+            for i, value in enumerate(obj):
+                yield from walk(value, f"{path}.{i}")
+    bad = list(walk(report, ""))
+    if bad:
+        raise ValueError(f"result out of range ({', '.join(bad)}); check for extreme input values")
+    return report
 
-@app.post("/api/impact/compute", response_model=ReactionImpactOut)
+def compute_impact_dict(payload: ReactionImpactIn) -> Dict[str, Any]:
+    """compute_impact as a plain dict in ReactionImpactOut field order (no model construction)."""
+    _check_impact_input(payload)
+    values: Dict[str, Any] = {}
+    for group in IMPACT_METRIC_GROUPS.values():
+        values.update(group(payload))
+    return _check_finite(_assemble_impact(values))
+
+def compute_impact(payload: ReactionImpactIn) -> ReactionImpactOut:
+    return ReactionImpactOut(**compute_impact_dict(payload))
+
+@router.post("/api/impact/compute", response_model=ReactionImpactOut)
+@cached_result(ReactionImpactOut)
 def reaction_impact(payload: ReactionImpactIn):
     try:
-        return compute_impact(payload)
+        return compute_impact_dict(payload)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid input: {e}")
 
+# ------------------------------------------------------------------------------
+# Batch Reaction Impact (many reports in one vectorized pass)
+# ------------------------------------------------------------------------------
+# Scoring a whole notebook through /api/impact/compute costs one HTTP round-trip,
+# one validation and one serialization per reaction. The batch endpoint validates
+# each item independently (so one bad row does not sink the batch), flattens the
+# valid ones into NumPy columns and evaluates every metric at once. Sums are taken
+# in the same left-to-right order as compute_impact and rounding is done with
+# Python's round(), so each result is identical to the single-item path.
+IMPACT_BATCH_MAX_ITEMS = int(os.getenv("IMPACT_BATCH_MAX_ITEMS", "10000"))
 
+class ImpactBatchIn(BaseModel):
+    items: Optional[List[Dict[str, Any]]] = Field(default=None, description="Row layout: one ReactionImpactIn object per reaction")
+    columns: Optional[Dict[str, List[Any]]] = Field(default=None, description="Columnar layout: ReactionImpactIn field -> list of values, one per reaction")
 
+class ImpactBatchError(BaseModel):
+    status_code: int
+    detail: Any
 
+class ImpactBatchItem(BaseModel):
+    index: int
+    ok: bool
+    result: Optional[ReactionImpactOut] = None
+    error: Optional[ImpactBatchError] = None
 
-# ------------------------------------------------------------------------------
-# Pages (Jinja templates)
-# ------------------------------------------------------------------------------
-@app.get("/", response_class=HTMLResponse)
-def home(request: Request):
-    context = {"request": request, "title": "Green Toolkit", "subtitle": "We are ready to build green tool"}
-    return templates.TemplateResponse("index.html", context)
+class ImpactBatchOut(BaseModel):
+    count: int
+    ok_count: int
+    error_count: int
+    results: List[ImpactBatchItem]
 
-@app.get("/gamification", response_class=HTMLResponse)
-def gamification_page(request: Request):
-    context = {"request": request, "title": "Gamification"}
-    return templates.TemplateResponse("gamification.html", context)
+def _energy_preset(payload: ReactionImpactIn) -> tuple:
+    """(kw, duty) for the payload's heating mode, looked up exactly like compute_impact."""
+    opts = payload.options
+    preset = opts.energy_presets_kw.get(payload.conditions.mode, opts.energy_presets_kw["other"])
+    return preset["kw"], preset["duty"]
 
-@app.get("/tools", response_class=HTMLResponse)
-def tools_page(request: Request):
-    context = {"request": request, "title": "Tools & Calculators"}
-    return templates.TemplateResponse("tools.html", context)
+def _impact_columns(payloads: List[ReactionImpactIn], presets: List[tuple]) -> Dict[str, "np.ndarray"]:
+    """Flatten validated payloads into per-reaction arrays and per-child arrays with an owner index."""
+    nan = float("nan")
+    r_owner, r_mw, r_mass, r_carbon, r_eq_used, r_eq_stoich = [], [], [], [], [], []
+    s_owner, s_mass, s_rec, s_water = [], [], [], []
+    c_owner, c_mass = [], []
+    for i, p in enumerate(payloads):
+        for r in p.reactants:
+            r_owner.append(i)
+            r_mw.append(r.mw)
+            r_mass.append(r.mass_g)
+            r_carbon.append(nan if r.carbon_atoms is None else r.carbon_atoms)
+            r_eq_used.append(nan if r.eq_used is None else r.eq_used)
+            r_eq_stoich.append(nan if r.eq_stoich is None else r.eq_stoich)
+        water_name_set = _water_name_set(tuple(p.options.water_names))
+        for sv in p.solvents:
+            s_owner.append(i)
+            s_mass.append(sv.mass_g)
+            s_rec.append(sv.recovery_pct)
+            s_water.append(solvent_is_water(sv.name, water_name_set))
+        for c in p.catalysts:
+            c_owner.append(i)
+            c_mass.append(c.mass_g)
 
-# ------------------------------------------------------------------------------
-# Optional: One-App Mode for Vite frontend (currently not used)
-# ------------------------------------------------------------------------------
-# If you want to serve a Vite-built SPA at /app, set FRONTEND_DIST env variable
-# to point to your dist folder. Otherwise, this section is ignored.
+    f = lambda xs: np.asarray(xs, dtype=np.float64)
+    idx = lambda xs: np.asarray(xs, dtype=np.intp)
+    return {
+        "n": len(payloads),
+        "product_mw": f([p.product.mw for p in payloads]),
+        "product_mass_g": f([p.product.actual_mass_g for p in payloads]),
+        "product_carbon": f([nan if p.product.carbon_atoms is None else p.product.carbon_atoms for p in payloads]),
+        "aqueous_washes_g": f([p.workup.aqueous_washes_g for p in payloads]),
+        "drying_agents_g": f([p.workup.drying_agents_g for p in payloads]),
+        "time_h": f([p.conditions.time_h or 0.0 for p in payloads]),
+        "kw": f([kw for kw, _ in presets]),
+        "duty": f([duty for _, duty in presets]),
+        "r_owner": idx(r_owner), "r_mw": f(r_mw), "r_mass": f(r_mass), "r_carbon": f(r_carbon),
+        "r_eq_used": f(r_eq_used), "r_eq_stoich": f(r_eq_stoich),
+        "s_owner": idx(s_owner), "s_mass": f(s_mass), "s_rec": f(s_rec),
+        "s_water": np.asarray(s_water, dtype=bool),
+        "c_owner": idx(c_owner), "c_mass": f(c_mass),
+    }
 
-@app.get("/simulate", response_class=HTMLResponse)
-def simulate_page(request: Request):
-    context = {"request": request, "title": "Simulations"}
-    return templates.TemplateResponse("sim.html", context)
+def _impact_kernel(c: Dict[str, "np.ndarray"]) -> Dict[str, "np.ndarray"]:
+    """Unrounded impact metrics for every reaction in the columns (NaN where compute_impact gives None).
+
+    np.bincount accumulates sequentially in input order, which reproduces the
+    left-to-right sums in compute_impact bit for bit.
+    """
+    n = c["n"]
+    # float64 even with no children (bincount of empty weights is int64), so 0 serializes as 0.0 like compute_impact.
+    per = lambda owner, w: np.bincount(owner, weights=w, minlength=n).astype(np.float64, copy=False)
+
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):  # overflowing rows are rejected per row
+        reactant_mass_g = per(c["r_owner"], c["r_mass"])
+        solvent_mass_total_g = per(c["s_owner"], c["s_mass"])
+        solvent_mass_nonrecovered_g = per(c["s_owner"], c["s_mass"] * (1.0 - c["s_rec"] / 100.0))
+        # Aqueous washes come first so each reaction's water sum starts from them, as in compute_impact.
+        water_g_total = per(
+            np.concatenate([np.arange(n), c["s_owner"]]),
+            np.concatenate([c["aqueous_washes_g"], np.where(c["s_water"], c["s_mass"], 0.0)]),
+        )
+        catalyst_mass_g = per(c["c_owner"], c["c_mass"])
+        auxiliaries_g = c["drying_agents_g"]
+        product_mass_g = c["product_mass_g"]
+
+        total_input_mass_g = reactant_mass_g + catalyst_mass_g + solvent_mass_total_g + c["aqueous_washes_g"] + auxiliaries_g
+        pmi = total_input_mass_g / product_mass_g
+        e_factor = (total_input_mass_g - product_mass_g) / product_mass_g
+
+        sum_reactant_mw = per(c["r_owner"], c["r_mw"])
+        atom_economy = np.where(sum_reactant_mw > 0, 100.0 * c["product_mw"] / sum_reactant_mw, np.nan)
+
+        water_mL_per_g = water_g_total / product_mass_g
+        kwh = c["kw"] * c["duty"] * c["time_h"]
+        energy_kWh_per_g = kwh / product_mass_g
+
+        rme = np.where(reactant_mass_g > 0, (product_mass_g / reactant_mass_g) * 100.0, np.nan)
+
+        r_carbon_missing = np.isnan(c["r_carbon"])
+        carbon_missing = per(c["r_owner"], r_carbon_missing.astype(np.float64)) > 0
+        totalC_in = per(c["r_owner"], np.where(r_carbon_missing, 0.0, (c["r_mass"] / c["r_mw"]) * c["r_carbon"]))
+        totalC_out = (product_mass_g / c["product_mw"]) * c["product_carbon"]
+        ce_ok = ~np.isnan(c["product_carbon"]) & ~carbon_missing & (totalC_in > 0)
+        carbon_efficiency = np.where(ce_ok, (totalC_out / totalC_in) * 100.0, np.nan)
+
+        pair = ~np.isnan(c["r_eq_used"]) & ~np.isnan(c["r_eq_stoich"]) & (c["r_eq_stoich"] > 0)
+        sum_used = per(c["r_owner"], np.where(pair, c["r_eq_used"], 0.0))
+        sum_req = per(c["r_owner"], np.where(pair, c["r_eq_stoich"], 0.0))
+        has_pairs = per(c["r_owner"], pair.astype(np.float64)) > 0
+        sf_overall = np.where(has_pairs & (sum_req > 0), sum_used / sum_req, np.nan)
+
+    return {
+        "reactant_mass_g": reactant_mass_g,
+        "catalyst_mass_g": catalyst_mass_g,
+        "solvent_mass_total_g": solvent_mass_total_g,
+        "solvent_mass_nonrecovered_g": solvent_mass_nonrecovered_g,
+        "auxiliaries_g": auxiliaries_g,
+        "total_input_mass_g": total_input_mass_g,
+        "water_g_total": water_g_total,
+        "kwh": kwh,
+        "atom_economy_pct": atom_economy,
+        "pmi": pmi,
+        "e_factor": e_factor,
+        "water_mL_per_g": water_mL_per_g,
+        "energy_kWh_per_g": energy_kWh_per_g,
+        "rme_pct": rme,
+        "carbon_efficiency_pct": carbon_efficiency,
+        "sf_overall": sf_overall,
+        "sf_pair": pair,
+    }
+
+def _round_or_none(x: float, ndigits: int) -> Optional[float]:
+    return None if x != x else round(x, ndigits)
+
+def _impact_report(payload: ReactionImpactIn, m: Dict[str, list], i: int) -> Dict[str, Any]:
+    """Assemble the ReactionImpactOut-shaped dict for row i of kernel output m (already .tolist()'d)."""
+    sf_overall = _round_or_none(m["sf_overall"][i], 4)
+    sf_details = None
+    if sf_overall is not None:
+        sf_details = []
+        for j, r in enumerate(payload.reactants):
+            if r.eq_used is None or r.eq_stoich is None or not r.eq_stoich > 0:
+                continue
+            ratio = r.eq_used / r.eq_stoich
+            if isfinite(ratio):
+                sf_details.append({"name": r.name or f"reactant_{j+1}", "excess_ratio": round(ratio, 4)})
+    return {
+        "atom_economy_pct": _round_or_none(m["atom_economy_pct"][i], 2),
+        "pmi": round(m["pmi"][i], 3),
+        "e_factor": round(m["e_factor"][i], 3),
+        "water_mL_per_g": round(m["water_mL_per_g"][i], 2),
+        "energy_kWh_per_g": _round_or_none(m["energy_kWh_per_g"][i], 6),
+        "rme_pct": _round_or_none(m["rme_pct"][i], 2),
+        "carbon_efficiency_pct": _round_or_none(m["carbon_efficiency_pct"][i], 2),
+        "sf_overall": sf_overall,
+        "sf_details": sf_details,
+        "breakdown": {
+            "reactant_mass_g": round(m["reactant_mass_g"][i], 4),
+            "catalyst_mass_g": round(m["catalyst_mass_g"][i], 4),
+            "solvent_mass_total_g": round(m["solvent_mass_total_g"][i], 4),
+            "solvent_mass_nonrecovered_g": round(m["solvent_mass_nonrecovered_g"][i], 4),
+            "auxiliaries_g": round(m["auxiliaries_g"][i], 4),
+            "aqueous_washes_g": round(payload.workup.aqueous_washes_g, 2),
+            "total_input_mass_g": round(m["total_input_mass_g"][i], 4),
+            "product_mass_g": round(payload.product.actual_mass_g, 4),
+            "water_total_g": round(m["water_g_total"][i], 2),
+            "energy_kWh_total_est": round(m["kwh"][i], 4),
+            "energy_mode": payload.conditions.mode,
+            "options": {
+                "count_recovered_solvent_in_pmi": payload.options.count_recovered_solvent_in_pmi
+            }
+        },
+        "ai_suggestions": [],
+    }
+
+def compute_impact_batch(payloads: List[ReactionImpactIn]) -> List[Dict[str, Any]]:
+    """Vectorized compute_impact. Returns one {"ok", "result" | "error"} dict per payload, in order."""
+    out: List[Optional[Dict[str, Any]]] = [None] * len(payloads)
+    valid, presets, positions = [], [], []
+    for i, p in enumerate(payloads):
+        if not p.reactants:
+            out[i] = {"ok": False, "error": {"status_code": 400, "detail": "Provide at least one reactant."}}
+            continue
+        try:
+            presets.append(_energy_preset(p))
+        except Exception as e:
+            out[i] = {"ok": False, "error": {"status_code": 400, "detail": f"Invalid input: {e}"}}
+            continue
+        valid.append(p)
+        positions.append(i)
+
+    if valid:
+        m = {k: v.tolist() for k, v in _impact_kernel(_impact_columns(valid, presets)).items()}
+        for row, (i, p) in enumerate(zip(positions, valid)):
+            try:
+                out[i] = {"ok": True, "result": _check_finite(_impact_report(p, m, row))}
+            except Exception as e:
+                out[i] = {"ok": False, "error": {"status_code": 400, "detail": f"Invalid input: {e}"}}
+    return out
+
+def _batch_rows(payload: ImpactBatchIn) -> List[Dict[str, Any]]:
+    if (payload.items is None) == (payload.columns is None):
+        raise HTTPException(status_code=400, detail="Provide exactly one of 'items' or 'columns'.")
+    if payload.items is not None:
+        return payload.items
+    lengths = {len(v) for v in payload.columns.values()}
+    if len(lengths) > 1:
+        raise HTTPException(status_code=400, detail="All columns must have the same length.")
+    keys = list(payload.columns.keys())
+    return [dict(zip(keys, values)) for values in zip(*payload.columns.values())]
+
+@router.post("/api/impact/compute-batch", response_model=ImpactBatchOut)
+def reaction_impact_batch(payload: ImpactBatchIn):
+    rows = _batch_rows(payload)
+    if len(rows) > IMPACT_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch too large: {len(rows)} items (max {IMPACT_BATCH_MAX_ITEMS}).")
+
+    results: List[Dict[str, Any]] = [None] * len(rows)
+    parsed, positions = [], []
+    for i, row in enumerate(rows):
+        try:
+            parsed.append(ReactionImpactIn.model_validate(row))
+            positions.append(i)
+        except ValidationError as e:
+            results[i] = {"ok": False, "error": {"status_code": 422, "detail": e.errors(include_url=False, include_context=False)}}
+
+    for i, res in zip(positions, compute_impact_batch(parsed)):
+        results[i] = res
+
+    ok_count = sum(1 for r in results if r["ok"])
+    return {
+        "count": len(results),
+        "ok_count": ok_count,
+        "error_count": len(results) - ok_count,
+        "results": [{"index": i, **r} for i, r in enumerate(results)],
+    }
 
 # ------------------------------------------------------------------------------
-# One-App Mode: serve the built Vite frontend (SPA) at /app
+# Streaming Reaction Impact (NDJSON / CSV in, NDJSON out)
 # ------------------------------------------------------------------------------
-def _pick_frontend_dist() -> Optional[Path]:
-    """Try to find a Vite 'dist' folder. Override with env FRONTEND_DIST."""
-    env_path = os.getenv("FRONTEND_DIST")
-    if env_path:
-        p = Path(env_path)
-        if p.is_dir():
-            return p
+# Large historical datasets do not fit in one request body on the 512 MB tier.
+# The stream endpoint reads the upload incrementally, scores it in fixed-size
+# chunks through compute_impact_batch and writes NDJSON results back while the
+# upload is still arriving, so memory is bounded by the chunk size.
+#
+# NDJSON input: one ReactionImpactIn object per line.
+# CSV input: a header of dotted field paths, list items by index, e.g.
+#   product.mw,product.actual_mass_g,reactants.0.mw,reactants.0.mass_g,solvents.0.name,solvents.0.mass_g
+# Empty cells are treated as missing.
+#
+# Output: one {"index", "ok", "result" | "error"} line per input record, then a
+# final {"done": true, "count", "ok_count", "error_count"} line.
+IMPACT_STREAM_CHUNK_ROWS = int(os.getenv("IMPACT_STREAM_CHUNK_ROWS", "500"))
+IMPACT_STREAM_MAX_RECORD_BYTES = int(os.getenv("IMPACT_STREAM_MAX_RECORD_BYTES", str(1 << 20)))
 
-    # Common locations (adjust if your layout differs)
-    candidates = [
-        BASE_DIR / "dist",
-        BASE_DIR / "frontend" / "dist",
-        BASE_DIR / "vite_project_1" / "dist",
-        BASE_DIR.parent / "frontend" / "dist",
-        BASE_DIR.parent / "vite_project_1" / "dist",
-    ]
-    for c in candidates:
-        if c.is_dir():
-            return c
+def _json_line(obj: Any) -> str:
+    # Same separators as Starlette's JSONResponse, so results match /api/impact/compute byte for byte.
+    return json.dumps(obj, ensure_ascii=False, allow_nan=False, separators=(",", ":")) + "\n"
+
+def _unflatten_row(header: List[str], values: List[str]) -> Dict[str, Any]:
+    """Turn {"reactants.0.mw": "138.1", ...} into nested dicts/lists."""
+    root: Dict[str, Any] = {}
+    for key, val in zip(header, values):
+        if val == "":
+            continue
+        parts = key.strip().split(".")
+        node = root
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        node[parts[-1]] = val
+
+    def listify(node):
+        if not isinstance(node, dict):
+            return node
+        if node and all(k.isdigit() for k in node):
+            return [listify(node[k]) for k in sorted(node, key=int)]
+        return {k: listify(v) for k, v in node.items()}
+    return listify(root)
+
+class RecordTooLarge(Exception):
+    """A record outgrew max_record_bytes; `records` are the ones completed before it."""
+    def __init__(self, msg: str, records: Optional[List[tuple]] = None):
+        super().__init__(msg)
+        self.records = list(records or ())
+
+class _RecordReader:
+    """Incrementally splits a byte stream into NDJSON or CSV records.
+
+    feed() returns (index, row_dict | error_message) tuples for every record
+    completed by the new bytes; only the trailing partial record is buffered.
+    """
+    def __init__(self, fmt: str, max_record_bytes: int = IMPACT_STREAM_MAX_RECORD_BYTES):
+        self.fmt = fmt
+        self.max_record_bytes = max_record_bytes
+        self._decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+        self._buf = ""
+        self._pending = ""   # CSV record spanning several lines (quoted newline)
+        self._header: Optional[List[str]] = None
+        self._index = 0
+
+    def feed(self, data: bytes) -> List[tuple]:
+        self._buf += self._decoder.decode(data)
+        *lines, self._buf = self._buf.split("\n")
+        out = self._parse_lines(lines)
+        if len(self._buf) > self.max_record_bytes:
+            raise RecordTooLarge(f"Record {self._index} exceeds {self.max_record_bytes} bytes.", out)
+        return out
+
+    def close(self) -> List[tuple]:
+        lines = [self._buf + self._decoder.decode(b"", final=True)]
+        self._buf = ""
+        out = self._parse_lines(lines)
+        if self._pending:
+            out.append(self._record_error("Unterminated quoted CSV field."))
+            self._pending = ""
+        return out
+
+    def _record_error(self, msg: str) -> tuple:
+        rec = (self._index, msg)
+        self._index += 1
+        return rec
+
+    def _parse_lines(self, lines: List[str]) -> List[tuple]:
+        out = []
+        for line in lines:
+            line = line.rstrip("\r")
+            if self.fmt == "csv":
+                # A record is complete once its quote characters balance out.
+                self._pending = f"{self._pending}\n{line}" if self._pending else line
+                if self._pending.count('"') % 2:
+                    if len(self._pending) > self.max_record_bytes:
+                        raise RecordTooLarge(f"Record {self._index} exceeds {self.max_record_bytes} bytes.", out)
+                    continue
+                text, self._pending = self._pending, ""
+                if not text.strip():
+                    continue
+                values = next(csv.reader([text]))
+                if self._header is None:
+                    self._header = values
+                    continue
+                out.append((self._index, _unflatten_row(self._header, values)))
+                self._index += 1
+            else:
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    out.append(self._record_error(f"Invalid JSON: {e}"))
+                    continue
+                if not isinstance(row, dict):
+                    out.append(self._record_error("Each NDJSON line must be a JSON object."))
+                    continue
+                out.append((self._index, row))
+                self._index += 1
+        return out
+
+class _StreamScorer:
+    """Validates and scores chunks of parsed records, keeping running totals."""
+    def __init__(self):
+        self.count = 0
+        self.ok_count = 0
+
+    def score(self, records: List[tuple]) -> str:
+        lines: List[Optional[str]] = [None] * len(records)
+        parsed, positions = [], []
+        for k, (index, row) in enumerate(records):
+            if isinstance(row, str):
+                lines[k] = _json_line({"index": index, "ok": False, "error": {"status_code": 400, "detail": row}})
+                continue
+            try:
+                parsed.append(ReactionImpactIn.model_validate(row))
+                positions.append(k)
+            except ValidationError as e:
+                err = {"status_code": 422, "detail": e.errors(include_url=False, include_context=False)}
+                lines[k] = _json_line({"index": index, "ok": False, "error": err})
+        for k, res in zip(positions, compute_impact_batch(parsed)):
+            try:
+                lines[k] = _json_line({"index": records[k][0], **res})
+            except ValueError as e:  # an unencodable row must not cut the stream short
+                res = {"ok": False, "error": {"status_code": 400, "detail": f"Invalid input: {e}"}}
+                lines[k] = _json_line({"index": records[k][0], **res})
+            self.ok_count += res["ok"]
+        self.count += len(records)
+        return "".join(lines)
+
+    def summary(self, error: Optional[str] = None) -> str:
+        out = {"done": error is None, "count": self.count, "ok_count": self.ok_count,
+               "error_count": self.count - self.ok_count}
+        if error is not None:
+            out["detail"] = error
+        return _json_line(out)
+
+class _StreamPipeline:
+    """Bytes in, record chunks out: the one copy of the chunking and stop-on-error rules.
+
+    Callers push body chunks with feed() until it returns done, then call finish(); both return
+    the chunks of records to pass to `scorer.score` (inline, in a thread or in a pool process),
+    and summary() is the last line. An oversized record ends the input: what was read before it
+    is still scored and the summary carries the error.
+    """
+    def __init__(self, fmt: str, chunk_rows: int = IMPACT_STREAM_CHUNK_ROWS):
+        self.reader = _RecordReader(fmt)
+        self.scorer = _StreamScorer()
+        self.chunk_rows = chunk_rows
+        self.error: Optional[str] = None
+        self._pending: List[tuple] = []
+
+    @property
+    def done(self) -> bool:
+        return self.error is not None
+
+    def feed(self, data: bytes) -> List[List[tuple]]:
+        try:
+            self._pending.extend(self.reader.feed(data))
+        except RecordTooLarge as e:
+            self._pending.extend(e.records)
+            self.error = str(e)
+        full = len(self._pending) // self.chunk_rows * self.chunk_rows
+        chunks = [self._pending[i:i + self.chunk_rows] for i in range(0, full, self.chunk_rows)]
+        del self._pending[:full]
+        return chunks
+
+    def finish(self) -> List[List[tuple]]:
+        if self.error is None:
+            try:
+                self._pending.extend(self.reader.close())
+            except RecordTooLarge as e:
+                self._pending.extend(e.records)
+                self.error = str(e)
+        chunks = [self._pending[i:i + self.chunk_rows] for i in range(0, len(self._pending), self.chunk_rows)]
+        self._pending = []
+        return chunks
+
+    def summary(self) -> str:
+        return self.scorer.summary(error=self.error)
+
+def score_stream(chunks, fmt: str = "ndjson", chunk_rows: int = IMPACT_STREAM_CHUNK_ROWS):
+    """Synchronous pipeline: iterable of byte chunks -> iterator of NDJSON text blocks."""
+    pipeline = _StreamPipeline(fmt, chunk_rows)
+    for data in chunks:
+        for records in pipeline.feed(data):
+            yield pipeline.scorer.score(records)
+        if pipeline.done:
+            break
+    for records in pipeline.finish():
+        yield pipeline.scorer.score(records)
+    yield pipeline.summary()
+
+class _DuplexStreamingResponse(StreamingResponse):
+    """StreamingResponse whose body iterator reads the request body itself.
+
+    The stock class (for ASGI spec < 2.4) runs a disconnect listener that also
+    calls receive() and would swallow upload chunks; here the iterator is the
+    only reader and request.stream() raises ClientDisconnect on its own.
+    """
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.stream_response(send)
+        except OSError:
+            raise ClientDisconnect()
+        if self.background is not None:
+            await self.background()
+
+def _stream_format(request: Request, fmt: Optional[str]) -> str:
+    if fmt:
+        return fmt
+    return "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+
+@router.post("/api/impact/stream")
+async def reaction_impact_stream(
+    request: Request,
+    fmt: Optional[Literal["ndjson", "csv"]] = Query(default=None, alias="format"),
+):
+    fmt = _stream_format(request, fmt)
+
+    async def body():
+        # score_stream's loop with an async source; scoring runs in the thread pool.
+        pipeline = _StreamPipeline(fmt)
+        async for data in request.stream():
+            for records in pipeline.feed(data):
+                yield await run_in_threadpool(pipeline.scorer.score, records)
+            if pipeline.done:
+                break
+        for records in pipeline.finish():
+            yield await run_in_threadpool(pipeline.scorer.score, records)
+        yield pipeline.summary()
+
+    return _DuplexStreamingResponse(body(), media_type="application/x-ndjson")
+
+# ------------------------------------------------------------------------------
+# Parameter Sweep (Cartesian grid over a base reaction)
+# ------------------------------------------------------------------------------
+# The simulator sliders explore one base payload along a few fields. Instead of
+# one /api/impact/compute call per slider position, the sweep tiles the base
+# reaction's columns across the grid and runs _impact_kernel on them. Tiling
+# copies every reactant, solvent and catalyst row once per point, so the grid
+# is built and evaluated in chunks of at most IMPACT_TILE_CHUNK_ROWS tiled rows
+# and only the per-point metrics are kept: memory follows the chunk size, not
+# points x children.
+# Fields are addressed by dotted path ("solvents.0.recovery_pct" or
+# "solvents[0].recovery_pct"); conditions.mode takes mode names as values.
+IMPACT_SWEEP_MAX_POINTS = int(os.getenv("IMPACT_SWEEP_MAX_POINTS", "250000"))
+IMPACT_TILE_CHUNK_ROWS = int(os.getenv("IMPACT_TILE_CHUNK_ROWS", "262144"))
+
+# (section, field) -> kernel column. Child sections need an index in the path.
+_SWEEP_COLUMNS = {
+    ("product", "mw"): "product_mw",
+    ("product", "actual_mass_g"): "product_mass_g",
+    ("product", "carbon_atoms"): "product_carbon",
+    ("workup", "aqueous_washes_g"): "aqueous_washes_g",
+    ("workup", "drying_agents_g"): "drying_agents_g",
+    ("conditions", "time_h"): "time_h",
+    ("reactants", "mw"): "r_mw",
+    ("reactants", "mass_g"): "r_mass",
+    ("reactants", "carbon_atoms"): "r_carbon",
+    ("reactants", "eq_used"): "r_eq_used",
+    ("reactants", "eq_stoich"): "r_eq_stoich",
+    ("solvents", "mass_g"): "s_mass",
+    ("solvents", "recovery_pct"): "s_rec",
+    ("catalysts", "mass_g"): "c_mass",
+}
+_CHILD_PREFIX = {"reactants": "r", "solvents": "s", "catalysts": "c"}
+
+# Metric -> decimals, matching the rounding in compute_impact.
+_METRIC_DECIMALS = {
+    "atom_economy_pct": 2,
+    "pmi": 3,
+    "e_factor": 3,
+    "water_mL_per_g": 2,
+    "energy_kWh_per_g": 6,
+    "rme_pct": 2,
+    "carbon_efficiency_pct": 2,
+    "sf_overall": 4,
+}
+
+class SweepAxis(BaseModel):
+    field: str = Field(description="Dotted path into ReactionImpactIn, e.g. 'solvents.0.recovery_pct' or 'conditions.mode'")
+    values: Optional[List[Union[float, str]]] = Field(default=None, min_items=1, description="Explicit values")
+    start: Optional[float] = Field(default=None, description="Range start (with stop and num)")
+    stop: Optional[float] = Field(default=None, description="Range stop, inclusive")
+    num: Optional[int] = Field(default=None, ge=1, description="Number of evenly spaced points")
+
+class SweepIn(BaseModel):
+    base: ReactionImpactIn
+    axes: List[SweepAxis] = Field(min_items=1)
+    metrics: Optional[List[str]] = Field(default=None, description="Subset of metrics to return (default: all)")
+
+class SweepOut(BaseModel):
+    axes: List[Dict[str, Any]]
+    shape: List[int]
+    points: int
+    metrics: Dict[str, Any]
+
+def _split_path(path: str) -> List[str]:
+    return re.sub(r"\[(\d+)\]", r".\1", path.strip()).split(".")
+
+def _set_path(data: Dict[str, Any], parts: List[str], value: Any) -> None:
+    node = data
+    for part in parts[:-1]:
+        node = node[int(part)] if isinstance(node, list) else node[part]
+    node[parts[-1]] = value
+
+def _axis_values(axis: SweepAxis) -> list:
+    if axis.values is not None:
+        return list(axis.values)
+    if axis.start is None or axis.stop is None or axis.num is None:
+        raise HTTPException(status_code=400, detail=f"Axis '{axis.field}': give 'values' or 'start', 'stop' and 'num'.")
+    return np.linspace(axis.start, axis.stop, axis.num).tolist()
+
+def _get_path(data: Dict[str, Any], parts: List[str]) -> Any:
+    node = data
+    for part in parts:
+        node = node[int(part)] if isinstance(node, list) else node[part]
+    return node
+
+def _resolve_field(base: ReactionImpactIn, path: str) -> tuple:
+    """Map a dotted field path to (parts, kernel column, child index or None)."""
+    parts = _split_path(path)
+    if parts == ["conditions", "mode"]:
+        return parts, "mode", None
+    if len(parts) == 4 and parts[:2] == ["options", "energy_presets_kw"] and parts[3] in ("kw", "duty"):
+        presets = base.options.energy_presets_kw
+        active = base.conditions.mode if base.conditions.mode in presets else "other"
+        if parts[2] != active:
+            raise HTTPException(status_code=400, detail=f"'{path}' is not the preset used by conditions.mode ('{active}').")
+        return parts, parts[3], None
+    if len(parts) == 2 and (parts[0], parts[1]) in _SWEEP_COLUMNS and parts[0] not in _CHILD_PREFIX:
+        return parts, _SWEEP_COLUMNS[(parts[0], parts[1])], None
+    if len(parts) == 3 and parts[1].isdigit() and (parts[0], parts[2]) in _SWEEP_COLUMNS:
+        child = int(parts[1])
+        if child >= len(getattr(base, parts[0])):
+            raise HTTPException(status_code=400, detail=f"'{path}': index out of range.")
+        return parts, _SWEEP_COLUMNS[(parts[0], parts[2])], child
+    raise HTTPException(status_code=400, detail=f"'{path}' is not a supported numeric field.")
+
+def _assign_column(c: Dict[str, "np.ndarray"], base: ReactionImpactIn, parts: List[str], column: str,
+                   child: Optional[int], values: "np.ndarray", points: int) -> None:
+    """Overwrite one field across all tiled copies of the base reaction."""
+    if child is None:
+        c[column] = values
+    else:
+        per_row = len(getattr(base, parts[0]))
+        col = c[column].reshape(points, per_row).copy()
+        col[:, child] = values
+        c[column] = col.ravel()
+
+def _resolve_axis(base: ReactionImpactIn, axis: SweepAxis) -> tuple:
+    """Returns (parts, column, child_index, values) after checking the values against the schema."""
+    parts, column, child = _resolve_field(base, axis.field)
+    values = _axis_values(axis)
+
+    if column != "mode":
+        try:
+            values = [float(v) for v in values]
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail=f"Axis '{axis.field}' needs numeric values.")
+        # Bounds are monotone (ge/gt/le), so checking the extremes covers every value.
+        checks = sorted({min(values), max(values)})
+        if column in ("r_carbon", "product_carbon"):
+            if any(v != int(v) for v in values):
+                raise HTTPException(status_code=400, detail=f"Axis '{axis.field}' needs integer values.")
+            checks = [int(v) for v in checks]
+    else:
+        checks = list(dict.fromkeys(values))
+
+    data = base.model_dump()
+    for v in checks:
+        _set_path(data, parts, v)
+        try:
+            ReactionImpactIn.model_validate(data)
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False))
+    return parts, column, child, values
+
+def _tile_columns(c: Dict[str, "np.ndarray"], g: int) -> Dict[str, "np.ndarray"]:
+    """Repeat a single-reaction column set g times (one copy per grid point)."""
+    out: Dict[str, Any] = {"n": g}
+    for key, arr in c.items():
+        if key == "n":
+            continue
+        prefix = key.split("_", 1)[0]
+        if prefix in _CHILD_PREFIX.values():
+            if key.endswith("_owner"):
+                out[key] = np.repeat(np.arange(g, dtype=np.intp), len(arr))
+            else:
+                out[key] = np.tile(arr, g)
+        else:
+            out[key] = np.repeat(arr, g)
+    return out
+
+def _tiled_kernel(c1: Dict[str, "np.ndarray"], points: int,
+                  fill: Callable[[Dict[str, "np.ndarray"], int, int], None]) -> Dict[str, "np.ndarray"]:
+    """Per-reaction _impact_kernel output for `points` copies of single-reaction columns c1.
+
+    Copies are tiled and evaluated IMPACT_TILE_CHUNK_ROWS rows (reaction + child
+    rows) at a time; fill(c, start, stop) sets the values of points start..stop
+    on a chunk. Every point is computed independently, so chunking does not
+    change any value.
+    """
+    rows_per_point = 1 + len(c1["r_owner"]) + len(c1["s_owner"]) + len(c1["c_owner"])
+    step = max(1, IMPACT_TILE_CHUNK_ROWS // rows_per_point)
+    chunks: List[Dict[str, "np.ndarray"]] = []
+    for start in range(0, points, step):
+        stop = min(points, start + step)
+        c = _tile_columns(c1, stop - start)
+        fill(c, start, stop)
+        m = _impact_kernel(c)
+        del m["sf_pair"]  # per reactant row, not per point
+        chunks.append(m)
+    if len(chunks) == 1:
+        return chunks[0]
+    return {k: np.concatenate([m[k] for m in chunks]) for k in chunks[0]}
+
+def _axis_arrays(base: ReactionImpactIn, column: str, values: list) -> Dict[str, "np.ndarray"]:
+    """Kernel column -> one float64 value per axis value (conditions.mode sets kw and duty)."""
+    if column == "mode":
+        presets = base.options.energy_presets_kw
+        kw_duty = [presets.get(v, presets["other"]) for v in values]
+        return {"kw": np.asarray([p["kw"] for p in kw_duty], dtype=np.float64),
+                "duty": np.asarray([p["duty"] for p in kw_duty], dtype=np.float64)}
+    return {column: np.asarray(values, dtype=np.float64)}
+
+def _apply_axis(c: Dict[str, "np.ndarray"], base: ReactionImpactIn, parts: List[str], child: Optional[int],
+                arrays: Dict[str, "np.ndarray"], idx: "np.ndarray", points: int) -> None:
+    """Set an axis (from _axis_arrays) on tiled columns; point i takes the value at idx[i]."""
+    for column, values in arrays.items():
+        _assign_column(c, base, parts, column, child, values[idx], points)
+
+def _nan_to_none(arr: "np.ndarray") -> list:
+    if not np.isnan(arr).any():
+        return arr.tolist()
+    obj = arr.astype(object)
+    obj[np.isnan(arr)] = None
+    return obj.tolist()
+
+def compute_sweep(payload: SweepIn, max_points: int = IMPACT_SWEEP_MAX_POINTS) -> Dict[str, Any]:
+    base = payload.base
+    if not base.reactants:
+        raise HTTPException(status_code=400, detail="Provide at least one reactant.")
+    metrics = payload.metrics or list(_METRIC_DECIMALS)
+    unknown = [m for m in metrics if m not in _METRIC_DECIMALS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown metrics: {unknown}")
+
+    axes = [_resolve_axis(base, a) for a in payload.axes]
+    shape = [len(values) for *_, values in axes]
+    points = int(np.prod(shape))
+    if points > max_points:
+        raise HTTPException(status_code=413, detail=f"Grid too large: {points} points (max {max_points}).")
+
+    grid = np.indices(shape).reshape(len(shape), -1)
+    arrays = [_axis_arrays(base, column, values) for _, column, _, values in axes]
+
+    def fill(c: Dict[str, "np.ndarray"], start: int, stop: int) -> None:
+        for (parts, _, child, _), axis, idx in zip(axes, arrays, grid):
+            _apply_axis(c, base, parts, child, axis, idx[start:stop], stop - start)
+
+    try:
+        m = _tiled_kernel(_impact_columns([base], [_energy_preset(base)]), points, fill)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid input: {e}")
+
+    return {
+        "axes": [{"field": a.field, "values": values} for a, (*_, values) in zip(payload.axes, axes)],
+        "shape": shape,
+        "points": points,
+        "metrics": {k: _nan_to_none(np.round(m[k], _METRIC_DECIMALS[k]).reshape(shape)) for k in metrics},
+    }
+
+@router.post("/api/impact/sweep", response_model=SweepOut)
+def reaction_impact_sweep(payload: SweepIn):
+    return compute_sweep(payload)
+
+# ------------------------------------------------------------------------------
+# Uncertainty (Monte Carlo propagation through the impact kernel)
+# ------------------------------------------------------------------------------
+# Weighed masses, recoveries and heating duty cycles are uncertain. Each
+# distribution replaces one numeric field of the base reaction with random
+# draws; the samples are evaluated through _tiled_kernel (bounded chunks of
+# tiled rows, like the sweep) and summarized as percentiles and histograms. Draws are clipped to the field's schema bounds
+# (e.g. recovery_pct to 0-100, masses to >= 0).
+IMPACT_MC_MAX_SAMPLES = int(os.getenv("IMPACT_MC_MAX_SAMPLES", "50000"))
+
+_SECTION_MODELS = {
+    "product": Product,
+    "reactants": Reactant,
+    "solvents": Solvent,
+    "catalysts": Catalyst,
+    "workup": Workup,
+    "conditions": Conditions,
+}
+
+class Distribution(BaseModel):
+    field: str = Field(description="Dotted path, e.g. 'reactants.0.mass_g' or 'options.energy_presets_kw.hotplate.duty'")
+    dist: Literal["normal", "uniform", "triangular"]
+    mean: Optional[float] = Field(default=None, description="normal: mean (default: base value)")
+    sd: Optional[float] = Field(default=None, ge=0, description="normal: standard deviation")
+    low: Optional[float] = Field(default=None, description="uniform / triangular: lower limit")
+    high: Optional[float] = Field(default=None, description="uniform / triangular: upper limit")
+    mode: Optional[float] = Field(default=None, description="triangular: most likely value (default: base value)")
+
+class UncertaintyIn(BaseModel):
+    base: ReactionImpactIn
+    distributions: List[Distribution] = Field(min_items=1)
+    samples: int = Field(default=10000, ge=100)
+    seed: Optional[int] = Field(default=None, ge=0, description="RNG seed; the seed used is echoed back")
+    percentiles: List[float] = Field(default_factory=lambda: [2.5, 5, 25, 50, 75, 95, 97.5])
+    bins: int = Field(default=30, ge=1, le=200)
+    metrics: Optional[List[str]] = Field(default=None, description="Subset of metrics to return (default: all)")
+
+class MetricDistribution(BaseModel):
+    n_valid: int
+    mean: Optional[float] = None
+    std: Optional[float] = None
+    percentiles: Dict[str, Optional[float]] = {}
+    histogram: Dict[str, List[float]] = {}
+
+class UncertaintyOut(BaseModel):
+    samples: int
+    seed: int
+    nominal: Dict[str, Optional[float]]
+    metrics: Dict[str, MetricDistribution]
+
+def _field_bounds(parts: List[str]) -> tuple:
+    """(low, high) a sampled value is clipped to, taken from the field's ge/gt/le constraints."""
+    if parts[0] == "options":
+        return 0.0, None
+    low = high = None
+    for meta in _SECTION_MODELS[parts[0]].model_fields[parts[-1]].metadata:
+        if getattr(meta, "ge", None) is not None:
+            low = float(meta.ge)
+        if getattr(meta, "gt", None) is not None:
+            low = float(np.nextafter(float(meta.gt), np.inf))
+        if getattr(meta, "le", None) is not None:
+            high = float(meta.le)
+    return low, high
+
+def _draw(rng: "np.random.Generator", d: Distribution, base_value: Optional[float], n: int) -> "np.ndarray":
+    if d.dist == "normal":
+        mean = d.mean if d.mean is not None else base_value
+        if mean is None or d.sd is None:
+            raise HTTPException(status_code=400, detail=f"'{d.field}': normal needs 'sd' (and 'mean' when the base value is empty).")
+        return rng.normal(mean, d.sd, n)
+    if d.low is None or d.high is None or d.low > d.high:
+        raise HTTPException(status_code=400, detail=f"'{d.field}': {d.dist} needs 'low' <= 'high'.")
+    if d.dist == "uniform":
+        return rng.uniform(d.low, d.high, n)
+    mode = d.mode if d.mode is not None else base_value
+    if mode is None or not d.low <= mode <= d.high:
+        raise HTTPException(status_code=400, detail=f"'{d.field}': triangular needs low <= mode <= high.")
+    if d.low == d.high:
+        return np.full(n, d.low)
+    return rng.triangular(d.low, mode, d.high, n)
+
+def _summarize(values: "np.ndarray", decimals: int, percentiles: List[float], bins: int) -> Dict[str, Any]:
+    finite = values[np.isfinite(values)]
+    if finite.size == 0:
+        return {"n_valid": 0}
+    pct = np.percentile(finite, percentiles)
+    counts, edges = np.histogram(finite, bins=bins)
+    return {
+        "n_valid": int(finite.size),
+        "mean": round(float(finite.mean()), decimals),
+        "std": round(float(finite.std()), decimals),
+        "percentiles": {f"{q:g}": round(v, decimals) for q, v in zip(percentiles, pct.tolist())},
+        "histogram": {"edges": [round(e, decimals) for e in edges.tolist()], "counts": counts.tolist()},
+    }
+
+def compute_uncertainty(payload: UncertaintyIn, max_samples: int = IMPACT_MC_MAX_SAMPLES) -> Dict[str, Any]:
+    base = payload.base
+    if not base.reactants:
+        raise HTTPException(status_code=400, detail="Provide at least one reactant.")
+    if payload.samples > max_samples:
+        raise HTTPException(status_code=413, detail=f"Too many samples: {payload.samples} (max {max_samples}).")
+    if any(not 0 <= q <= 100 for q in payload.percentiles):
+        raise HTTPException(status_code=400, detail="Percentiles must be within 0-100.")
+    metrics = payload.metrics or list(_METRIC_DECIMALS)
+    unknown = [m for m in metrics if m not in _METRIC_DECIMALS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown metrics: {unknown}")
+
+    seed = payload.seed if payload.seed is not None else int(np.random.SeedSequence().entropy % (2**63))
+    rng = np.random.default_rng(seed)
+    n = payload.samples
+    data = base.model_dump()
+
+    try:
+        c1 = _impact_columns([base], [_energy_preset(base)])
+        nominal = _impact_kernel(c1)
+        sampled = []
+        for d in payload.distributions:
+            parts, column, child = _resolve_field(base, d.field)
+            if column == "mode":
+                raise HTTPException(status_code=400, detail="conditions.mode is categorical; use /api/impact/sweep.")
+            base_value = _get_path(data, parts)
+            draws = np.clip(_draw(rng, d, base_value, n), *_field_bounds(parts))
+            if column in ("r_carbon", "product_carbon"):
+                draws = np.rint(draws)
+            sampled.append((parts, column, child, draws))
+
+        def fill(c: Dict[str, "np.ndarray"], start: int, stop: int) -> None:
+            for parts, column, child, draws in sampled:
+                _assign_column(c, base, parts, column, child, draws[start:stop], stop - start)
+
+        m = _tiled_kernel(c1, n, fill)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid input: {e}")
+
+    return {
+        "samples": n,
+        "seed": seed,
+        "nominal": {k: _round_or_none(float(nominal[k][0]), _METRIC_DECIMALS[k]) for k in metrics},
+        "metrics": {k: _summarize(m[k], _METRIC_DECIMALS[k], payload.percentiles, payload.bins) for k in metrics},
+    }
+
+@router.post("/api/impact/uncertainty", response_model=UncertaintyOut)
+def reaction_impact_uncertainty(payload: UncertaintyIn):
+    return compute_uncertainty(payload)
+
+# ------------------------------------------------------------------------------
+# Pareto comparison of reaction variants (non-dominated sets)
+# ------------------------------------------------------------------------------
+# Variants of one transformation are scored in one vectorized pass, either as
+# full reactions ("items", like compute-batch) or as per-variant values for a
+# few fields of a shared base reaction ("base" + "overrides": sweep axes with
+# one value per variant instead of a grid, tiled in bounded chunks like the
+# sweep). Objectives are compared on the
+# values as reported (rounded like compute_impact); maximized metrics are
+# negated so dominance is always "<= everywhere, < somewhere".
+#
+# The frontier is found with a sort-filter skyline: variants are sorted so
+# none can be dominated by a later one (_skyline_order), so each block of
+# candidates is checked (vectorized) against the frontier found so far and
+# within itself, never against the whole set - O(n x frontier size) instead
+# of O(n^2).
+# Ranks peel further fronts the same way, up to `fronts`; variants beyond
+# them, or with an undefined objective, get rank null. dominated_by counts the
+# frontier variants that beat each variant (0 on the frontier).
+#
+# The two input forms have different caps on purpose. "items" are whole
+# reactions in the request body, each validated into ReactionImpactIn models
+# like compute-batch: about 11 KB of peak memory and 0.1 ms per variant
+# (10k items: +115 MB, 1 s), so they keep compute-batch's
+# IMPACT_BATCH_MAX_ITEMS. Overrides are one number per variant and field,
+# tiled in bounded chunks, so 100k+ variants fit in IMPACT_PARETO_MAX_VARIANTS.
+IMPACT_PARETO_MAX_VARIANTS = int(os.getenv("IMPACT_PARETO_MAX_VARIANTS", "200000"))
+PARETO_MAX_FRONTS = 10
+_PARETO_BLOCK = 512
+_PARETO_MATRIX_CELLS = 1 << 22  # bound on block x front x objectives comparisons held at once
+_PARETO_DEFAULT_OBJECTIVES = ["pmi", "e_factor", "water_mL_per_g", "energy_kWh_per_g", "atom_economy_pct"]
+_MAXIMIZED_METRICS = frozenset({"atom_economy_pct", "rme_pct", "carbon_efficiency_pct"})
+
+class ParetoIn(BaseModel):
+    items: Optional[List[Dict[str, Any]]] = Field(default=None, description="One ReactionImpactIn object per variant")
+    base: Optional[ReactionImpactIn] = Field(default=None, description="Shared reaction the overrides apply to")
+    overrides: Optional[Dict[str, List[Union[float, str]]]] = Field(
+        default=None, description="Dotted field path -> one value per variant, e.g. {'solvents.0.recovery_pct': [0, 50, 90]}")
+    objectives: Optional[List[str]] = Field(default=None, description="Metrics to compare (default: pmi, e_factor, water_mL_per_g, energy_kWh_per_g, atom_economy_pct)")
+    fronts: int = Field(default=1, ge=1, le=PARETO_MAX_FRONTS, description="Fronts to rank (1 = frontier only)")
+
+class ParetoMember(BaseModel):
+    index: int
+    metrics: Dict[str, float]
+    dominates: int
+
+class ParetoOut(BaseModel):
+    count: int
+    ranked_count: int
+    objectives: Dict[str, Literal["min", "max"]]
+    frontier: List[ParetoMember]
+    rank: List[Optional[int]]
+    dominated_by: List[Optional[int]]
+    errors: List[ImpactBatchItem]
+
+def _dominance(a: "np.ndarray", b: "np.ndarray") -> "np.ndarray":
+    """(len(a), len(b)) matrix: a[i] dominates b[j], all objectives minimized."""
+    # One 2-D comparison per objective; reducing a (n, m, d) array over its short last axis is ~6x slower.
+    no_worse = np.ones((len(a), len(b)), dtype=bool)
+    better = np.zeros((len(a), len(b)), dtype=bool)
+    for k in range(a.shape[1]):
+        x, y = a[:, k, None], b[None, :, k]
+        no_worse &= x <= y
+        better |= x < y
+    return no_worse & better
+
+def _skyline_order(points: "np.ndarray", rows: "np.ndarray") -> "np.ndarray":
+    """`rows` sorted so that no row is dominated by a later one.
+
+    Primary key is the sum of min-max normalized objectives: it cannot decrease
+    from a row to one it dominates, and it puts likely dominators first, so
+    the frontier fills with strong rows early and rejects most candidates in
+    one comparison. Lexicographic order breaks ties.
+    """
+    sub = points[rows]
+    lo, span = sub.min(axis=0), np.ptp(sub, axis=0)
+    score = ((sub - lo) / np.where(span > 0, span, 1.0)).sum(axis=1)
+    return rows[np.lexsort((*sub.T[::-1], score))]
+
+def pareto_front(points: "np.ndarray", order: "np.ndarray") -> "np.ndarray":
+    """Positions in `order` of its non-dominated rows; `order` comes from _skyline_order."""
+    chunk = max(1, _PARETO_MATRIX_CELLS // (_PARETO_BLOCK * points.shape[1]))
+    found: List["np.ndarray"] = []
+    front = points[:0]
+    for start in range(0, len(order), _PARETO_BLOCK):
+        pos = np.arange(start, min(start + _PARETO_BLOCK, len(order)))
+        block = points[order[pos]]
+        alive = np.ones(len(pos), dtype=bool)
+        for fs in range(0, len(front), chunk):
+            alive &= ~_dominance(front[fs:fs + chunk], block).any(axis=0)
+        pos, block = pos[alive], block[alive]
+        # Dominance is transitive: comparing against dominated block members changes nothing.
+        alive = ~_dominance(block, block).any(axis=0)
+        found.append(pos[alive])
+        front = np.concatenate([front, block[alive]])
+    return np.concatenate(found) if found else np.empty(0, dtype=np.intp)
+
+def _variant_metrics(payload: ParetoIn) -> tuple:
+    """Kernel output for the valid variants, their indices in the request, the variant count and errors."""
+    if (payload.items is None) == (payload.base is None):
+        raise HTTPException(status_code=400, detail="Provide exactly one of 'items' or 'base' (with 'overrides').")
+    if payload.items is not None:
+        if len(payload.items) > IMPACT_BATCH_MAX_ITEMS:
+            raise HTTPException(status_code=413, detail=f"Too many variants: {len(payload.items)} items (max {IMPACT_BATCH_MAX_ITEMS}; "
+                                                        f"base + overrides allows {IMPACT_PARETO_MAX_VARIANTS}).")
+        valid, presets, positions, errors = [], [], [], []
+        for i, row in enumerate(payload.items):
+            try:
+                p = ReactionImpactIn.model_validate(row)
+                if not p.reactants:
+                    raise HTTPException(status_code=400, detail="Provide at least one reactant.")
+                presets.append(_energy_preset(p))
+            except ValidationError as e:
+                errors.append({"index": i, "ok": False, "error": {"status_code": 422, "detail": e.errors(include_url=False, include_context=False)}})
+                continue
+            except HTTPException as e:
+                errors.append({"index": i, "ok": False, "error": {"status_code": e.status_code, "detail": e.detail}})
+                continue
+            except Exception as e:
+                errors.append({"index": i, "ok": False, "error": {"status_code": 400, "detail": f"Invalid input: {e}"}})
+                continue
+            valid.append(p)
+            positions.append(i)
+        m = _impact_kernel(_impact_columns(valid, presets)) if valid else None
+        return m, np.asarray(positions, dtype=np.intp), len(payload.items), errors
+
+    base = payload.base
+    if not base.reactants:
+        raise HTTPException(status_code=400, detail="Provide at least one reactant.")
+    overrides = payload.overrides or {}
+    lengths = {len(v) for v in overrides.values()}
+    if len(lengths) != 1:
+        raise HTTPException(status_code=400, detail="Give 'overrides' as one or more lists of the same length (one value per variant).")
+    n = lengths.pop()
+    if n > IMPACT_PARETO_MAX_VARIANTS:
+        raise HTTPException(status_code=413, detail=f"Too many variants: {n} (max {IMPACT_PARETO_MAX_VARIANTS}).")
+    resolved = [_resolve_axis(base, SweepAxis(field=field, values=values)) for field, values in overrides.items()]
+    # Converted once: a chunk only indexes its slice of the (up to n-long) override arrays.
+    arrays = [(parts, child, _axis_arrays(base, column, values)) for parts, column, child, values in resolved]
+
+    def fill(c: Dict[str, "np.ndarray"], start: int, stop: int) -> None:
+        idx = np.arange(start, stop)
+        for parts, child, axis in arrays:
+            _apply_axis(c, base, parts, child, axis, idx, stop - start)
+
+    try:
+        m = _tiled_kernel(_impact_columns([base], [_energy_preset(base)]), n, fill)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid input: {e}")
+    return m, np.arange(n), n, []
+
+def compare_variants(payload: ParetoIn) -> Dict[str, Any]:
+    objectives = payload.objectives or _PARETO_DEFAULT_OBJECTIVES
+    unknown = [k for k in objectives if k not in _METRIC_DECIMALS]
+    if unknown or not objectives:
+        raise HTTPException(status_code=400, detail=f"Unknown or missing objectives: {unknown} (choose from {list(_METRIC_DECIMALS)})")
+    objectives = list(dict.fromkeys(objectives))
+    m, positions, count, errors = _variant_metrics(payload)
+
+    rank = np.zeros(count, dtype=np.intp)            # 0 = unranked
+    dominated_by = np.full(count, -1, dtype=np.intp)  # -1 = not comparable
+    frontier: List[Dict[str, Any]] = []
+    ranked_count = 0
+    if m is not None:
+        values = np.column_stack([np.round(m[k], _METRIC_DECIMALS[k]) for k in objectives])
+        points = np.where([k in _MAXIMIZED_METRICS for k in objectives], -values, values)
+        rows = np.flatnonzero(~np.isnan(points).any(axis=1))
+        ranked_count = len(rows)
+        remaining = _skyline_order(points, rows) if ranked_count else rows
+
+        for r in range(1, payload.fronts + 1):
+            if not len(remaining):
+                break
+            pos = pareto_front(points, remaining)
+            if r == 1:
+                front_rows = remaining[pos]
+            rank[positions[remaining[pos]]] = r
+            keep = np.ones(len(remaining), dtype=bool)
+            keep[pos] = False
+            remaining = remaining[keep]
+
+        if ranked_count:
+            front = points[front_rows]
+            dominates = np.zeros(len(front_rows), dtype=np.intp)
+            chunk = max(1, _PARETO_MATRIX_CELLS // (len(front_rows) * len(objectives)))
+            for start in range(0, len(rows), chunk):
+                dom = _dominance(front, points[rows[start:start + chunk]])
+                dominated_by[positions[rows[start:start + chunk]]] = dom.sum(axis=0)
+                dominates += dom.sum(axis=1)
+            front_values = values[front_rows].tolist()
+            frontier = [
+                {"index": int(i), "metrics": dict(zip(objectives, v)), "dominates": int(d)}
+                for i, v, d in zip(positions[front_rows], front_values, dominates)
+            ]
+
+    rank_out = rank.astype(object)
+    rank_out[rank == 0] = None
+    dominated_out = dominated_by.astype(object)
+    dominated_out[dominated_by < 0] = None
+    return {
+        "count": count,
+        "ranked_count": ranked_count,
+        "objectives": {k: "max" if k in _MAXIMIZED_METRICS else "min" for k in objectives},
+        "frontier": frontier,
+        "rank": rank_out.tolist(),
+        "dominated_by": dominated_out.tolist(),
+        "errors": errors,
+    }
+
+@router.post("/api/impact/pareto", response_model=ParetoOut)
+def reaction_impact_pareto(payload: ParetoIn):
+    return compare_variants(payload)
+
+# ------------------------------------------------------------------------------
+# Metric registry and formula engine (built-in and custom metrics)
+# ------------------------------------------------------------------------------
+# Every metric, built-in or custom, is a formula over per-reaction variables
+# (kernel aggregates such as total_input_mass_g, product fields, kWh) and child
+# aggregates such as sum_solvents(mass_g * lookup("weight", 1)). Formulas use
+# Python expression syntax but are parsed with `ast` and only a whitelist of
+# nodes is compiled: numbers, names, arithmetic, comparisons, and/or/not,
+# `a if c else b` and the functions in _FORMULA_FUNCTIONS. No attribute access,
+# subscripts, lambdas or comprehensions. The result is a tree of closures over
+# numpy ufuncs, so one compiled formula scores a single reaction or a whole
+# batch (one array element per reaction). Compiled formulas are cached by the
+# SHA-256 of their text.
+#
+# Built-in formulas restate compute_impact's arithmetic (its scalar path and
+# _impact_kernel stay hand-written: a numpy closure tree is slower for one
+# reaction), with the float operations in the same order so values round
+# identically. tests/test_metrics.py compares /api/impact/metrics with
+# /api/impact/compute and compute-batch over a seeded corpus to keep the three
+# in sync.
+# Custom metrics are registered per process, so registering answers 503 with
+# several pre-fork workers; they can always be sent inline with an evaluation
+# request. Params are numbers, or tables keyed
+# by chemical name for lookup(); request params override definition defaults.
+FORMULA_MAX_LENGTH = 2000
+FORMULA_MAX_NODES = 400
+FORMULA_CACHE_SIZE = int(os.getenv("FORMULA_CACHE_SIZE", "1024"))
+METRIC_REGISTRY_MAX_CUSTOM = int(os.getenv("METRIC_REGISTRY_MAX_CUSTOM", "256"))
+_METRIC_NAME_RE = r"^[A-Za-z_][A-Za-z0-9_]{0,63}$"
+
+# Per-reaction variables: kernel aggregates and reaction fields.
+_FORMULA_VARIABLES = {
+    "reactant_mass_g": "Sum of reactant masses (g)",
+    "catalyst_mass_g": "Sum of catalyst masses (g)",
+    "solvent_mass_total_g": "Sum of solvent masses (g)",
+    "solvent_mass_nonrecovered_g": "Solvent mass not recovered (g)",
+    "auxiliaries_g": "Drying agents (g)",
+    "total_input_mass_g": "Reactants + catalysts + solvents + aqueous washes + auxiliaries (g)",
+    "water_g_total": "Aqueous washes + water solvents (g)",
+    "kwh": "Estimated energy: preset kW x duty x time_h (kWh)",
+    "product_mw": "product.mw",
+    "product_mass_g": "product.actual_mass_g",
+    "product_carbon": "product.carbon_atoms (nan when unknown)",
+    "aqueous_washes_g": "workup.aqueous_washes_g",
+    "drying_agents_g": "workup.drying_agents_g",
+    "time_h": "conditions.time_h",
+    "kw": "Heating preset power for conditions.mode (kW)",
+    "duty": "Heating preset duty cycle for conditions.mode",
+}
+# Fields inside sum_reactants() / sum_solvents() / sum_catalysts(); reaction
+# variables and metrics can be used there too (repeated for each child).
+_FORMULA_CHILD_FIELDS = {
+    "reactants": {"mw": "r_mw", "mass_g": "r_mass", "carbon_atoms": "r_carbon", "eq_used": "r_eq_used", "eq_stoich": "r_eq_stoich"},
+    "solvents": {"mass_g": "s_mass", "recovery_pct": "s_rec", "is_water": "s_water"},
+    "catalysts": {"mass_g": "c_mass"},
+}
+_FORMULA_CONSTANTS = {"nan": float("nan"), "inf": float("inf"), "pi": 3.141592653589793}
+_FORMULA_UNARY_FUNCTIONS = {"abs": "absolute", "sqrt": "sqrt", "log": "log", "log10": "log10", "exp": "exp"}
+_FORMULA_FUNCTIONS = (*_FORMULA_UNARY_FUNCTIONS, "isnan", "min", "max", "where", "coalesce", "lookup",
+                      *(f"sum_{section}" for section in _FORMULA_CHILD_FIELDS))
+
+_BUILTIN_METRICS = [
+    ("atom_economy_pct", "where(sum_reactants(mw) > 0, 100 * product_mw / sum_reactants(mw), nan)", "%",
+     "Product MW / sum of reactant MWs"),
+    ("pmi", "total_input_mass_g / product_mass_g", "g/g", "Process mass intensity"),
+    ("e_factor", "(total_input_mass_g - product_mass_g) / product_mass_g", "g/g", "Waste per gram of product"),
+    ("water_mL_per_g", "water_g_total / product_mass_g", "mL/g", "Water intensity"),
+    ("energy_kWh_per_g", "kwh / product_mass_g", "kWh/g", "Energy intensity"),
+    ("rme_pct", "where(reactant_mass_g > 0, product_mass_g / reactant_mass_g * 100, nan)", "%",
+     "Reaction mass efficiency"),
+    ("carbon_efficiency_pct",
+     "where(not isnan(product_carbon) and sum_reactants(isnan(carbon_atoms)) == 0"
+     " and sum_reactants(where(isnan(carbon_atoms), 0, mass_g / mw * carbon_atoms)) > 0,"
+     " product_mass_g / product_mw * product_carbon"
+     " / sum_reactants(where(isnan(carbon_atoms), 0, mass_g / mw * carbon_atoms)) * 100, nan)", "%",
+     "Carbon in product / carbon in reactants"),
+    ("sf_overall",
+     "where(sum_reactants(not isnan(eq_used) and not isnan(eq_stoich) and eq_stoich > 0) > 0"
+     " and sum_reactants(where(not isnan(eq_used) and not isnan(eq_stoich) and eq_stoich > 0, eq_stoich, 0)) > 0,"
+     " sum_reactants(where(not isnan(eq_used) and not isnan(eq_stoich) and eq_stoich > 0, eq_used, 0))"
+     " / sum_reactants(where(not isnan(eq_used) and not isnan(eq_stoich) and eq_stoich > 0, eq_stoich, 0)), nan)",
+     "eq/eq", "Stoichiometric factor: equivalents used / required"),
+]
+
+_BUILTIN_METRIC_NAMES = [name for name, *_ in _BUILTIN_METRICS]
+
+class FormulaError(ValueError):
+    pass
+
+ParamValue = Union[float, Dict[str, float]]
+
+class MetricDefinition(BaseModel):
+    name: str = Field(pattern=_METRIC_NAME_RE)
+    formula: str = Field(min_length=1, max_length=FORMULA_MAX_LENGTH)
+    decimals: int = Field(default=4, ge=0, le=12)
+    unit: Optional[str] = None
+    description: Optional[str] = None
+    params: Dict[str, ParamValue] = Field(default_factory=dict, description="Default params: numbers, or {chemical name: value} tables for lookup()")
+
+class MetricInfo(MetricDefinition):
+    builtin: bool
+
+class MetricRegistryOut(BaseModel):
+    metrics: List[MetricInfo]
+    variables: Dict[str, str]
+    child_fields: Dict[str, List[str]]
+    functions: List[str]
+
+class MetricEvaluateIn(BaseModel):
+    reaction: Optional[ReactionImpactIn] = Field(default=None, description="One reaction")
+    items: Optional[List[Dict[str, Any]]] = Field(default=None, description="Many reactions (ReactionImpactIn objects), scored in one pass")
+    metrics: Optional[List[str]] = Field(default=None, description="Metrics to return (default: built-ins plus 'formulas')")
+    formulas: List[MetricDefinition] = Field(default_factory=list, description="Metrics defined for this request only")
+    params: Dict[str, ParamValue] = Field(default_factory=dict)
+
+class CompiledFormula:
+    """A formula compiled to closures; fn(ctx) evaluates it over all reactions in ctx."""
+    __slots__ = ("text", "fn", "names", "child_names")
+
+    def __init__(self, text: str, fn, names: set, child_names: Dict[str, set]):
+        self.text = text
+        self.fn = fn
+        self.names = names              # reaction-level names used
+        self.child_names = child_names  # section -> names used inside sum_<section>()
+
+def _as_float(x):
+    return np.asarray(x, dtype=np.float64)
+
+def _truth(x):
+    return np.asarray(x) != 0
+
+def _compile_node(node, section: Optional[str], names: set, child_names: Dict[str, set]):
+    """Returns fn(ctx) for one AST node; `section` is set inside a child aggregate."""
+    rec = lambda n, s=section: _compile_node(n, s, names, child_names)
+    if isinstance(node, ast.Expression):
+        return rec(node.body)
+    if isinstance(node, ast.Constant):
+        if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+            raise FormulaError(f"Unsupported constant {node.value!r}")
+        value = float(node.value)
+        return lambda ctx: value
+    if isinstance(node, ast.Name):
+        name = node.id
+        if name in _FORMULA_CONSTANTS:
+            value = _FORMULA_CONSTANTS[name]
+            return lambda ctx: value
+        if section is None:
+            names.add(name)
+            return lambda ctx: ctx.value(name)
+        child_names.setdefault(section, set()).add(name)
+        return lambda ctx: ctx.child_value(section, name)
+    if isinstance(node, ast.BinOp):
+        ufunc = {ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply, ast.Div: np.true_divide,
+                 ast.Pow: np.power, ast.Mod: np.mod}.get(type(node.op))
+        if ufunc is None:
+            raise FormulaError(f"Operator {type(node.op).__name__} is not allowed")
+        left, right = rec(node.left), rec(node.right)
+        return lambda ctx: ufunc(left(ctx), right(ctx))
+    if isinstance(node, ast.UnaryOp):
+        operand = rec(node.operand)
+        if isinstance(node.op, ast.USub):
+            return lambda ctx: np.negative(operand(ctx))
+        if isinstance(node.op, ast.UAdd):
+            return operand
+        if isinstance(node.op, ast.Not):
+            return lambda ctx: _as_float(~_truth(operand(ctx)))
+        raise FormulaError(f"Operator {type(node.op).__name__} is not allowed")
+    if isinstance(node, ast.BoolOp):
+        combine = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+        parts = [rec(v) for v in node.values]
+        return lambda ctx: _as_float(functools.reduce(combine, (_truth(p(ctx)) for p in parts)))
+    if isinstance(node, ast.Compare):
+        ops = {ast.Lt: np.less, ast.LtE: np.less_equal, ast.Gt: np.greater, ast.GtE: np.greater_equal,
+               ast.Eq: np.equal, ast.NotEq: np.not_equal}
+        if any(type(op) not in ops for op in node.ops):
+            raise FormulaError("Only <, <=, >, >=, == and != comparisons are allowed")
+        operands = [rec(node.left)] + [rec(c) for c in node.comparators]
+        pairs = [(ops[type(op)], i) for i, op in enumerate(node.ops)]
+
+        def compare(ctx):
+            values = [o(ctx) for o in operands]
+            return _as_float(functools.reduce(np.logical_and, (op(values[i], values[i + 1]) for op, i in pairs)))
+        return compare
+    if isinstance(node, ast.IfExp):
+        test, body, orelse = rec(node.test), rec(node.body), rec(node.orelse)
+        return lambda ctx: np.where(_truth(test(ctx)), body(ctx), orelse(ctx))
+    if isinstance(node, ast.Call):
+        if not isinstance(node.func, ast.Name) or node.func.id not in _FORMULA_FUNCTIONS or node.keywords:
+            raise FormulaError(f"Unknown function; allowed: {', '.join(_FORMULA_FUNCTIONS)}")
+        fname, args = node.func.id, node.args
+
+        def arity(n: int) -> None:
+            if len(args) != n:
+                raise FormulaError(f"{fname}() takes {n} argument(s)")
+
+        if fname.startswith("sum_"):
+            arity(1)
+            if section is not None:
+                raise FormulaError(f"{fname}() cannot be nested inside sum_{section}()")
+            child = fname[len("sum_"):]
+            inner = rec(args[0], child)
+            return lambda ctx: ctx.aggregate(child, inner(ctx))
+        if fname == "lookup":
+            arity(2)
+            if section is None:
+                raise FormulaError("lookup() is only allowed inside sum_reactants(), sum_solvents() or sum_catalysts()")
+            table, default = args
+            if not (isinstance(table, ast.Constant) and isinstance(table.value, str)):
+                raise FormulaError("lookup() needs a table name in quotes, e.g. lookup(\"price_per_g\", 0)")
+            default_fn = rec(default)
+            return lambda ctx: ctx.lookup(section, table.value, default_fn(ctx))
+        fns = [rec(a) for a in args]
+        if fname in _FORMULA_UNARY_FUNCTIONS:
+            arity(1)
+            ufunc = getattr(np, _FORMULA_UNARY_FUNCTIONS[fname])
+            return lambda ctx: ufunc(fns[0](ctx))
+        if fname == "isnan":
+            arity(1)
+            return lambda ctx: _as_float(np.isnan(fns[0](ctx)))
+        if fname in ("min", "max"):
+            if len(args) < 2:
+                raise FormulaError(f"{fname}() takes at least 2 arguments")
+            ufunc = np.minimum if fname == "min" else np.maximum
+            return lambda ctx: functools.reduce(ufunc, (f(ctx) for f in fns))
+        if fname == "where":
+            arity(3)
+            return lambda ctx: np.where(_truth(fns[0](ctx)), fns[1](ctx), fns[2](ctx))
+        arity(2)  # coalesce
+
+        def coalesce(ctx):
+            x = _as_float(fns[0](ctx))
+            return np.where(np.isnan(x), fns[1](ctx), x)
+        return coalesce
+    raise FormulaError(f"{type(node).__name__} is not allowed in formulas")
+
+_formula_cache: "OrderedDict[str, CompiledFormula]" = OrderedDict()  # sha256 of the text -> compiled
+_formula_cache_lock = threading.Lock()
+
+def compile_formula(text: str) -> CompiledFormula:
+    """Parse and compile a formula (cached by content hash); raises FormulaError."""
+    key = hashlib.sha256(text.encode()).hexdigest()
+    with _formula_cache_lock:
+        hit = _formula_cache.get(key)
+        if hit is not None:
+            _formula_cache.move_to_end(key)
+            return hit
+    if len(text) > FORMULA_MAX_LENGTH:
+        raise FormulaError(f"Formula longer than {FORMULA_MAX_LENGTH} characters")
+    try:
+        tree = ast.parse(text.strip(), mode="eval")
+    except SyntaxError as e:
+        raise FormulaError(f"Syntax error at column {e.offset}: {e.msg}")
+    if sum(1 for _ in ast.walk(tree)) > FORMULA_MAX_NODES:
+        raise FormulaError(f"Formula has more than {FORMULA_MAX_NODES} terms")
+    names: set = set()
+    child_names: Dict[str, set] = {}
+    compiled = CompiledFormula(text, _compile_node(tree, None, names, child_names), names, child_names)
+    with _formula_cache_lock:
+        _formula_cache[key] = compiled
+        while len(_formula_cache) > FORMULA_CACHE_SIZE:
+            _formula_cache.popitem(last=False)
+    return compiled
+
+class _MetricContext:
+    """Variables, params and memoized metric values for one evaluation over n reactions."""
+    def __init__(self, payloads: List[ReactionImpactIn], definitions: Dict[str, MetricDefinition],
+                 params: Dict[str, ParamValue]):
+        self.payloads = payloads
+        self.c = _impact_columns(payloads, [_energy_preset(p) for p in payloads])
+        self.n = self.c["n"]
+        kernel = _impact_kernel(self.c)
+        self.variables = {name: kernel[name] if name in kernel else self.c[name] for name in _FORMULA_VARIABLES}
+        self.definitions = definitions
+        self.params = params
+        self._values: Dict[str, "np.ndarray"] = {}
+        self._active: List[str] = []
+        self._child_names: Dict[str, list] = {}
+
+    def metric(self, name: str) -> "np.ndarray":
+        if name in self._values:
+            return self._values[name]
+        if name in self._active:
+            raise FormulaError(f"Metric '{name}' depends on itself: {' -> '.join(self._active + [name])}")
+        self._active.append(name)
+        try:
+            value = np.broadcast_to(_as_float(compile_formula(self.definitions[name].formula).fn(self)), (self.n,))
+        finally:
+            self._active.pop()
+        self._values[name] = value
+        return value
+
+    def value(self, name: str):
+        if name in self.variables:
+            return self.variables[name]
+        if name in self.params:
+            param = self.params[name]
+            if isinstance(param, dict):
+                raise FormulaError(f"'{name}' is a lookup table; use lookup(\"{name}\", default) inside a sum_...()")
+            return param
+        if name in self.definitions:
+            return self.metric(name)
+        raise FormulaError(f"Unknown name '{name}'")
+
+    def child_value(self, section: str, name: str):
+        column = _FORMULA_CHILD_FIELDS[section].get(name)
+        if column is not None:
+            return _as_float(self.c[column])
+        value = self.value(name)
+        owner = self.c[f"{_CHILD_PREFIX[section]}_owner"]
+        return value[owner] if np.ndim(value) else value
+
+    def lookup(self, section: str, table: str, default):
+        values = self.params.get(table)
+        if not isinstance(values, dict):
+            raise FormulaError(f"lookup(\"{table}\", ...) needs a params table '{table}': {{chemical name: value}}")
+        if section not in self._child_names:
+            self._child_names[section] = [normalize_chemical_name(child.name or "")
+                                          for p in self.payloads for child in getattr(p, section)]
+        normalized = {normalize_chemical_name(k): v for k, v in values.items()}
+        default = np.broadcast_to(_as_float(default), (len(self._child_names[section]),))
+        return np.asarray([normalized.get(name, d) for name, d in zip(self._child_names[section], default.tolist())],
+                          dtype=np.float64)
+
+    def aggregate(self, section: str, values) -> "np.ndarray":
+        owner = self.c[f"{_CHILD_PREFIX[section]}_owner"]
+        return np.bincount(owner, weights=np.broadcast_to(_as_float(values), owner.shape), minlength=self.n)
+
+class MetricRegistry:
+    """Built-in metrics plus custom ones registered at runtime (this process only)."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._builtin = {
+            name: MetricDefinition(name=name, formula=formula, decimals=_METRIC_DECIMALS[name], unit=unit,
+                                   description=description)
+            for name, formula, unit, description in _BUILTIN_METRICS
+        }
+        self._custom: Dict[str, MetricDefinition] = {}
+
+    def definitions(self) -> Dict[str, MetricDefinition]:
+        with self._lock:
+            return {**self._custom, **self._builtin}
+
+    def describe(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return ([{**d.model_dump(), "builtin": True} for d in self._builtin.values()] +
+                    [{**d.model_dump(), "builtin": False} for d in self._custom.values()])
+
+    def register(self, definition: MetricDefinition) -> None:
+        with self._lock:
+            if definition.name not in self._custom and len(self._custom) >= METRIC_REGISTRY_MAX_CUSTOM:
+                raise HTTPException(status_code=400, detail=f"Registry full ({METRIC_REGISTRY_MAX_CUSTOM} custom metrics)")
+            check_metric_definitions([definition], {**self._custom, **self._builtin}, definition.params)
+            self._custom[definition.name] = definition
+
+    def remove(self, name: str) -> bool:
+        with self._lock:
+            return self._custom.pop(name, None) is not None
+
+metric_registry = MetricRegistry()
+
+def _metric_dependencies(definition: MetricDefinition) -> set:
+    compiled = compile_formula(definition.formula)
+    return compiled.names.union(*compiled.child_names.values())
+
+def check_metric_definitions(new: List[MetricDefinition], known: Dict[str, MetricDefinition],
+                             params: Dict[str, ParamValue]) -> Dict[str, MetricDefinition]:
+    """Compile new definitions and check names and cycles; returns known + new. Raises HTTPException(400)."""
+    definitions = dict(known)
+    reserved = {*_FORMULA_VARIABLES, *_FORMULA_CONSTANTS, *_FORMULA_FUNCTIONS, *_BUILTIN_METRIC_NAMES}
+    for d in new:
+        if d.name in reserved:
+            raise HTTPException(status_code=400, detail=f"'{d.name}' is a built-in metric, variable or function name")
+        try:
+            compile_formula(d.formula)
+        except FormulaError as e:
+            raise HTTPException(status_code=400, detail=f"Metric '{d.name}': {e}")
+        definitions[d.name] = d
+    for d in new:
+        compiled = compile_formula(d.formula)
+        allowed = {*_FORMULA_VARIABLES, *definitions, *d.params, *params}
+        unknown = {n for n in compiled.names if n not in allowed}
+        for section, used in compiled.child_names.items():
+            unknown |= {n for n in used if n not in allowed and n not in _FORMULA_CHILD_FIELDS[section]}
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Metric '{d.name}' uses unknown names: {sorted(unknown)}")
+        path, stack = [d.name], [iter(_metric_dependencies(d))]
+        while stack:
+            dep = next(stack[-1], None)
+            if dep is None:
+                stack.pop()
+                path.pop()
+            elif dep == d.name:
+                raise HTTPException(status_code=400, detail=f"Metric '{d.name}' depends on itself: {' -> '.join(path + [dep])}")
+            elif dep in definitions and dep not in path and dep not in _BUILTIN_METRIC_NAMES:
+                path.append(dep)
+                stack.append(iter(_metric_dependencies(definitions[dep])))
+    return definitions
+
+def evaluate_metrics(payloads: List[ReactionImpactIn], names: List[str], definitions: Dict[str, MetricDefinition],
+                     params: Dict[str, ParamValue]) -> Dict[str, list]:
+    """Rounded values of `names` for every payload (None where undefined). Raises FormulaError."""
+    unknown = [n for n in names if n not in definitions]
+    if unknown:
+        raise FormulaError(f"Unknown metrics: {unknown}")
+    ctx = _MetricContext(payloads, definitions, params)
+    out = {}
+    with np.errstate(all="ignore"):
+        for name in names:
+            values = ctx.metric(name)
+            decimals = definitions[name].decimals
+            # Python round() on each value, as compute_impact does, so built-ins match it exactly.
+            out[name] = [round(x, decimals) if isfinite(x) else None for x in values.tolist()]
+    return out
+
+@router.get("/api/metric-registry", response_model=MetricRegistryOut)
+def metric_registry_list():
+    return {
+        "metrics": metric_registry.describe(),
+        "variables": _FORMULA_VARIABLES,
+        "child_fields": {section: list(fields) for section, fields in _FORMULA_CHILD_FIELDS.items()},
+        "functions": list(_FORMULA_FUNCTIONS),
+    }
+
+@router.post("/api/metric-registry", response_model=MetricInfo)
+def metric_registry_add(payload: MetricDefinition):
+    _require_single_worker("Custom metrics")
+    metric_registry.register(payload)
+    return {**payload.model_dump(), "builtin": False}
+
+@router.delete("/api/metric-registry/{name}")
+def metric_registry_remove(name: str):
+    _require_single_worker("Custom metrics")
+    if not metric_registry.remove(name):
+        raise HTTPException(status_code=404, detail=f"No custom metric '{name}'")
+    return {"deleted": name}
+
+@router.post("/api/impact/metrics")
+def reaction_metrics(payload: MetricEvaluateIn):
+    if (payload.reaction is None) == (payload.items is None):
+        raise HTTPException(status_code=400, detail="Provide exactly one of 'reaction' or 'items'.")
+    definitions = check_metric_definitions(payload.formulas, metric_registry.definitions(), payload.params)
+    names = payload.metrics or [*_BUILTIN_METRIC_NAMES, *(f.name for f in payload.formulas)]
+    params: Dict[str, ParamValue] = {}
+    for d in definitions.values():
+        params.update(d.params)
+    params.update(payload.params)
+
+    if payload.reaction is not None:
+        _check_impact_input(payload.reaction)
+        payloads, results = [payload.reaction], None
+    else:
+        if len(payload.items) > IMPACT_BATCH_MAX_ITEMS:
+            raise HTTPException(status_code=413, detail=f"Batch too large: {len(payload.items)} items (max {IMPACT_BATCH_MAX_ITEMS}).")
+        results: List[Dict[str, Any]] = [None] * len(payload.items)
+        payloads, positions = [], []
+        for i, row in enumerate(payload.items):
+            try:
+                p = ReactionImpactIn.model_validate(row)
+                _check_impact_input(p)
+                _energy_preset(p)
+            except ValidationError as e:
+                results[i] = {"index": i, "ok": False, "error": {"status_code": 422, "detail": e.errors(include_url=False, include_context=False)}}
+                continue
+            except HTTPException as e:
+                results[i] = {"index": i, "ok": False, "error": {"status_code": e.status_code, "detail": e.detail}}
+                continue
+            except Exception as e:
+                results[i] = {"index": i, "ok": False, "error": {"status_code": 400, "detail": f"Invalid input: {e}"}}
+                continue
+            payloads.append(p)
+            positions.append(i)
+
+    try:
+        values = evaluate_metrics(payloads, names, definitions, params) if payloads else {}
+    except FormulaError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid input: {e}")
+
+    if results is None:
+        return {"metrics": {name: v[0] for name, v in values.items()}}
+    for row, i in enumerate(positions):
+        results[i] = {"index": i, "ok": True, "metrics": {name: v[row] for name, v in values.items()}}
+    ok_count = len(positions)
+    return {"count": len(results), "ok_count": ok_count, "error_count": len(results) - ok_count, "results": results}
+
+# ------------------------------------------------------------------------------
+# Multi-step synthesis routes (DAG of steps, memoized per step)
+# ------------------------------------------------------------------------------
+# A route is a DAG of reactions: a step lists which of its reactants are the
+# products of earlier steps (convergent branches and split intermediates are
+# fine). Each step's own metrics come from compute_impact and are memoized by
+# a hash of the step's reaction, so when one slider moves only the edited step
+# is recomputed; downstream steps reuse their memoized results and only the
+# O(steps) roll-up below is redone.
+#
+# Roll-up, per gram of a step's product (C = raw input, W = water, E = kWh):
+#   C_k = (raw_k + sum over feeding steps u of m_ku * C_u) / P_k
+# where raw_k excludes intermediate reactants and m_ku is the mass of u's
+# product charged to step k. C of the final step is the route PMI. Scale
+# factors run the other way: the final step is scaled to target_mass_g and
+# every upstream step to the amount of its product its consumers need.
+ROUTE_MAX_STEPS = int(os.getenv("ROUTE_MAX_STEPS", "200"))
+ROUTE_STEP_CACHE_SIZE = int(os.getenv("ROUTE_STEP_CACHE_SIZE", "4096"))
+
+class RouteIntermediate(BaseModel):
+    step: str = Field(description="id of the earlier step whose product this reactant is")
+    reactant: int = Field(ge=0, description="Index of the reactant (in this step's reactants) made by that step")
+
+class RouteStep(BaseModel):
+    id: str
+    reaction: ReactionImpactIn
+    intermediates: List[RouteIntermediate] = Field(default_factory=list)
+
+class RouteIn(BaseModel):
+    steps: List[RouteStep] = Field(min_items=1)
+    final_step: Optional[str] = Field(default=None, description="id of the step making the final product (default: the one step nothing consumes)")
+    target_mass_g: Optional[float] = Field(default=None, gt=0, description="Scale the route to this final product mass (default: final step's actual_mass_g)")
+
+class RouteStepOut(BaseModel):
+    id: str
+    scale: float
+    product_mass_g: float
+    raw_input_mass_g: float
+    metrics: ReactionImpactOut
+    cumulative_pmi: float
+    cumulative_e_factor: float
+    cumulative_water_mL_per_g: float
+    cumulative_energy_kWh_per_g: float
+
+class RouteOut(BaseModel):
+    final_step: str
+    final_product_mass_g: float
+    raw_input_mass_g: float
+    pmi: float
+    e_factor: float
+    water_mL_per_g: float
+    energy_kWh_per_g: float
+    steps: List[RouteStepOut]
+    recomputed_steps: List[str]
+
+_route_step_memo: "OrderedDict[str, tuple]" = OrderedDict()  # step hash -> (impact dict, totals)
+_route_step_memo_lock = threading.Lock()
+
+def _route_step_impact(reaction: ReactionImpactIn) -> tuple:
+    """Returns (impact dict, unrounded totals, recomputed) for one step, memoized by content hash."""
+    key = _payload_key("route-step", reaction)
+    with _route_step_memo_lock:
+        hit = _route_step_memo.get(key)
+        if hit is not None:
+            _route_step_memo.move_to_end(key)
+            return (*hit, False)
+    entry = (compute_impact_dict(reaction), _impact_totals(reaction))
+    with _route_step_memo_lock:
+        _route_step_memo[key] = entry
+        while len(_route_step_memo) > ROUTE_STEP_CACHE_SIZE:
+            _route_step_memo.popitem(last=False)
+    return (*entry, True)
+
+def _route_order(payload: RouteIn) -> tuple:
+    """Validates the DAG; returns (steps in topological order, final step id)."""
+    steps = {}
+    for step in payload.steps:
+        if step.id in steps:
+            raise HTTPException(status_code=400, detail=f"Duplicate step id '{step.id}'.")
+        steps[step.id] = step
+    consumers: Dict[str, List[str]] = {sid: [] for sid in steps}
+    for step in payload.steps:
+        seen = set()
+        for link in step.intermediates:
+            if link.step not in steps:
+                raise HTTPException(status_code=400, detail=f"Step '{step.id}': unknown step '{link.step}'.")
+            if link.step == step.id:
+                raise HTTPException(status_code=400, detail=f"Step '{step.id}' cannot consume its own product.")
+            if link.reactant >= len(step.reaction.reactants):
+                raise HTTPException(status_code=400, detail=f"Step '{step.id}': reactant index {link.reactant} out of range.")
+            if link.reactant in seen:
+                raise HTTPException(status_code=400, detail=f"Step '{step.id}': reactant {link.reactant} is mapped twice.")
+            seen.add(link.reactant)
+            consumers[link.step].append(step.id)
+
+    # Kahn's algorithm; ties keep input order.
+    pending = {sid: len({link.step for link in s.intermediates}) for sid, s in steps.items()}
+    ready = [sid for sid in steps if pending[sid] == 0]
+    order = []
+    while ready:
+        sid = ready.pop(0)
+        order.append(steps[sid])
+        for consumer in dict.fromkeys(consumers[sid]):
+            pending[consumer] -= 1
+            if pending[consumer] == 0:
+                ready.append(consumer)
+    if len(order) != len(steps):
+        cyclic = [sid for sid, n in pending.items() if n > 0]
+        raise HTTPException(status_code=400, detail=f"Route has a cycle; steps on or after it: {cyclic}.")
+
+    sinks = [sid for sid, c in consumers.items() if not c]
+    final = payload.final_step
+    if final is None:
+        if len(sinks) != 1:
+            raise HTTPException(status_code=400, detail=f"Route must end in one final step (unconsumed: {sinks}); set final_step.")
+        final = sinks[0]
+    elif final not in steps:
+        raise HTTPException(status_code=400, detail=f"Unknown final_step '{final}'.")
+    elif consumers[final]:
+        raise HTTPException(status_code=400, detail=f"final_step '{final}' is consumed by {consumers[final]}.")
+    dangling = [sid for sid in sinks if sid != final]
+    if dangling:
+        raise HTTPException(status_code=400, detail=f"Steps {dangling} do not lead to the final step '{final}'.")
+    return order, final
+
+def compute_route(payload: RouteIn) -> Dict[str, Any]:
+    if len(payload.steps) > ROUTE_MAX_STEPS:
+        raise HTTPException(status_code=413, detail=f"Too many steps ({len(payload.steps)} > {ROUTE_MAX_STEPS}).")
+    order, final = _route_order(payload)
+
+    per_gram: Dict[str, tuple] = {}  # step id -> (C, W, E) per gram of its product
+    rows: Dict[str, tuple] = {}  # step id -> (impact dict, raw input excluding intermediates, g)
+    recomputed = []
+    for step in order:
+        impact, totals, fresh = _route_step_impact(step.reaction)
+        if fresh:
+            recomputed.append(step.id)
+        reactants = step.reaction.reactants
+        own_raw_g = totals["total_input_mass_g"] - sum(reactants[link.reactant].mass_g for link in step.intermediates)
+        raw, water, kwh = own_raw_g, totals["water_g_total"], totals["kwh"]
+        for link in step.intermediates:
+            c, w, e = per_gram[link.step]
+            m = reactants[link.reactant].mass_g
+            raw, water, kwh = raw + m * c, water + m * w, kwh + m * e
+        product_g = step.reaction.product.actual_mass_g
+        per_gram[step.id] = (raw / product_g, water / product_g, kwh / product_g)
+        rows[step.id] = (impact, own_raw_g)
+
+    # Scale factors, downstream -> upstream.
+    steps_by_id = {step.id: step for step in order}
+    final_product_g = steps_by_id[final].reaction.product.actual_mass_g
+    scale = {sid: 0.0 for sid in steps_by_id}
+    scale[final] = (payload.target_mass_g or final_product_g) / final_product_g
+    for step in reversed(order):
+        for link in step.intermediates:
+            upstream_product_g = steps_by_id[link.step].reaction.product.actual_mass_g
+            scale[link.step] += scale[step.id] * step.reaction.reactants[link.reactant].mass_g / upstream_product_g
+
+    out_steps = []
+    for step in order:
+        c, w, e = per_gram[step.id]
+        s = scale[step.id]
+        impact, own_raw_g = rows[step.id]
+        out_steps.append({
+            "id": step.id,
+            "scale": round(s, 6),
+            "product_mass_g": round(s * step.reaction.product.actual_mass_g, 4),
+            "raw_input_mass_g": round(s * own_raw_g, 4),
+            "metrics": impact,
+            "cumulative_pmi": round(c, 3),
+            "cumulative_e_factor": round(c - 1.0, 3),
+            "cumulative_water_mL_per_g": round(w, 2),
+            "cumulative_energy_kWh_per_g": round(e, 6),
+        })
+    c, w, e = per_gram[final]
+    final_mass_g = scale[final] * final_product_g
+    return {
+        "final_step": final,
+        "final_product_mass_g": round(final_mass_g, 4),
+        "raw_input_mass_g": round(c * final_mass_g, 4),
+        "pmi": round(c, 3),
+        "e_factor": round(c - 1.0, 3),
+        "water_mL_per_g": round(w, 2),
+        "energy_kWh_per_g": round(e, 6),
+        "steps": out_steps,
+        "recomputed_steps": recomputed,
+    }
+
+@router.post("/api/route/compute", response_model=RouteOut)
+def route_compute(payload: RouteIn):
+    try:
+        return compute_route(payload)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid input: {e}")
+
+# ------------------------------------------------------------------------------
+# Live simulation socket (field patches in, changed outputs out)
+# ------------------------------------------------------------------------------
+# The simulator used to POST the whole payload on every change. Over
+# /ws/simulate the client sends dotted-path patches against a ReactionImpactIn
+# held in a server-side session. Patches are applied as they arrive; the
+# server recomputes once per burst, on the latest state, only the metric
+# groups (IMPACT_METRIC_GROUPS) whose inputs were touched, and pushes only the
+# output values that differ from what the client already has. Sessions
+# survive reconnects (?session=<id>), are evicted after SIM_SESSION_IDLE_S
+# without a connection (a lifespan task sweeps them even when nobody
+# connects), and SIM_MAX_SESSIONS bounds memory.
+#
+#   client: {"type": "init", "payload": {...}}
+#           {"type": "patch", "seq": 7, "set": {"reactants.0.mass_g": 12.5}, "remove": ["solvents.1"]}
+#   server: {"type": "session", "id": "...", "seq": 0}
+#           {"type": "result", "seq": 7, "changed": {"pmi": 4.21, "breakdown.total_input_mass_g": 96.2}}
+#           {"type": "error", "seq": 7, "detail": ...}
+SIM_SESSION_IDLE_S = float(os.getenv("SIM_SESSION_IDLE_S", "900"))
+SIM_MAX_SESSIONS = int(os.getenv("SIM_MAX_SESSIONS", "1000"))
+SIM_COALESCE_MS = float(os.getenv("SIM_COALESCE_MS", "10"))
+SIM_INLINE_MAX_ITEMS = 50  # larger reactions are recomputed in the thread pool
+SIM_SWEEP_INTERVAL_S = max(1.0, min(60.0, SIM_SESSION_IDLE_S / 4))
+
+# Input fields each metric group reads, per top-level section (None = any field).
+_GROUP_INPUTS = {
+    "mass": {"product": {"actual_mass_g"}, "reactants": {"mass_g"}, "solvents": None, "catalysts": {"mass_g"},
+             "workup": None, "conditions": {"mode", "time_h"}, "options": None},
+    "atom_economy": {"product": {"mw", "smiles"}, "reactants": {"mw", "smiles"}},
+    "rme": {"product": {"actual_mass_g"}, "reactants": {"mass_g"}},
+    "carbon_efficiency": {"product": {"actual_mass_g", "mw", "carbon_atoms", "smiles"},
+                          "reactants": {"mass_g", "mw", "carbon_atoms", "smiles"}},
+    "stoichiometric_factor": {"reactants": {"name", "eq_used", "eq_stoich"}},
+}
+
+def _affected_groups(path: List[str]) -> set:
+    section = path[0]
+    field = next((p for p in path[1:] if not p.isdigit()), None)  # None: a whole section or list item
+    return {group for group, inputs in _GROUP_INPUTS.items()
+            if section in inputs and (field is None or inputs[section] is None or field in inputs[section])}
+
+def _patch_path(data: Dict[str, Any], parts: List[str], value: Any = None, remove: bool = False) -> None:
+    node = data
+    for part in parts[:-1]:
+        node = node[int(part)] if isinstance(node, list) else node.setdefault(part, {})
+    last = parts[-1]
+    if isinstance(node, list):
+        i = int(last)
+        if remove:
+            del node[i]
+        elif i == len(node):
+            node.append(value)
+        else:
+            node[i] = value
+    elif remove:
+        node.pop(last, None)
+    else:
+        node[last] = value
+
+def _flatten(data: Dict[str, Any], prefix: str = "") -> Dict[str, Any]:
+    out = {}
+    for key, value in data.items():
+        if isinstance(value, dict):
+            out.update(_flatten(value, f"{prefix}{key}."))
+        else:
+            out[f"{prefix}{key}"] = value
+    return out
+
+class SimSession:
+    def __init__(self, sid: str):
+        self.id = sid
+        self.state: Dict[str, Any] = {}                   # raw ReactionImpactIn JSON, patched in place
+        self.groups: Dict[str, Dict[str, Any]] = {}       # metric group -> last computed values
+        self.dirty = set(IMPACT_METRIC_GROUPS)
+        self.sent: Dict[str, Any] = {}                    # flattened outputs the client has
+        self.seq = 0
+        self.connections = 0
+        self.last_seen = time.monotonic()
+
+    def apply(self, message: str) -> Optional[str]:
+        """Applies one client message and advances `seq`; returns an error text or None."""
+        try:
+            msg = json.loads(message)
+        except ValueError:
+            return "Invalid JSON."
+        if not isinstance(msg, dict):
+            return "Expected a JSON object."
+        self.seq = msg["seq"] if isinstance(msg.get("seq"), int) else self.seq + 1
+        self.last_seen = time.monotonic()
+        kind = msg.get("type")
+        if kind == "init":
+            if not isinstance(msg.get("payload"), dict):
+                return "init needs a 'payload' object."
+            self.state = msg["payload"]
+            self.groups = {}
+            self.dirty = set(IMPACT_METRIC_GROUPS)
+        elif kind == "patch":
+            try:
+                for path, value in (msg.get("set") or {}).items():
+                    parts = _split_path(path)
+                    _patch_path(self.state, parts, value)
+                    self.dirty |= _affected_groups(parts)
+                for path in msg.get("remove") or []:
+                    parts = _split_path(path)
+                    _patch_path(self.state, parts, remove=True)
+                    self.dirty |= _affected_groups(parts)
+            except (KeyError, IndexError, ValueError, TypeError, AttributeError) as e:
+                return f"Bad patch path: {e!r}"
+        else:
+            return f"Unknown message type {kind!r}."
+        return None
+
+    def _compute_groups(self, payload: ReactionImpactIn, groups: set) -> Dict[str, Dict[str, Any]]:
+        return {group: IMPACT_METRIC_GROUPS[group](payload) for group in groups}
+
+    async def recompute(self) -> Dict[str, Any]:
+        """Recomputes the dirty groups for the current state; returns the changed flattened outputs."""
+        payload = ReactionImpactIn.model_validate(self.state)
+        _check_impact_input(payload)
+        dirty, self.dirty = self.dirty, set()
+        try:
+            if len(payload.reactants) + len(payload.solvents) + len(payload.catalysts) <= SIM_INLINE_MAX_ITEMS:
+                fresh = self._compute_groups(payload, dirty)
+            else:
+                fresh = await run_in_threadpool(self._compute_groups, payload, dirty)
+        except BaseException:
+            self.dirty |= dirty
+            raise
+        self.groups.update(fresh)
+        values: Dict[str, Any] = {}
+        for group_values in self.groups.values():
+            values.update(group_values)
+        flat = _flatten(_assemble_impact(values))
+        changed = {k: v for k, v in flat.items() if k not in self.sent or self.sent[k] != v}
+        self.sent = flat
+        return changed
+
+class SimSessionStore:
+    """Sessions by id; only touched from the event loop, so no locking."""
+    def __init__(self, max_sessions: int, idle_s: float):
+        self.max_sessions = max_sessions
+        self.idle_s = idle_s
+        self._sessions: "OrderedDict[str, SimSession]" = OrderedDict()
+        self.evictions = 0
+
+    def evict_idle(self) -> None:
+        now = time.monotonic()
+        for sid, sess in list(self._sessions.items()):
+            if sess.connections == 0 and now - sess.last_seen > self.idle_s:
+                del self._sessions[sid]
+                self.evictions += 1
+
+    def _make_room(self) -> None:
+        for sid, sess in list(self._sessions.items()):  # oldest first
+            if len(self._sessions) < self.max_sessions:
+                break
+            if sess.connections == 0:
+                del self._sessions[sid]
+                self.evictions += 1
+
+    def attach(self, sid: Optional[str]) -> Optional[SimSession]:
+        """The session with this id (or a new one), marked connected; None when full."""
+        self.evict_idle()
+        self._make_room()
+        sess = self._sessions.get(sid) if sid else None
+        if sess is None:
+            if len(self._sessions) >= self.max_sessions:
+                return None
+            sess = SimSession(secrets.token_urlsafe(12))
+            self._sessions[sess.id] = sess
+        else:
+            self._sessions.move_to_end(sid)
+            sess.sent = {}  # a new connection has no outputs yet
+            sess.dirty |= set(IMPACT_METRIC_GROUPS) - set(sess.groups)
+        sess.connections += 1
+        sess.last_seen = time.monotonic()
+        return sess
+
+    def detach(self, sess: SimSession) -> None:
+        sess.connections -= 1
+        sess.last_seen = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sessions": len(self._sessions),
+            "connected": sum(1 for s in self._sessions.values() if s.connections),
+            "max_sessions": self.max_sessions,
+            "evictions": self.evictions,
+        }
+
+sim_sessions = SimSessionStore(SIM_MAX_SESSIONS, SIM_SESSION_IDLE_S)
+
+async def _sweep_sim_sessions(interval_s: float) -> None:
+    """Evicts idle sessions on a timer, so a burst's states do not wait for the next connection."""
+    while True:
+        await asyncio.sleep(interval_s)
+        sim_sessions.evict_idle()
+
+def _validation_detail(e: ValidationError) -> Any:
+    return json.loads(e.json(include_url=False))
+
+async def _push_results(websocket: WebSocket, sess: SimSession, wake: asyncio.Event) -> None:
+    while True:
+        await wake.wait()
+        if SIM_COALESCE_MS > 0:
+            await asyncio.sleep(SIM_COALESCE_MS / 1000)  # let the rest of a slider burst land
+        wake.clear()
+        seq = sess.seq
+        try:
+            message = {"type": "result", "seq": seq, "changed": await sess.recompute()}
+        except HTTPException as e:
+            message = {"type": "error", "seq": seq, "detail": e.detail}
+        except ValidationError as e:
+            message = {"type": "error", "seq": seq, "detail": _validation_detail(e)}
+        except Exception as e:  # as /api/impact/compute's 400: the next valid state recovers
+            message = {"type": "error", "seq": seq, "detail": f"Invalid input: {e}"}
+        await websocket.send_text(_json_encoder.encode(message))
+
+@router.websocket("/ws/simulate")
+async def simulate_socket(websocket: WebSocket, session: Optional[str] = None):
+    sess = sim_sessions.attach(session)
+    await websocket.accept()  # before closing, so the browser sees code 1013 rather than a failed handshake
+    if sess is None:
+        await websocket.close(code=1013)  # try again later
+        return
+    wake = asyncio.Event()
+    pusher = asyncio.create_task(_push_results(websocket, sess, wake))
+    try:
+        await websocket.send_text(_json_encoder.encode({"type": "session", "id": sess.id, "seq": sess.seq}))
+        if sess.state:
+            wake.set()  # resumed session: send the current outputs
+        while True:
+            receive = asyncio.ensure_future(websocket.receive_text())
+            await asyncio.wait((receive, pusher), timeout=SIM_SESSION_IDLE_S, return_when=asyncio.FIRST_COMPLETED)
+            if not receive.done():
+                receive.cancel()
+                if pusher.done():  # nothing would answer this socket any more
+                    if not pusher.cancelled() and pusher.exception() is not None:
+                        logger.error("Simulation pusher stopped", exc_info=pusher.exception())
+                    try:
+                        await websocket.close(code=1011)
+                    except RuntimeError:  # the send that failed already found the socket closed
+                        pass
+                else:
+                    await websocket.close(code=1001)
+                break
+            error = sess.apply(receive.result())
+            if error:
+                await websocket.send_text(_json_encoder.encode({"type": "error", "seq": sess.seq, "detail": error}))
+            else:
+                wake.set()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        pusher.cancel()
+        sim_sessions.detach(sess)
+
+# ------------------------------------------------------------------------------
+# Reaction library (SQLite, WAL; indexed metric columns, keyset pagination)
+# ------------------------------------------------------------------------------
+# Computed reports used to be thrown away. The library keeps each submitted
+# ReactionImpactIn next to its ReactionImpactOut and one indexed column per
+# headline metric, so "PMI < 20 and AE > 70, by E-factor" is an index range
+# scan instead of a recompute. Pages are keyset-paginated on (sort metric, id):
+# the cursor is the last row's position, so page N costs the same as page 1.
+# Rows remember the IMPACT_FORMULA_VERSION they were scored with; after a bump
+# the first library access rescores the stale rows in vectorized chunks.
+#
+# One connection per thread (handlers run in the thread pool); WAL lets
+# readers proceed while a bulk insert is writing.
+LIBRARY_DB_PATH = Path(os.getenv("LIBRARY_DB_PATH", str(BASE_DIR / "library.db")))
+LIBRARY_PAGE_MAX = int(os.getenv("LIBRARY_PAGE_MAX", "500"))
+LIBRARY_RESCORE_CHUNK = 1000
+LIBRARY_METRICS = tuple(_METRIC_DECIMALS)
+
+LibraryMetric = Literal["atom_economy_pct", "pmi", "e_factor", "water_mL_per_g", "energy_kWh_per_g",
+                        "rme_pct", "carbon_efficiency_pct", "sf_overall"]
+
+_LIBRARY_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS reactions (
+    id INTEGER PRIMARY KEY,
+    name TEXT,
+    created_at REAL NOT NULL,
+    formula_version TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    result TEXT,
+    {", ".join(f"{m} REAL" for m in LIBRARY_METRICS)}
+);
+CREATE INDEX IF NOT EXISTS ix_reactions_formula_version ON reactions(formula_version);
+{"".join(f"CREATE INDEX IF NOT EXISTS ix_reactions_{m} ON reactions({m});" for m in LIBRARY_METRICS)}
+CREATE TABLE IF NOT EXISTS library_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+class LibraryInsertIn(BaseModel):
+    items: List[Dict[str, Any]] = Field(description="ReactionImpactIn objects; product.name is used as the entry name")
+
+class LibraryInsertOut(BaseModel):
+    count: int
+    ok_count: int
+    error_count: int
+    results: List[Dict[str, Any]]
+
+class MetricRange(BaseModel):
+    gt: Optional[float] = None
+    ge: Optional[float] = None
+    lt: Optional[float] = None
+    le: Optional[float] = None
+
+class LibraryQueryIn(BaseModel):
+    where: Dict[LibraryMetric, MetricRange] = Field(default_factory=dict, description="Metric -> bounds, e.g. {'pmi': {'lt': 20}}")
+    sort_by: Optional[LibraryMetric] = Field(default=None, description="Metric to order by (default: insertion order)")
+    descending: bool = False
+    limit: int = Field(default=50, ge=1)
+    cursor: Optional[str] = Field(default=None, description="next_cursor of the previous page")
+    include_payload: bool = False
+
+class LibraryQueryOut(BaseModel):
+    items: List[Dict[str, Any]]
+    next_cursor: Optional[str]
+
+def _metric_columns(res: Dict[str, Any]) -> tuple:
+    result = res.get("result") or {}
+    return tuple(result.get(m) for m in LIBRARY_METRICS)
+
+class ReactionLibrary:
+    def __init__(self, path: Path):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._fresh = False  # all rows scored with IMPACT_FORMULA_VERSION
+        with self._write_lock:
+            conn = self._conn()
+            conn.executescript(_LIBRARY_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _ensure_fresh(self) -> None:
+        """Rescores rows written under another IMPACT_FORMULA_VERSION (once per version)."""
+        if self._fresh:
+            return
+        with self._write_lock:
+            if self._fresh:
+                return
+            conn = self._conn()
+            row = conn.execute("SELECT value FROM library_meta WHERE key = 'formula_version'").fetchone()
+            if row is None or row[0] != IMPACT_FORMULA_VERSION:
+                while True:
+                    stale = conn.execute(
+                        "SELECT id, payload FROM reactions WHERE formula_version != ? LIMIT ?",
+                        (IMPACT_FORMULA_VERSION, LIBRARY_RESCORE_CHUNK),
+                    ).fetchall()
+                    if not stale:
+                        break
+                    scored = _score_rows([json.loads(p) for _, p in stale])
+                    updates = [(IMPACT_FORMULA_VERSION, _json_encoder.encode(res), *_metric_columns(res), rid)
+                               for (rid, _), res in zip(stale, scored)]
+                    set_metrics = ", ".join(f"{m} = ?" for m in LIBRARY_METRICS)
+                    with conn:
+                        conn.execute("BEGIN IMMEDIATE")
+                        conn.executemany(f"UPDATE reactions SET formula_version = ?, result = ?, {set_metrics} WHERE id = ?", updates)
+                    logger.info("Reaction library: rescored %d rows for formula version %s", len(updates), IMPACT_FORMULA_VERSION)
+                conn.execute("INSERT OR REPLACE INTO library_meta VALUES ('formula_version', ?)", (IMPACT_FORMULA_VERSION,))
+            self._fresh = True
+
+    def insert(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Scores and stores valid rows in one transaction; returns one {"ok", "id" | "error"} per row."""
+        self._ensure_fresh()
+        out: List[Dict[str, Any]] = []
+        records = []
+        now = time.time()
+        for row, res in zip(rows, _score_rows(rows)):
+            if not res["ok"]:
+                out.append(res)
+                continue
+            name = (row.get("product") or {}).get("name")
+            records.append((name, now, IMPACT_FORMULA_VERSION, _json_encoder.encode(row),
+                            _json_encoder.encode(res), *_metric_columns(res)))
+            out.append({"ok": True})
+        columns = ", ".join(("name", "created_at", "formula_version", "payload", "result") + LIBRARY_METRICS)
+        placeholders = ", ".join("?" * (5 + len(LIBRARY_METRICS)))
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                (next_id,) = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM reactions").fetchone()
+                conn.executemany(f"INSERT INTO reactions (id, {columns}) VALUES (?, {placeholders})",
+                                 [(next_id + k, *rec) for k, rec in enumerate(records)])
+        ids = iter(range(next_id, next_id + len(records)))
+        for res in out:
+            if res["ok"]:
+                res["id"] = next(ids)
+        return out
+
+    def get(self, reaction_id: int) -> Optional[Dict[str, Any]]:
+        self._ensure_fresh()
+        row = self._conn().execute(
+            "SELECT id, name, created_at, payload, result FROM reactions WHERE id = ?", (reaction_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        rid, name, created_at, payload, result = row
+        return {"id": rid, "name": name, "created_at": created_at, "payload": json.loads(payload), **json.loads(result)}
+
+    def query(self, q: LibraryQueryIn) -> Dict[str, Any]:
+        self._ensure_fresh()
+        where, params = [], []
+        for metric, bounds in q.where.items():
+            for op, sql_op in (("gt", ">"), ("ge", ">="), ("lt", "<"), ("le", "<=")):
+                value = getattr(bounds, op)
+                if value is not None:
+                    where.append(f"{metric} {sql_op} ?")
+                    params.append(value)
+
+        # Keyset on (sort value, id) in SQLite's native order: NULLs sort first
+        # ascending and last descending, so the index serves every page.
+        key = q.sort_by
+        direction = "DESC" if q.descending else "ASC"
+        after = "<" if q.descending else ">"
+        if q.cursor is not None:
+            last_value, last_id = _decode_cursor(q.cursor)
+            if key is None:
+                where.append(f"id {after} ?")
+                params.append(last_id)
+            elif last_value is None:
+                where.append(f"({key} IS NULL AND id {after} ?" + (")" if q.descending else f" OR {key} IS NOT NULL)"))
+                params.append(last_id)
+            else:
+                where.append(f"({key} {after} ? OR ({key} = ? AND id {after} ?)" + (f" OR {key} IS NULL)" if q.descending else ")"))
+                params += [last_value, last_value, last_id]
+        order = f"{key} {direction}, id {direction}" if key else f"id {direction}"
+        limit = min(q.limit, LIBRARY_PAGE_MAX)
+        columns = ", ".join(("id", "name", "created_at") + LIBRARY_METRICS + (("payload",) if q.include_payload else ()))
+        sql = f"SELECT {columns} FROM reactions {'WHERE ' + ' AND '.join(where) if where else ''} ORDER BY {order} LIMIT ?"
+        rows = self._conn().execute(sql, (*params, limit + 1)).fetchall()
+
+        names = ("id", "name", "created_at") + LIBRARY_METRICS + ("payload",)
+        items = []
+        for row in rows[:limit]:
+            item = dict(zip(names, row))
+            if q.include_payload:
+                item["payload"] = json.loads(item["payload"])
+            items.append(item)
+        next_cursor = None
+        if len(rows) > limit:
+            last = items[-1]
+            next_cursor = _encode_cursor(last[key] if key else None, last["id"])
+        return {"items": items, "next_cursor": next_cursor}
+
+def _score_rows(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """compute_impact_batch over raw JSON rows; invalid rows get a 422 error entry."""
+    results: List[Optional[Dict[str, Any]]] = [None] * len(rows)
+    parsed, positions = [], []
+    for i, row in enumerate(rows):
+        try:
+            parsed.append(ReactionImpactIn.model_validate(row))
+            positions.append(i)
+        except ValidationError as e:
+            results[i] = {"ok": False, "error": {"status_code": 422, "detail": e.errors(include_url=False, include_context=False)}}
+    for i, res in zip(positions, compute_impact_batch(parsed)):
+        results[i] = res
+    return results
+
+def _encode_cursor(value: Optional[float], last_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([value, last_id]).encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str) -> tuple:
+    try:
+        value, last_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(last_id, int) or not (value is None or isinstance(value, (int, float))):
+            raise ValueError
+        return value, last_id
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+@functools.lru_cache(maxsize=None)
+def get_reaction_library() -> ReactionLibrary:
+    return ReactionLibrary(LIBRARY_DB_PATH)
+
+@router.post("/api/library/reactions", response_model=LibraryInsertOut)
+def library_insert(payload: LibraryInsertIn):
+    if len(payload.items) > IMPACT_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch too large: {len(payload.items)} items (max {IMPACT_BATCH_MAX_ITEMS}).")
+    results = get_reaction_library().insert(payload.items)
+    ok_count = sum(1 for r in results if r["ok"])
+    return {
+        "count": len(results),
+        "ok_count": ok_count,
+        "error_count": len(results) - ok_count,
+        "results": [{"index": i, **r} for i, r in enumerate(results)],
+    }
+
+@router.post("/api/library/query", response_model=LibraryQueryOut)
+def library_query(payload: LibraryQueryIn):
+    return get_reaction_library().query(payload)
+
+@router.get("/api/library/reactions/{reaction_id}")
+def library_get(reaction_id: int):
+    entry = get_reaction_library().get(reaction_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail=f"No library entry {reaction_id}.")
+    return entry
+
+# ------------------------------------------------------------------------------
+# Leaderboards (incremental top-K per board and time window)
+# ------------------------------------------------------------------------------
+# Submissions are scored server-side and offered to every board of every
+# window. A board keeps the best K entries in a sorted list plus a dict of
+# those entrants' scores, so a submission costs a dict lookup plus, when it
+# makes the top K, an O(K) list insert; a read is a slice of that list. No read
+# ever sorts the submission history.
+#
+# Entrants only ever improve within a window (a worse submission is ignored
+# and "PMI improvement" is measured against the user's first PMI in the
+# window), and the K-th score only gets better. So an entrant that falls out of
+# the top K (or never reaches it) is forgotten: any later score that gets in
+# beats their old best anyway. A board therefore holds at most K entrants,
+# however many distinct user/reaction strings clients send. First PMIs are
+# kept for the LEADERBOARD_MAX_USERS most recent users per window; a user
+# evicted from that LRU starts over from their next PMI. Windows are calendar
+# periods in UTC (day, ISO week) plus all-time; a new period starts empty
+# boards. State is in memory per process, so submissions answer 503 with
+# several pre-fork workers rather than ranking on one worker's partial boards.
+LEADERBOARD_K = int(os.getenv("LEADERBOARD_K", "100"))
+LEADERBOARD_MAX_USERS = int(os.getenv("LEADERBOARD_MAX_USERS", "100000"))
+LEADERBOARD_MAX_AGE_S = int(os.getenv("LEADERBOARD_MAX_AGE_S", "10"))
+
+# Board -> (entrant, report field, higher is better).
+_LEADERBOARD_BOARDS = {
+    "e_factor": ("reaction", "e_factor", False),
+    "atom_economy": ("reaction", "atom_economy_pct", True),
+    "pmi_improvement": ("user", "pmi", True),
+}
+_LEADERBOARD_WINDOWS = {
+    "daily": lambda t: time.strftime("%Y-%m-%d", time.gmtime(t)),
+    "weekly": lambda t: time.strftime("%G-W%V", time.gmtime(t)),
+    "all": lambda t: "all",
+}
+
+class LeaderboardSubmitIn(BaseModel):
+    user: str = Field(min_length=1, max_length=64)
+    reaction: Optional[str] = Field(default=None, max_length=120, description="Reaction label; defaults to product.name")
+    payload: ReactionImpactIn
+
+class TopK:
+    """Best `k` entrants of one board; an entrant's score only ever improves."""
+    def __init__(self, k: int, higher_is_better: bool):
+        self.k = k
+        self._sign = -1.0 if higher_is_better else 1.0
+        self._best: Dict[str, tuple] = {}         # entrant -> (sort key, seq), top entrants only
+        self._top: List[tuple] = []               # sorted (sort key, seq, entrant), at most k
+        self._info: Dict[str, Dict[str, Any]] = {}  # entrant -> display fields, top entrants only
+        self._seq = 0
+        self.version = 0                          # bumped whenever the top K changes
+
+    def offer(self, entrant: str, score: float, info: Dict[str, Any]) -> bool:
+        """Records a score; returns True if the top K changed."""
+        key = self._sign * score
+        prev = self._best.get(entrant)
+        if prev is not None and key >= prev[0]:
+            return False
+        self._seq += 1  # ties rank the earlier achievement first
+        entry = (key, self._seq, entrant)
+        if prev is not None:
+            del self._top[bisect_left(self._top, (prev[0], prev[1], entrant))]
+        elif len(self._top) >= self.k and entry > self._top[-1]:
+            return False  # outside the top K; nothing is kept
+        insort(self._top, entry)
+        self._best[entrant] = (key, self._seq)
+        self._info[entrant] = {**info, "value": score}
+        if len(self._top) > self.k:
+            dropped = self._top.pop()[2]
+            del self._best[dropped], self._info[dropped]
+        self.version += 1
+        return True
+
+    def rank(self, entrant: str) -> Optional[int]:
+        if entrant not in self._info:
+            return None
+        key, seq = self._best[entrant]
+        return bisect_left(self._top, (key, seq, entrant)) + 1
+
+    def top(self, limit: int) -> List[Dict[str, Any]]:
+        return [{"rank": i + 1, **self._info[e]} for i, (_, _, e) in enumerate(self._top[:limit])]
+
+class _WindowBoards:
+    def __init__(self, period: str, k: int):
+        self.period = period
+        self.boards = {name: TopK(k, higher) for name, (_, _, higher) in _LEADERBOARD_BOARDS.items()}
+        self.first_pmi: "OrderedDict[str, float]" = OrderedDict()  # user -> first PMI, LRU
+
+    def first(self, user: str, pmi: float) -> float:
+        first = self.first_pmi.setdefault(user, pmi)
+        self.first_pmi.move_to_end(user)
+        while len(self.first_pmi) > LEADERBOARD_MAX_USERS:
+            self.first_pmi.popitem(last=False)
+        return first
+
+class Leaderboards:
+    def __init__(self, k: int):
+        self.k = k
+        self._windows: Dict[str, _WindowBoards] = {}
+        self._lock = threading.Lock()
+
+    def _window(self, window: str, now: float) -> _WindowBoards:
+        period = _LEADERBOARD_WINDOWS[window](now)
+        wb = self._windows.get(window)
+        if wb is None or wb.period != period:
+            wb = self._windows[window] = _WindowBoards(period, self.k)
+        return wb
+
+    def ingest(self, user: str, reaction: str, report: Dict[str, Any], now: Optional[float] = None) -> Dict[str, Dict[str, Optional[int]]]:
+        """Offers one scored submission to every board; returns {window: {board: rank or None}}."""
+        now = time.time() if now is None else now
+        ranks: Dict[str, Dict[str, Optional[int]]] = {}
+        with self._lock:
+            for window in _LEADERBOARD_WINDOWS:
+                wb = self._window(window, now)
+                ranks[window] = {}
+                for name, (entrant_kind, field, _) in _LEADERBOARD_BOARDS.items():
+                    board, value = wb.boards[name], report.get(field)
+                    entrant = user if entrant_kind == "user" else f"{user}\x00{reaction}"
+                    if value is not None and name == "pmi_improvement":
+                        first = wb.first(user, value)
+                        value = round((first - value) / first * 100, 2) if first > 0 and value < first else None
+                    if value is not None:
+                        info = {"user": user} if entrant_kind == "user" else {"user": user, "reaction": reaction}
+                        board.offer(entrant, value, info)
+                    ranks[window][name] = board.rank(entrant)
+        return ranks
+
+    def snapshot(self, window: str, limit: int, now: Optional[float] = None) -> tuple:
+        """(etag, body) for one window; the body holds only what the etag covers (the top K)."""
+        with self._lock:
+            wb = self._window(window, time.time() if now is None else now)
+            versions = "-".join(str(b.version) for b in wb.boards.values())
+            etag = f'"lb-{window}-{wb.period}-{versions}-{limit}"'
+            body = {
+                "window": window,
+                "period": wb.period,
+                "boards": {name: {"entries": b.top(limit)} for name, b in wb.boards.items()},
+            }
+        return etag, body
+
+leaderboards = Leaderboards(LEADERBOARD_K)
+
+@router.post("/api/leaderboard/submit")
+def leaderboard_submit(payload: LeaderboardSubmitIn):
+    _require_single_worker("Leaderboards")
+    try:
+        report = compute_impact_dict(payload.payload)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid input: {e}")
+    reaction = payload.reaction or payload.payload.product.name or "unnamed"
+    return {"ranks": leaderboards.ingest(payload.user, reaction, report), "result": report}
+
+@router.get("/api/leaderboard")
+def leaderboard(request: Request,
+                window: Literal["daily", "weekly", "all"] = "weekly",
+                limit: int = Query(10, ge=1, le=LEADERBOARD_K)):
+    etag, body = leaderboards.snapshot(window, limit)
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={LEADERBOARD_MAX_AGE_S}"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(_json_encoder.encode(body), media_type="application/json", headers=headers)
+
+# ------------------------------------------------------------------------------
+# Background jobs (process pool, chunked results spilled to disk)
+# ------------------------------------------------------------------------------
+# Large batches, sweeps and Monte Carlo runs hold a request slot and the GIL
+# for seconds, long enough for Render's /api/health probe to time out. POST
+# /api/jobs checks the request, queues it on a ProcessPoolExecutor and
+# answers 202 with a job id at once; clients poll GET /api/jobs/{id} or follow
+# /api/jobs/{id}/events, then read /api/jobs/{id}/result.
+#
+# JSON job bodies are capped at JOB_MAX_BODY_BYTES because the web process
+# parses them. Bigger batches go to POST /api/jobs/upload as NDJSON or CSV:
+# the body is copied to a file in JOB_SPILL_DIR unparsed (up to
+# JOB_UPLOAD_MAX_BYTES) and one pool process reads, validates and scores it in
+# JOB_BATCH_CHUNK_ROWS-row chunks, writing results straight to disk and its row
+# count to a progress file.
+#
+# JSON batches are split into JOB_BATCH_CHUNK_ROWS tasks (progress = chunks
+# done); sweeps and Monte Carlo runs are one task each, with larger limits than
+# the synchronous endpoints. A chunk's output stays in memory until the job
+# holds JOB_RESULT_MEMORY_BYTES, after that chunks are written to JOB_SPILL_DIR.
+# Cancelling drops queued chunks (a running chunk finishes and is discarded).
+# Finished jobs are an LRU: removed with their files JOB_TTL_S after they end,
+# or earlier, least recently read first, beyond JOB_MAX_FINISHED jobs or
+# JOB_FINISHED_MEMORY_BYTES of in-memory results.
+# Workers are spawned (not forked) so they start clean of the server's threads.
+# Job state lives in one process, so jobs are refused when run_server.py runs
+# several pre-fork workers (a status poll could reach a worker that does not
+# know the id); with one web process there is one pool, sized by JOB_WORKERS.
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "0"))  # 0 = sized from cores and memory
+JOB_WORKER_MEMORY_MB = int(os.getenv("JOB_WORKER_MEMORY_MB", "256"))
+JOB_MAX_ACTIVE = int(os.getenv("JOB_MAX_ACTIVE", "16"))  # queued + running jobs
+JOB_TTL_S = float(os.getenv("JOB_TTL_S", "3600"))
+JOB_RESULT_MEMORY_BYTES = int(os.getenv("JOB_RESULT_MEMORY_BYTES", str(4 * 1024 * 1024)))
+JOB_SPILL_DIR = Path(os.getenv("JOB_SPILL_DIR", str(Path(tempfile.gettempdir()) / "green-toolkit-jobs")))
+JOB_MAX_FINISHED = int(os.getenv("JOB_MAX_FINISHED", "100"))
+JOB_FINISHED_MEMORY_BYTES = int(os.getenv("JOB_FINISHED_MEMORY_BYTES", str(32 * 1024 * 1024)))
+JOB_MAX_BODY_BYTES = int(os.getenv("JOB_MAX_BODY_BYTES", str(16 * 1024 * 1024)))
+JOB_UPLOAD_MAX_BYTES = int(os.getenv("JOB_UPLOAD_MAX_BYTES", str(256 * 1024 * 1024)))
+JOB_BATCH_MAX_ITEMS = int(os.getenv("JOB_BATCH_MAX_ITEMS", "50000"))
+JOB_SWEEP_MAX_POINTS = int(os.getenv("JOB_SWEEP_MAX_POINTS", "2000000"))
+JOB_MC_MAX_SAMPLES = int(os.getenv("JOB_MC_MAX_SAMPLES", "1000000"))
+JOB_BATCH_CHUNK_ROWS = 2000
+JOB_EVENTS_INTERVAL_S = 0.25
+
+_JOB_MEDIA_TYPES = {"batch": "application/x-ndjson", "sweep": "application/json", "uncertainty": "application/json"}
+_JOB_FINISHED = ("done", "failed", "cancelled")
+
+class JobIn(BaseModel):
+    kind: Literal["batch", "sweep", "uncertainty"]
+    payload: Dict[str, Any] = Field(description="Body of /api/impact/compute-batch, /api/impact/sweep or /api/impact/uncertainty")
+
+def _available_memory_mb() -> Optional[float]:
+    """Memory this process may still use: cgroup v2 limit, else MemAvailable; None if unknown."""
+    try:
+        limit = Path("/sys/fs/cgroup/memory.max").read_text().strip()
+        if limit != "max":
+            used = int(Path("/sys/fs/cgroup/memory.current").read_text())
+            return (int(limit) - used) / 2**20
+    except (OSError, ValueError):
+        pass
+    try:
+        for line in Path("/proc/meminfo").read_text().splitlines():
+            if line.startswith("MemAvailable:"):
+                return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+def _job_worker_count() -> int:
+    if JOB_WORKERS > 0:
+        return JOB_WORKERS
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    memory_mb = _available_memory_mb()
+    by_memory = int(memory_mb // JOB_WORKER_MEMORY_MB) if memory_mb is not None else cores
+    return max(1, min(cores, by_memory))
+
+def _job_spill(job_id: str, index: int, body: bytes, spill_dir: Path = JOB_SPILL_DIR) -> str:
+    spill_dir.mkdir(parents=True, exist_ok=True)
+    path = spill_dir / f"{job_id}-{index:06d}.part"
+    path.write_bytes(body)
+    return str(path)
+
+def _run_job_task(job_id: str, index: int, kind: str, data: Any, spill_dir: Path) -> Dict[str, Any]:
+    """Runs in a pool process; returns the chunk's encoded output (or spill path) or an error."""
+    if kind == "batch":
+        scorer = _StreamScorer()
+        body = scorer.score(data).encode()
+        ok_count = scorer.ok_count
+    else:
+        try:
+            if kind == "sweep":
+                result = compute_sweep(SweepIn.model_validate(data), JOB_SWEEP_MAX_POINTS)
+            else:
+                result = compute_uncertainty(UncertaintyIn.model_validate(data), JOB_MC_MAX_SAMPLES)
+        except HTTPException as e:
+            return {"error": {"status_code": e.status_code, "detail": e.detail}}
+        except Exception as e:
+            return {"error": {"status_code": 400, "detail": f"Invalid input: {e}"}}
+        body = _json_encoder.encode(result).encode()
+        ok_count = 1
+    if len(body) > JOB_RESULT_MEMORY_BYTES:
+        return {"ok_count": ok_count, "size": len(body), "path": _job_spill(job_id, index, body, spill_dir)}
+    return {"ok_count": ok_count, "size": len(body), "body": body}
+
+def _upload_progress_path(path: str) -> Path:
+    return Path(f"{path}.progress")
+
+def _run_upload_task(job_id: str, index: int, kind: str, data: tuple, spill_dir: Path) -> Dict[str, Any]:
+    """Runs in a pool process: scores an uploaded NDJSON / CSV file into one result file."""
+    path, fmt = data
+    progress = _upload_progress_path(path)
+    out_path = spill_dir / f"{job_id}-{index:06d}.part"
+    pipeline = _StreamPipeline(fmt, JOB_BATCH_CHUNK_ROWS)
+    scorer = pipeline.scorer
+    try:
+        with open(path, "rb") as src, open(out_path, "w", encoding="utf-8") as out:
+            def flush(chunks: List[List[tuple]]) -> None:
+                for records in chunks:
+                    out.write(scorer.score(records))
+                    progress.write_text(str(scorer.count))
+
+            while not pipeline.done and (data := src.read(1 << 16)):
+                flush(pipeline.feed(data))
+            flush(pipeline.finish())
+    finally:
+        Path(path).unlink(missing_ok=True)
+        progress.unlink(missing_ok=True)
+    if pipeline.error is not None:
+        out_path.unlink(missing_ok=True)
+        return {"error": {"status_code": 413, "detail": pipeline.error}}
+    return {"ok_count": scorer.ok_count, "count": scorer.count, "size": out_path.stat().st_size, "path": str(out_path)}
+
+class Job:
+    def __init__(self, kind: str, count: Optional[int], tasks: int, upload: Optional[str] = None):
+        self.id = secrets.token_urlsafe(12)
+        self.kind = kind
+        self.count = count                  # items (batch) or 1; None until an upload is scored
+        self.upload = upload                # uploaded input file, removed by the task or on cancel
+        self.tasks = tasks
+        self.state = "queued"
+        self.done = 0
+        self.ok_count = 0
+        self.error: Optional[Dict[str, Any]] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.chunks: List[Union[bytes, str, None]] = [None] * tasks  # bytes in memory or a spill path
+        self.memory_bytes = 0
+        self.result_bytes = 0
+        self.futures: List[Future] = []
+        self.pool: Optional[ProcessPoolExecutor] = None
+
+    def status(self) -> Dict[str, Any]:
+        state = self.state
+        if state == "queued" and any(f.running() for f in self.futures):
+            state = "running"
+        progress: Dict[str, Any] = {"done": self.done, "total": self.tasks}
+        if self.upload is not None:
+            progress["rows"] = self.count if self.count is not None else self._rows_scored()
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "state": state,
+            "progress": progress,
+            "count": self.count,
+            "ok_count": self.ok_count,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result_bytes": self.result_bytes,
+            "spilled": any(isinstance(c, str) for c in self.chunks),
+        }
+
+    def _rows_scored(self) -> int:
+        try:
+            return int(_upload_progress_path(self.upload).read_text())
+        except (OSError, ValueError):  # not started yet, or caught mid-write
+            return 0
+
+    def _drop_results(self) -> None:
+        if self.upload is not None:
+            Path(self.upload).unlink(missing_ok=True)
+        for chunk in self.chunks:
+            if isinstance(chunk, str):
+                Path(chunk).unlink(missing_ok=True)
+        self.chunks = [None] * self.tasks
+        self.memory_bytes = 0
+
+    def iter_result(self, block_size: int = 1 << 16):
+        for chunk in self.chunks:
+            if isinstance(chunk, bytes):
+                yield chunk
+            else:
+                with open(chunk, "rb") as f:
+                    while block := f.read(block_size):
+                        yield block
+        if self.kind == "batch":
+            yield _json_line({"done": True, "count": self.count, "ok_count": self.ok_count,
+                              "error_count": self.count - self.ok_count}).encode()
+
+class JobQueue:
+    """Jobs by id on a lazily created process pool; callbacks arrive on the pool's manager thread."""
+    def __init__(self):
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()  # least recently read first
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.workers = 0
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self.workers = _job_worker_count()
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+            logger.info("Job pool started with %d worker(s)", self.workers)
+        return self._pool
+
+    def _expire(self) -> None:
+        """Drops finished jobs past JOB_TTL_S, then least recently read ones over the count / memory bounds."""
+        cutoff = time.time() - JOB_TTL_S
+        finished = [job for job in self._jobs.values() if job.finished_at is not None]
+        excess = len(finished) - JOB_MAX_FINISHED
+        memory = sum(job.memory_bytes for job in finished)
+        for job in finished:
+            if job.finished_at < cutoff or excess > 0 or memory > JOB_FINISHED_MEMORY_BYTES:
+                excess -= 1
+                memory -= job.memory_bytes
+                job._drop_results()
+                del self._jobs[job.id]
+
+    def submit(self, kind: str, tasks: List[Any], count: Optional[int], upload: Optional[str] = None) -> Job:
+        """Queues one pool task per item of `tasks`, or the scoring of an uploaded file (tasks = [(path, format)])."""
+        runner = _run_upload_task if upload is not None else _run_job_task
+        with self._lock:
+            self._expire()
+            active = sum(1 for j in self._jobs.values() if j.state not in _JOB_FINISHED)
+            if active >= JOB_MAX_ACTIVE:
+                raise HTTPException(status_code=429, detail=f"Too many active jobs ({active}); retry later.")
+            job = Job(kind, count, len(tasks), upload)
+            self._jobs[job.id] = job
+            pool = job.pool = self._executor()
+            for i, data in enumerate(tasks):
+                future = pool.submit(runner, job.id, i, kind, data, JOB_SPILL_DIR)
+                job.futures.append(future)
+        for i, future in enumerate(job.futures):
+            future.add_done_callback(functools.partial(self._on_task_done, job, i))
+        return job
+
+    def _on_task_done(self, job: Job, index: int, future: Future) -> None:
+        if future.cancelled():
+            return
+        exc = future.exception()
+        res = None if exc is not None else future.result()
+        with self._lock:
+            if job.state in _JOB_FINISHED:
+                if res is not None and "path" in res:
+                    Path(res["path"]).unlink(missing_ok=True)
+                return
+            if exc is not None or "error" in res:
+                broken = isinstance(exc, BrokenProcessPool)  # e.g. a worker was OOM-killed
+                if broken and self._pool is job.pool:
+                    self._pool = None  # the next job starts a fresh pool
+                job.error = res["error"] if res is not None else {"status_code": 500, "detail": f"Worker failed: {exc!r}"}
+                self._finish(job, "failed", cancel=not broken)  # a broken pool fails the rest itself
+                return
+            if job.started_at is None:
+                job.started_at = time.time()
+            job.state = "running"
+            body = res.get("body")
+            if body is not None and job.memory_bytes + len(body) > JOB_RESULT_MEMORY_BYTES:
+                job.chunks[index] = _job_spill(job.id, index, body)
+            elif body is not None:
+                job.chunks[index] = body
+                job.memory_bytes += len(body)
+            else:
+                job.chunks[index] = res["path"]
+            job.result_bytes += res["size"]
+            job.ok_count += res["ok_count"]
+            if "count" in res:
+                job.count = res["count"]
+            job.done += 1
+            if job.done == job.tasks:
+                self._finish(job, "done")
+
+    def _finish(self, job: Job, state: str, cancel: bool = True) -> None:
+        job.state = state
+        job.finished_at = time.time()
+        if state != "done":
+            if cancel:
+                for future in job.futures:
+                    future.cancel()
+            job._drop_results()
+        self._expire()
+
+    def get(self, job_id: str) -> Job:
+        with self._lock:
+            self._expire()
+            job = self._jobs.get(job_id)
+            if job is not None:
+                self._jobs.move_to_end(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail=f"No job {job_id}.")
+        return job
+
+    def cancel(self, job_id: str) -> Job:
+        job = self.get(job_id)
+        with self._lock:
+            if job.state not in _JOB_FINISHED:
+                self._finish(job, "cancelled")
+        return job
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+            for job in self._jobs.values():
+                job._drop_results()
+            self._jobs.clear()
+
+job_queue = JobQueue()
+
+def _job_tasks(payload: JobIn) -> tuple:
+    """Validates a job request up front; returns (tasks, item count)."""
+    try:
+        if payload.kind == "batch":
+            rows = _batch_rows(ImpactBatchIn.model_validate(payload.payload))
+            if len(rows) > JOB_BATCH_MAX_ITEMS:
+                raise HTTPException(status_code=413, detail=f"Batch too large: {len(rows)} items (max {JOB_BATCH_MAX_ITEMS}).")
+            records = list(enumerate(rows))
+            return [records[i:i + JOB_BATCH_CHUNK_ROWS] for i in range(0, len(records), JOB_BATCH_CHUNK_ROWS)] or [[]], len(rows)
+        model = SweepIn if payload.kind == "sweep" else UncertaintyIn
+        model.model_validate(payload.payload)
+        return [payload.payload], 1
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False))
+
+def _check_declared_length(request: Request, limit: int) -> None:
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > limit:
+        raise HTTPException(status_code=413, detail=f"Request body over {limit} bytes.")
+
+@router.post("/api/jobs", status_code=202)
+async def job_submit(request: Request):
+    """Body: JobIn. Read with a size cap before anything is parsed."""
+    _require_single_worker("Background jobs")
+    _check_declared_length(request, JOB_MAX_BODY_BYTES)
+    body = bytearray()
+    async for data in request.stream():
+        body += data
+        if len(body) > JOB_MAX_BODY_BYTES:
+            raise HTTPException(status_code=413, detail=f"Request body over {JOB_MAX_BODY_BYTES} bytes; use /api/jobs/upload for large batches.")
+
+    def submit() -> Dict[str, Any]:
+        try:
+            payload = JobIn.model_validate_json(body)
+        except ValidationError as e:  # no inputs: a malformed body would be echoed back whole
+            raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False, include_input=False))
+        tasks, count = _job_tasks(payload)
+        return job_queue.submit(payload.kind, tasks, count).status()
+
+    return await run_in_threadpool(submit)
+
+@router.post("/api/jobs/upload", status_code=202)
+async def job_upload(
+    request: Request,
+    fmt: Optional[Literal["ndjson", "csv"]] = Query(default=None, alias="format"),
+):
+    """Batch job from an NDJSON / CSV body (as /api/impact/stream), copied to disk unparsed."""
+    _require_single_worker("Background jobs")
+    fmt = _stream_format(request, fmt)
+    _check_declared_length(request, JOB_UPLOAD_MAX_BYTES)
+    JOB_SPILL_DIR.mkdir(parents=True, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix="upload-", suffix=f".{fmt}", dir=JOB_SPILL_DIR)
+    try:
+        size = 0
+        with os.fdopen(fd, "wb") as f:
+            async for data in request.stream():
+                size += len(data)
+                if size > JOB_UPLOAD_MAX_BYTES:
+                    raise HTTPException(status_code=413, detail=f"Upload over {JOB_UPLOAD_MAX_BYTES} bytes.")
+                f.write(data)  # page-cache write of one receive buffer; cheaper than a thread hop
+        return job_queue.submit("batch", [(path, fmt)], None, upload=path).status()
+    except BaseException:
+        Path(path).unlink(missing_ok=True)
+        raise
+
+@router.get("/api/jobs/{job_id}")
+def job_status(job_id: str):
+    return job_queue.get(job_id).status()
+
+@router.delete("/api/jobs/{job_id}")
+def job_cancel(job_id: str):
+    return job_queue.cancel(job_id).status()
+
+@router.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """NDJSON status lines whenever the status changes, until the job ends."""
+    job = job_queue.get(job_id)
+
+    async def events():
+        last = None
+        while True:
+            status = job.status()
+            line = _json_line(status)
+            if line != last:
+                yield line
+                last = line
+            if status["state"] in _JOB_FINISHED:
+                return
+            await asyncio.sleep(JOB_EVENTS_INTERVAL_S)
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+@router.get("/api/jobs/{job_id}/result")
+def job_result(job_id: str):
+    job = job_queue.get(job_id)
+    if job.state != "done":
+        raise HTTPException(status_code=409, detail=f"Job is {job.state}." if job.state != "failed" else job.error)
+    return StreamingResponse(job.iter_result(), media_type=_JOB_MEDIA_TYPES[job.kind])
+
+
+
+
+
+# ------------------------------------------------------------------------------
+# Pages (Jinja templates)
+# ------------------------------------------------------------------------------
+# Template contexts are constant, so with PRERENDER_PAGES each page is rendered
+# and compressed once (by the startup warm-up or its first request) and served
+# from memory with ETags.
+_PAGE_CONTEXTS = {
+    "index.html": {"title": "Green Toolkit", "subtitle": "We are ready to build green tool"},
+    "gamification.html": {"title": "Gamification"},
+    "tools.html": {"title": "Tools & Calculators"},
+    "sim.html": {"title": "Simulations"},
+}
+
+@functools.lru_cache(maxsize=None)
+def _prerendered_page(name: str) -> CompressedBody:
+    html = get_templates().get_template(name).render(_PAGE_CONTEXTS[name])
+    return CompressedBody(html.encode("utf-8"), "text/html; charset=utf-8")
+
+def _page(request: Request, name: str):
+    if PRERENDER_PAGES:
+        return compressed_response(request, _prerendered_page(name), _REVALIDATE_CACHE_CONTROL)
+    return get_templates().TemplateResponse(name, {"request": request, **_PAGE_CONTEXTS[name]})
+
+@router.get("/", response_class=HTMLResponse)
+def home(request: Request):
+    return _page(request, "index.html")
+
+@router.get("/gamification", response_class=HTMLResponse)
+def gamification_page(request: Request):
+    return _page(request, "gamification.html")
+
+@router.get("/tools", response_class=HTMLResponse)
+def tools_page(request: Request):
+    return _page(request, "tools.html")
+
+# ------------------------------------------------------------------------------
+# Optional: One-App Mode for Vite frontend (currently not used)
+# ------------------------------------------------------------------------------
+# If you want to serve a Vite-built SPA at /app, set FRONTEND_DIST env variable
+# to point to your dist folder. Otherwise, this section is ignored.
+
+@router.get("/simulate", response_class=HTMLResponse)
+def simulate_page(request: Request):
+    return _page(request, "sim.html")
+
+# ------------------------------------------------------------------------------
+# One-App Mode: serve the built Vite frontend (SPA) at /app
+# ------------------------------------------------------------------------------
+def _pick_frontend_dist() -> Optional[Path]:
+    """Try to find a Vite 'dist' folder. Override with env FRONTEND_DIST."""
+    env_path = os.getenv("FRONTEND_DIST")
+    if env_path:
+        p = Path(env_path)
+        if p.is_dir():
+            return p
+
+    # Common locations (adjust if your layout differs)
+    candidates = [
+        BASE_DIR / "dist",
+        BASE_DIR / "frontend" / "dist",
+        BASE_DIR / "vite_project_1" / "dist",
+        BASE_DIR.parent / "frontend" / "dist",
+        BASE_DIR.parent / "vite_project_1" / "dist",
+    ]
+    for c in candidates:
+        if c.is_dir():
+            return c
     return None
 
-_frontend_dist = _pick_frontend_dist()
-if _frontend_dist:
-    app.mount("/app", StaticFiles(directory=str(_frontend_dist), html=True), name="app")
-else:
+def _frontend_app():
+    frontend_dist = _pick_frontend_dist()
+    if frontend_dist:
+        return PrecompressedStaticFiles(directory=str(frontend_dist), html=True)
     # Not fatal—just print a hint. Build your Vite app to create dist/.
     print(
         "[One-App Mode] Vite 'dist' not found. Set FRONTEND_DIST env var or build your frontend "
-        "(e.g. cd vite_project_1 && pnpm build)."
+        "(e.g. cd vite_project_1 && pnpm build).",
+        file=sys.stderr,
     )
+    return None
+
+_frontend_app_lazy = _LazyASGIApp(_frontend_app)
+
+# ------------------------------------------------------------------------------
+# App factory
+# ------------------------------------------------------------------------------
+def _warm_up() -> None:
+    """Initialize the lazy subsystems so the first real requests do not pay for them."""
+    started = time.perf_counter()
+    importlib.import_module("numpy")
+    get_chemical_index()
+    _static_app.resolve()
+    _frontend_app_lazy.resolve()
+    if PRERENDER_PAGES:
+        for name in _PAGE_CONTEXTS:
+            _prerendered_page(name)
+    else:
+        get_templates()
+    logger.info("Warm-up finished in %.0f ms", (time.perf_counter() - started) * 1000)
+
+def _log_warm_up_failure(future: "asyncio.Future") -> None:
+    # Retrieving the exception here also stops asyncio's "never retrieved" warning.
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("Warm-up failed; subsystems will initialize on first use", exc_info=future.exception())
+
+@asynccontextmanager
+async def _lifespan(application: FastAPI):
+    # Runs after uvicorn has bound the port; warm-up is not awaited so startup
+    # completes immediately and early requests are served while it runs.
+    if WARM_UP_ON_STARTUP:
+        warm_up = asyncio.get_running_loop().run_in_executor(None, _warm_up)
+        warm_up.add_done_callback(_log_warm_up_failure)
+    lag_monitor = asyncio.create_task(_monitor_loop_lag(METRICS_LOOP_LAG_INTERVAL_S)) if METRICS_ENABLED else None
+    session_sweeper = asyncio.create_task(_sweep_sim_sessions(SIM_SWEEP_INTERVAL_S))
+    yield
+    if lag_monitor is not None:
+        lag_monitor.cancel()
+    session_sweeper.cancel()
+    job_queue.shutdown()
+
+def create_app() -> FastAPI:
+    """Build the ASGI app; cheap because subsystems initialize lazily."""
+    application = FastAPI(title="Green Toolkit", lifespan=_lifespan)
+
+    if ADMISSION_ENABLED:
+        application.add_middleware(AdmissionMiddleware)  # innermost: CORS preflights skip it, rejections get CORS headers
+    # Add CORS middleware
+    application.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],  # Allow all origins for now
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    if METRICS_ENABLED:
+        application.add_middleware(MetricsMiddleware)  # added last = outermost, so CORS time is included
+    application.mount("/static", _static_app, name="static")
+    application.mount("/app", _frontend_app_lazy, name="app")
+    application.include_router(router)
+    return application
+
+app = create_app()
@@ -0,0 +1,286 @@
+"""
+Pre-fork serving mode: import and warm the app once, then fork uvicorn workers
+that share its memory copy-on-write and accept from one listening socket.
+
+Used by run_server.py when WORKERS is not 1. POSIX only (needs os.fork).
+
+The supervisor process never serves requests. It
+  * keeps the configured number of workers alive (a worker that exits is replaced),
+  * recycles workers after about --max-requests requests (uvicorn's
+    limit_max_requests, jittered so workers do not restart together) or when a
+    worker's private memory passes WORKER_MAX_MEMORY_MB,
+  * on SIGHUP replaces all workers one by one (rolling restart, no dropped connections),
+  * on SIGTERM / SIGINT drains: workers stop accepting, finish in-flight requests
+    (up to GRACEFUL_TIMEOUT_S), run the lifespan shutdown and exit.
+
+Memory recycling and SIGHUP share one rollout queue. For each old worker a
+replacement is forked; the old worker gets SIGTERM only once the replacement
+reports through a pipe that its lifespan startup finished and it is accepting, and
+the next worker is replaced only after the old one has drained and exited, so there
+is at most one extra worker at a time. A replacement that exits, or is not serving
+within READY_TIMEOUT_S, stops the rollout and leaves the remaining workers serving.
+
+Preloaded code is not re-imported on SIGHUP; restart the supervisor to deploy new code.
+"""
+import gc
+import logging
+import os
+import random
+import signal
+import socket
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+MEMORY_CHECK_INTERVAL_S = 5.0
+READY_TIMEOUT_S = 60.0
+
+
+def _status_kb(pid: int, field: str) -> Optional[int]:
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def private_memory_mb(pid: int) -> Optional[float]:
+    """Memory only this process holds (USS: private clean + dirty pages); falls back to RSS."""
+    try:
+        kb = 0
+        for line in Path(f"/proc/{pid}/smaps_rollup").read_text().splitlines():
+            if line.startswith(("Private_Clean:", "Private_Dirty:")):
+                kb += int(line.split()[1])
+        return kb / 1024
+    except (OSError, ValueError):
+        rss_kb = _status_kb(pid, "VmRSS")
+        return rss_kb / 1024 if rss_kb is not None else None
+
+
+def memory_budget_mb() -> Optional[float]:
+    """WEB_MEMORY_BUDGET_MB, else the cgroup v2 limit, else None (unknown)."""
+    if os.environ.get("WEB_MEMORY_BUDGET_MB"):
+        return float(os.environ["WEB_MEMORY_BUDGET_MB"])
+    try:
+        limit = Path("/sys/fs/cgroup/memory.max").read_text().strip()
+        if limit != "max":
+            return int(limit) / 2**20
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def auto_worker_count(worker_memory_mb: float) -> int:
+    """min(usable cores, workers that fit next to the preloaded supervisor in the memory budget).
+
+    Background-job pools are not budgeted here: main refuses jobs when there is more than
+    one worker, and a single worker sizes its pool from the memory still available.
+    """
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    budget = memory_budget_mb()
+    if budget is None:
+        return cores
+    supervisor_mb = (_status_kb(os.getpid(), "VmRSS") or 0) / 1024  # shared with the workers after fork
+    return max(1, min(cores, int((budget - supervisor_mb) // worker_memory_mb)))
+
+
+class PreforkSupervisor:
+    def __init__(self, config: dict, sock: socket.socket, workers: int, max_requests: int = 0,
+                 max_memory_mb: float = 0, graceful_timeout_s: float = 30):
+        self.config = config          # uvicorn.Config keyword arguments, "app" already imported
+        self.sock = sock
+        self.workers = workers
+        self.max_requests = max_requests
+        self.max_memory_mb = max_memory_mb
+        self.graceful_timeout_s = graceful_timeout_s
+        self.children: Dict[int, float] = {}   # pid -> start time
+        self.retiring: Set[int] = set()        # already replaced, draining
+        self.ready_fds: Dict[int, int] = {}    # pid -> read end of its readiness pipe
+        self.queue: List[Tuple[int, str]] = []  # (old pid, reason) waiting to be replaced
+        self.rollout: Optional[dict] = None    # the replacement in progress
+        self._stopping = False
+        self._reload = False
+
+    # -- worker side ----------------------------------------------------------
+    def _run_worker(self, ready_fd: int) -> None:
+        import uvicorn
+
+        class Server(uvicorn.Server):
+            async def startup(self, sockets=None):
+                await super().startup(sockets=sockets)
+                if self.started:
+                    os.write(ready_fd, b"1")  # the supervisor may now retire the worker this one replaces
+
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(sig, signal.SIG_DFL)  # uvicorn installs its own for TERM / INT
+        gc.enable()
+        config = dict(self.config, timeout_graceful_shutdown=int(self.graceful_timeout_s))
+        if self.max_requests:
+            config["limit_max_requests"] = self.max_requests + random.randint(0, self.max_requests // 10)
+        Server(uvicorn.Config(**config)).run(sockets=[self.sock])
+
+    def _spawn(self) -> int:
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                for fd in (read_fd, *self.ready_fds.values()):
+                    os.close(fd)
+                self._run_worker(write_fd)
+            except BaseException:
+                logger.exception("Worker %d crashed", os.getpid())
+                code = 1
+            finally:
+                os._exit(code)
+        os.close(write_fd)
+        os.set_blocking(read_fd, False)
+        self.ready_fds[pid] = read_fd
+        self.children[pid] = time.monotonic()
+        logger.info("Worker %d started (%d running)", pid, len(self.children))
+        return pid
+
+    def _is_ready(self, pid: int) -> bool:
+        fd = self.ready_fds.get(pid)
+        if fd is None:
+            return False
+        try:
+            return os.read(fd, 1) == b"1"
+        except BlockingIOError:
+            return False
+
+    def _close_ready_fd(self, pid: int) -> None:
+        fd = self.ready_fds.pop(pid, None)
+        if fd is not None:
+            os.close(fd)
+
+    def _replace(self, pid: int, reason: str) -> None:
+        """Queue a worker for replacement; _advance_rollout replaces one worker at a time."""
+        if pid not in self.retiring and all(pid != queued for queued, _ in self.queue) and \
+                not (self.rollout and self.rollout["old"] == pid):
+            self.queue.append((pid, reason))
+
+    def _advance_rollout(self) -> None:
+        """Fork a replacement, retire the old worker once the new one serves, wait for it to drain."""
+        step = self.rollout
+        if step is None:
+            while self.queue:
+                old, reason = self.queue.pop(0)
+                if old in self.children:
+                    logger.info("Replacing worker %d: %s", old, reason)
+                    self.rollout = {"old": old, "new": self._spawn(), "since": time.monotonic(), "serving": False}
+                    return
+            return
+        if not step["serving"]:
+            if step["new"] not in self.children:
+                self._abort_rollout(f"replacement {step['new']} exited before serving")
+            elif self._is_ready(step["new"]):
+                step["serving"] = True
+                self._close_ready_fd(step["new"])
+                if step["old"] in self.children:
+                    self.retiring.add(step["old"])
+                    self._signal(step["old"], signal.SIGTERM)
+            elif time.monotonic() - step["since"] > READY_TIMEOUT_S:
+                self.retiring.add(step["new"])
+                self._signal(step["new"], signal.SIGTERM)
+                self._abort_rollout(f"replacement {step['new']} not serving after {READY_TIMEOUT_S:.0f}s")
+        elif step["old"] not in self.children:
+            self.rollout = None  # drained (reaped); the next queued worker goes on the following pass
+
+    def _abort_rollout(self, reason: str) -> None:
+        logger.error("Rolling replacement stopped, %d worker(s) left as they are: %s", len(self.queue) + 1, reason)
+        old = self.rollout["old"]
+        self.rollout = None
+        self.queue.clear()
+        if old not in self.children and not self._stopping:
+            self._spawn()  # the old worker exited meanwhile; keep the configured count
+
+    @staticmethod
+    def _signal(pid: int, sig: int) -> None:
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+    # -- supervisor loop -------------------------------------------------------
+    def _reap(self) -> None:
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            if self.children.pop(pid, None) is None:
+                continue
+            self._close_ready_fd(pid)
+            code = os.waitstatus_to_exitcode(status)
+            if self.rollout and pid == self.rollout["new"] and not self.rollout["serving"]:
+                logger.error("Replacement worker %d exited with code %d before serving", pid, code)
+            elif self.rollout and pid == self.rollout["old"] and not self.rollout["serving"]:
+                logger.info("Worker %d exited (code %d) while its replacement starts", pid, code)
+            elif pid in self.retiring:
+                self.retiring.discard(pid)
+                logger.info("Worker %d drained", pid)
+            elif not self._stopping:
+                # Exit code 0 outside a drain = uvicorn reached limit_max_requests.
+                logger.info("Worker %d exited (%s); starting a replacement",
+                            pid, "recycled after max requests" if code == 0 else f"code {code}")
+                self._spawn()
+
+    def _check_memory(self) -> None:
+        for pid in list(self.children):
+            if pid in self.retiring or (self.rollout and pid == self.rollout["new"]):
+                continue
+            mb = private_memory_mb(pid)
+            if mb is not None and mb > self.max_memory_mb:
+                self._replace(pid, f"private memory {mb:.0f} MB > {self.max_memory_mb:.0f} MB")
+
+    def _drain_all(self) -> None:
+        logger.info("Draining %d worker(s)", len(self.children))
+        for pid in self.children:
+            self._signal(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.graceful_timeout_s + 5
+        while self.children and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        for pid in self.children:
+            logger.warning("Worker %d did not drain in time; killing it", pid)
+            self._signal(pid, signal.SIGKILL)
+
+    def run(self) -> None:
+        def on_stop(signum, frame):
+            self._stopping = True
+
+        def on_hup(signum, frame):
+            self._reload = True
+
+        signal.signal(signal.SIGTERM, on_stop)
+        signal.signal(signal.SIGINT, on_stop)
+        signal.signal(signal.SIGHUP, on_hup)
+
+        # Objects created by the preload are never freed; keeping the collector
+        # off them stops it from dirtying (and so copying) their pages in workers.
+        gc.collect()
+        gc.freeze()
+        for _ in range(self.workers):
+            self._spawn()
+
+        next_memory_check = time.monotonic() + MEMORY_CHECK_INTERVAL_S
+        while not self._stopping:
+            self._reap()
+            if self._reload:
+                self._reload = False
+                for pid in [p for p in self.children if not (self.rollout and p == self.rollout["new"])]:
+                    self._replace(pid, "SIGHUP")
+            self._advance_rollout()
+            if self.max_memory_mb and time.monotonic() >= next_memory_check:
+                next_memory_check = time.monotonic() + MEMORY_CHECK_INTERVAL_S
+                self._check_memory()
+            time.sleep(0.2)
+        self._drain_all()
+        logger.info("Supervisor stopped")
@@ -0,0 +1,154 @@
+"""
+Cold-start profiler.
+
+Measures, in fresh processes:
+  * import time of `main`, broken down per module (python -X importtime)
+  * time from launching run_server.py to the first byte of /api/health
+    (and of the first page and compute request after it)
+
+Usage:
+    python profile_startup.py                 # human-readable report
+    python profile_startup.py --runs 5 --json # machine-readable
+    python profile_startup.py --budget-ms 1500  # exit 1 if median TTFB exceeds the budget
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+BASE_DIR = Path(__file__).parent.resolve()
+
+COMPUTE_PAYLOAD = json.dumps({
+    "product": {"mw": 180.16, "actual_mass_g": 10.0},
+    "reactants": [{"mw": 138.12, "mass_g": 12.0}],
+}).encode()
+
+
+def import_profile() -> dict:
+    """Run `import main` under -X importtime; returns total and per-module times (ms)."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=BASE_DIR, capture_output=True, text=True, env={**os.environ, "WARM_UP_ON_STARTUP": "0"},
+    )
+    modules = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, self_us, cumulative_us, name = (part.strip() for part in line.replace("import time:", "|").split("|"))
+        modules.append({"module": name, "self_ms": int(self_us) / 1000, "cumulative_ms": int(cumulative_us) / 1000})
+    main_entry = next((m for m in modules if m["module"] == "main"), None)
+
+    # Self time summed per top-level package answers "who is paying for cold start".
+    packages: dict = {}
+    for m in modules:
+        top = m["module"].split(".")[0]
+        packages[top] = packages.get(top, 0.0) + m["self_ms"]
+    return {
+        "main_cumulative_ms": main_entry["cumulative_ms"] if main_entry else None,
+        "main_self_ms": main_entry["self_ms"] if main_entry else None,
+        "packages": dict(sorted(packages.items(), key=lambda kv: -kv[1])),
+        "modules": sorted(modules, key=lambda m: -m["cumulative_ms"]),
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _first_byte(url: str, data: bytes = None, timeout: float = 30.0) -> float:
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"} if data else {})
+    start = time.perf_counter()
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        resp.read(1)
+    return (time.perf_counter() - start) * 1000
+
+
+def ttfb_profile(timeout_s: float = 60.0) -> dict:
+    """Launch run_server.py and time the first successful responses (ms since launch)."""
+    port = _free_port()
+    env = {**os.environ, "PORT": str(port)}
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "run_server.py"], cwd=BASE_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base = f"http://127.0.0.1:{port}"
+    try:
+        while True:
+            if proc.poll() is not None:
+                raise RuntimeError(f"run_server.py exited with code {proc.returncode}")
+            if time.perf_counter() - start > timeout_s:
+                raise RuntimeError("server did not answer in time")
+            try:
+                _first_byte(f"{base}/api/health", timeout=timeout_s)
+                break
+            except OSError:
+                time.sleep(0.005)
+        ttfb_ms = (time.perf_counter() - start) * 1000
+        return {
+            "ttfb_health_ms": ttfb_ms,
+            "first_page_ms": _first_byte(f"{base}/"),
+            "first_compute_ms": _first_byte(f"{base}/api/impact/compute", COMPUTE_PAYLOAD),
+        }
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Profile cold-start time of the Green Toolkit backend.")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh processes per measurement (median is reported)")
+    parser.add_argument("--top", type=int, default=15, help="Modules / packages to list")
+    parser.add_argument("--budget-ms", type=float, help="Fail (exit 1) if median TTFB exceeds this")
+    parser.add_argument("--json", action="store_true", help="Print machine-readable JSON")
+    args = parser.parse_args(argv)
+
+    imports = [import_profile() for _ in range(args.runs)]
+    ttfbs = [ttfb_profile() for _ in range(args.runs)]
+    median = lambda key, rows: statistics.median(r[key] for r in rows if r[key] is not None)
+
+    report = {
+        "runs": args.runs,
+        "import_main_ms": median("main_cumulative_ms", imports),
+        "import_main_self_ms": median("main_self_ms", imports),
+        "ttfb_health_ms": median("ttfb_health_ms", ttfbs),
+        "first_page_ms": median("first_page_ms", ttfbs),
+        "first_compute_ms": median("first_compute_ms", ttfbs),
+        "packages_self_ms": dict(list(imports[-1]["packages"].items())[:args.top]),
+        "modules_cumulative_ms": {m["module"]: m["cumulative_ms"] for m in imports[-1]["modules"][:args.top]},
+        "budget_ms": args.budget_ms,
+    }
+    over_budget = args.budget_ms is not None and report["ttfb_health_ms"] > args.budget_ms
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"Cold start (median of {args.runs} runs)")
+        print(f"  import main            {report['import_main_ms']:8.1f} ms  (module body {report['import_main_self_ms']:.1f} ms)")
+        print(f"  launch -> /api/health  {report['ttfb_health_ms']:8.1f} ms")
+        print(f"  first page (/)         {report['first_page_ms']:8.1f} ms")
+        print(f"  first compute          {report['first_compute_ms']:8.1f} ms")
+        print("\nSelf import time by package:")
+        for name, ms in report["packages_self_ms"].items():
+            print(f"  {name:40} {ms:8.1f} ms")
+        print("\nSlowest imports (cumulative):")
+        for name, ms in report["modules_cumulative_ms"].items():
+            print(f"  {name:40} {ms:8.1f} ms")
+        if args.budget_ms is not None:
+            print(f"\nBudget {args.budget_ms:.0f} ms: {'EXCEEDED' if over_budget else 'ok'}")
+    return 1 if over_budget else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
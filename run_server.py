@@ -3,8 +3,12 @@ Production startup script for FastAPI server on Render.com
 """
 import os
 import sys
+import time
+import socket
 import logging
 
+_t0 = time.perf_counter()
+
 # Configure logging for production
 logging.basicConfig(
     level=logging.INFO,
@@ -12,14 +16,52 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Import after logging setup
-import uvicorn
-from main import app
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    """Bind and listen before the heavy imports, so the port is open (and the
+    kernel queues connections) while uvicorn and the app are still loading.
+
+    IPPROTO_TCP is explicit so accepted connections inherit it: asyncio only sets
+    TCP_NODELAY on sockets whose proto is TCP, and without it keep-alive responses
+    stall ~40 ms on Nagle + delayed ACK."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
 
 if __name__ == "__main__":
     # Get port from environment (Render provides PORT env variable)
     port = int(os.environ.get("PORT", 8000))
     env = os.environ.get("ENV", "development")
+
+    # Exported before importing the app: its admission control runs at most this many requests
+    # at once and queues / sheds the rest by priority, so /api/health stays fast under load.
+    # uvicorn's own limit (which also counts idle keep-alive connections and answers 503
+    # without looking at the path) is then only a backstop.
+    limit_concurrency = int(os.environ.get("LIMIT_CONCURRENCY", 20 if env == "production" else 50))
+    os.environ["LIMIT_CONCURRENCY"] = str(limit_concurrency)
+    admission_enabled = os.environ.get("ADMISSION_ENABLED", "1") == "1"
+    uvicorn_limit = int(os.environ.get("UVICORN_LIMIT_CONCURRENCY", limit_concurrency * 5)) if admission_enabled else limit_concurrency
+
+    # WORKERS: "1" (default) serves from this process; "auto" or N > 1 preloads the app
+    # here and forks copy-on-write workers (prefork.py, POSIX only).
+    workers_setting = os.environ.get("WORKERS", "1").strip().lower()
+    prefork_mode = workers_setting != "1" and hasattr(os, "fork")
+
+    # uvicorn cannot adopt a pre-bound socket on Windows
+    sock = bind_socket("0.0.0.0", port) if sys.platform != "win32" else None
+    _t_bound = time.perf_counter()
+
+    # Import after logging setup and socket bind
+    import uvicorn
+    import main
+    from main import app
+    if prefork_mode:
+        main._warm_up()  # numpy, lookup tables, templates / pre-rendered pages: loaded once, shared by all workers
+    _t_imported = time.perf_counter()
     
     logger.info(f"🚀 Starting Green Toolkit Backend")
     logger.info(f"📋 Environment: {env}")
@@ -35,8 +77,8 @@ if __name__ == "__main__":
         "reload": False,
         "log_level": "info",
         "access_log": env != "production",  # Disable access logs in production to save memory
-        "workers": 1,  # Single worker for free tier memory constraints (512MB)
-        "limit_concurrency": 50,  # Allow more concurrent requests
+        "workers": 1,  # In-process server; WORKERS=auto|N switches to pre-fork mode below
+        "limit_concurrency": uvicorn_limit,  # backstop; LIMIT_CONCURRENCY (50, 20 in production) is enforced by admission control
         "timeout_keep_alive": 30,  # Keep connections alive longer for better performance
         "loop": "asyncio",  # Use asyncio for better async performance
     }
@@ -45,16 +87,40 @@ if __name__ == "__main__":
     if env == "production":
         uvicorn_config.update({
             "timeout_keep_alive": 5,  # Shorter timeout in production
-            "limit_concurrency": 20,  # Lower concurrency for stability
         })
     
+    logger.info(
+        f"⏱️ Cold start: port bound after {(_t_bound - _t0) * 1000:.0f} ms, "
+        f"app imported after {(_t_imported - _t0) * 1000:.0f} ms"
+    )
     logger.info("🔧 Uvicorn configuration:")
     for key, value in uvicorn_config.items():
         if key != "app":  # Don't log the app object
             logger.info(f"   {key}: {value}")
     
     try:
-        uvicorn.run(**uvicorn_config)
+        if prefork_mode:
+            import prefork
+
+            worker_memory_mb = float(os.environ.get("WORKER_MEMORY_MB", 80))
+            workers = (prefork.auto_worker_count(worker_memory_mb) if workers_setting == "auto"
+                       else int(workers_setting))
+            logger.info(f"👥 Pre-fork mode: {workers} worker(s), memory budget {prefork.memory_budget_mb() or 'unknown'} MB")
+            main.WEB_WORKERS = workers  # before forking: features with per-process state refuse to split
+            prefork.PreforkSupervisor(
+                {k: v for k, v in uvicorn_config.items() if k != "workers"},
+                sock,
+                workers=workers,
+                max_requests=int(os.environ.get("WORKER_MAX_REQUESTS", 0)),
+                max_memory_mb=float(os.environ.get("WORKER_MAX_MEMORY_MB", 0)),
+                graceful_timeout_s=float(os.environ.get("GRACEFUL_TIMEOUT_S", 30)),
+            ).run()
+        elif sock is not None:
+            # Passed as a socket object rather than fd=: uvicorn re-wraps an fd as
+            # AF_UNIX, which keeps asyncio from enabling TCP_NODELAY.
+            uvicorn.Server(uvicorn.Config(**uvicorn_config)).run(sockets=[sock])
+        else:
+            uvicorn.run(**uvicorn_config)
     except Exception as e:
         logger.error(f"❌ Failed to start server: {e}")
         sys.exit(1)
@@ -0,0 +1,48 @@
+"""
+Offline scoring: run a local NDJSON or CSV file through the same streaming
+pipeline as POST /api/impact/stream, without going through HTTP.
+
+Usage:
+    python score_file.py reactions.ndjson -o results.ndjson
+    python score_file.py reactions.csv --chunk-rows 1000 > results.ndjson
+"""
+import argparse
+import sys
+
+from main import score_stream, IMPACT_STREAM_CHUNK_ROWS
+
+READ_BLOCK_BYTES = 64 * 1024
+
+
+def _read_blocks(f):
+    while True:
+        data = f.read(READ_BLOCK_BYTES)
+        if not data:
+            return
+        yield data
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Score reactions from an NDJSON or CSV file.")
+    parser.add_argument("input", help="Input file ('-' for stdin)")
+    parser.add_argument("-o", "--output", help="Output NDJSON file (default: stdout)")
+    parser.add_argument("--format", choices=["ndjson", "csv"], help="Input format (default: from file extension)")
+    parser.add_argument("--chunk-rows", type=int, default=IMPACT_STREAM_CHUNK_ROWS, help="Rows scored per chunk")
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ("csv" if args.input.lower().endswith(".csv") else "ndjson")
+    src = sys.stdin.buffer if args.input == "-" else open(args.input, "rb")
+    dst = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        for block in score_stream(_read_blocks(src), fmt=fmt, chunk_rows=args.chunk_rows):
+            dst.write(block)
+    finally:
+        if src is not sys.stdin.buffer:
+            src.close()
+        if dst is not sys.stdout:
+            dst.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
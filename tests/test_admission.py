@@ -0,0 +1,82 @@
+"""Admission control: client keys, rate limits, queue timeouts and the /metrics exposition."""
+import asyncio
+import re
+
+from fastapi.testclient import TestClient
+
+import main
+
+
+def _scope(peer, *forwarded):
+    return {"client": (peer, 1234), "headers": [(b"x-forwarded-for", v.encode()) for v in forwarded]}
+
+
+def test_client_key_trusts_only_the_proxy_hops():
+    assert main._client_key(_scope("127.0.0.1"), 0) is None  # local, unproxied: exempt
+    assert main._client_key(_scope("127.0.0.1", "1.2.3.4"), 0) is None  # XFF ignored without proxies
+    assert main._client_key(_scope("10.0.0.9", "1.2.3.4"), 0) == "10.0.0.9"
+    # The client may prepend anything; the hop the proxy appended is the last one.
+    assert main._client_key(_scope("10.0.0.1", "127.0.0.1, 5.6.7.8"), 1) == "5.6.7.8"
+    assert main._client_key(_scope("10.0.0.1", "spoof", "5.6.7.8, 10.0.0.2"), 2) == "5.6.7.8"
+    assert main._client_key(_scope("10.0.0.1"), 1) == "10.0.0.1"  # no header: key on the peer
+
+
+def _controller(**kw):
+    args = dict(max_concurrent=1, heavy_share=1.0, queue_target_s=10.0, max_wait_s=0.05, max_queue=2,
+                buckets=None, heavy_cost=5.0)
+    args.update(kw)
+    return main.AdmissionController(**args)
+
+
+def test_timed_out_waiters_leave_the_queue():
+    async def run():
+        ctl = _controller()
+        assert ctl.try_acquire("light")
+        assert await asyncio.gather(ctl.acquire("light"), ctl.acquire("light")) == ["shed_timeout"] * 2
+        assert sum(len(q) for q in ctl.queues.values()) == 0
+        waiter = asyncio.ensure_future(ctl.acquire("light"))  # not shed as queue_full
+        await asyncio.sleep(0.01)
+        ctl.release("light")
+        assert await waiter is None and ctl.in_use["light"] == 1
+    asyncio.run(run())
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def run():
+        ctl = _controller(max_wait_s=5.0)
+        ctl.try_acquire("light")
+        waiter = asyncio.ensure_future(ctl.acquire("light"))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert len(ctl.queues["light"]) == 0
+    asyncio.run(run())
+
+
+def test_rate_limit_answers_429_with_retry_after():
+    async def ok(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    ctl = _controller(max_concurrent=4, buckets=main.TokenBuckets(rate=0.01, burst=2, max_clients=10))
+    client = TestClient(main.AdmissionMiddleware(ok, ctl, proxy_hops=1))
+    headers = {"X-Forwarded-For": "9.9.9.9"}
+    assert [client.get("/api/pmi", headers=headers).status_code for _ in range(2)] == [200, 200]
+    limited = client.get("/api/pmi", headers=headers)
+    assert limited.status_code == 429 and int(limited.headers["retry-after"]) >= 1
+    assert client.get("/api/pmi", headers={"X-Forwarded-For": "8.8.8.8"}).status_code == 200
+    assert client.get("/api/health", headers=headers).status_code == 200  # critical: never limited
+
+
+def test_metrics_exposition_declares_every_family():
+    with TestClient(main.create_app()) as client:
+        client.get("/api/health")
+        text = client.get("/metrics").text
+    typed = set(re.findall(r"^# TYPE (\S+) (\w+)$", text, re.M))
+    families = {name for name, _ in typed}
+    assert ("admission_heavy_slots", "gauge") in typed
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name = re.match(r"[a-zA-Z_:][a-zA-Z0-9_:]*", line).group(0)
+            base = re.sub(r"_(bucket|sum|count)$", "", name)
+            assert name in families or base in families, line
@@ -0,0 +1,81 @@
+"""Result cache and ETags on compute endpoints, and precompressed pages / static files."""
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import main
+
+REACTION = {"product": {"mw": 180.16, "actual_mass_g": 10}, "reactants": [{"mw": 138.12, "mass_g": 12}]}
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = main.ResultCache(1 << 20, 100, 600)
+    monkeypatch.setattr(main, "result_cache", cache)
+    return cache
+
+
+@pytest.fixture
+def client(cache):
+    return TestClient(main.create_app())
+
+
+def test_same_payload_hits_the_cache(client, cache):
+    first = client.post("/api/impact/compute", json=REACTION)
+    assert first.headers["X-Cache"] == "MISS"
+    # Key order, whitespace and spelled-out defaults do not change the key.
+    spelled_out = {"reactants": [{"mass_g": 12, "mw": 138.12}], "product": {"actual_mass_g": 10, "mw": 180.16},
+                   "solvents": []}
+    second = client.post("/api/impact/compute", json=spelled_out)
+    assert second.headers["X-Cache"] == "HIT" and second.headers["ETag"] == first.headers["ETag"]
+    assert second.content == first.content
+    changed = client.post("/api/impact/compute", json={**REACTION, "reactants": [{"mw": 138.12, "mass_g": 13}]})
+    assert changed.headers["X-Cache"] == "MISS" and changed.headers["ETag"] != first.headers["ETag"]
+    stats = client.get("/api/cache/stats").json()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 2, 2)
+
+
+def test_if_none_match_gets_304(client, cache, monkeypatch):
+    etag = client.post("/api/impact/compute", json=REACTION).headers["ETag"]
+    response = client.post("/api/impact/compute", json=REACTION, headers={"If-None-Match": f'"other", {etag}'})
+    assert response.status_code == 304 and response.headers["ETag"] == etag and not response.content
+    assert cache.stats()["not_modified"] == 1
+    monkeypatch.setattr(main, "IMPACT_FORMULA_VERSION", "test-bump")
+    assert client.post("/api/impact/compute", json=REACTION, headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_cache_bounds():
+    cache = main.ResultCache(max_bytes=10_000, max_entries=2, ttl_s=600)
+    for key in "abc":
+        cache.get_or_compute(key, lambda: b"x")
+    assert cache.get_or_compute("a", lambda: b"y") == (b"y", "MISS")  # evicted, least recently used
+    assert cache.stats()["evictions"] == 2
+    cache.get_or_compute("big", lambda: b"x" * 20_000)
+    assert cache.stats()["entries"] == 2  # larger than the whole cache: returned, not stored
+    expired = main.ResultCache(max_bytes=10_000, max_entries=2, ttl_s=-1)
+    expired.get_or_compute("a", lambda: b"x")
+    assert expired.get_or_compute("a", lambda: b"x")[1] == "MISS" and expired.stats()["expirations"] == 1
+
+
+def test_prerendered_page_is_compressed_and_revalidated(monkeypatch):
+    monkeypatch.setattr(main, "PRERENDER_PAGES", True)
+    client = TestClient(main.create_app())
+    plain = client.get("/tools", headers={"Accept-Encoding": "identity"})
+    packed = client.get("/tools", headers={"Accept-Encoding": "gzip"})
+    assert packed.headers["Content-Encoding"] == "gzip" and packed.content == plain.content  # httpx decodes it
+    assert packed.headers["ETag"] != plain.headers["ETag"] and packed.headers["Vary"] == "Accept-Encoding"
+    revalidated = client.get("/tools", headers={"Accept-Encoding": "gzip", "If-None-Match": packed.headers["ETag"]})
+    assert revalidated.status_code == 304
+
+
+def test_static_files_are_compressed(tmp_path):
+    (tmp_path / "app.css").write_text("body { color: green; }\n" * 100)
+    (tmp_path / "index-3f9a1c2b.js").write_text("console.log('x');\n" * 100)
+    app = FastAPI()
+    app.mount("/static", main.PrecompressedStaticFiles(directory=str(tmp_path)))
+    client = TestClient(app)
+    css = client.get("/static/app.css", headers={"Accept-Encoding": "gzip"})
+    assert css.headers["Content-Encoding"] == "gzip" and css.headers["Cache-Control"] == "public, no-cache"
+    assert css.text == (tmp_path / "app.css").read_text()
+    js = client.get("/static/index-3f9a1c2b.js", headers={"Accept-Encoding": "gzip;q=0"})
+    assert "Content-Encoding" not in js.headers and "immutable" in js.headers["Cache-Control"]
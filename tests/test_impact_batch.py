@@ -0,0 +1,60 @@
+"""/api/impact/compute-batch must serialize each result exactly like /api/impact/compute."""
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+PAYLOADS = [
+    # No solvents, catalysts or workup: every child sum and default is empty.
+    {"product": {"mw": 180.16, "actual_mass_g": 10}, "reactants": [{"mw": 138.12, "mass_g": 12}]},
+    {"product": {"mw": 180.16, "actual_mass_g": 10, "carbon_atoms": 9},
+     "reactants": [{"mw": 138.12, "mass_g": 12, "carbon_atoms": 7}],
+     "catalysts": [{"name": "Pd/C", "mw": 106.42, "mass_g": 0.5}]},
+    {"product": {"mw": 180, "actual_mass_g": 10},
+     "reactants": [{"mw": 138, "mass_g": 12, "eq_used": 1.2, "eq_stoich": 1}, {"mw": 102.09, "mass_g": 15}],
+     "solvents": [{"name": "H2O", "mass_g": 30, "recovery_pct": 0}, {"name": "ethanol", "volume_mL": 40, "recovery_pct": 80}],
+     "workup": {"aqueous_washes_g": 0, "drying_agents_g": 1},
+     "conditions": {"mode": "reflux", "time_h": 2}},
+]
+
+
+@pytest.fixture(scope="module")
+def client():
+    return TestClient(main.create_app())
+
+
+@pytest.mark.parametrize("payload", PAYLOADS)
+def test_batch_result_bytes_match_single(client, payload):
+    single = client.post("/api/impact/compute", json=payload)
+    batch = client.post("/api/impact/compute-batch", json={"items": [payload]})
+    assert single.status_code == batch.status_code == 200
+    result = batch.json()["results"][0]["result"]
+    assert json.dumps(result, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode() == single.content
+
+
+OVERFLOWING = [
+    {**PAYLOADS[0], "conditions": {"mode": "hotplate", "time_h": 1e308},
+     "options": {"energy_presets_kw": {"hotplate": {"kw": 1e308, "duty": 1}, "other": {"kw": 1, "duty": 1}}}},
+    {"product": {"mw": 180.16, "actual_mass_g": 1e-300}, "reactants": [{"mw": 138.12, "mass_g": 1e300}]},
+]
+
+
+@pytest.mark.parametrize("bad", OVERFLOWING)
+def test_overflowing_item_fails_alone(client, bad):
+    single = client.post("/api/impact/compute", json=bad)
+    assert single.status_code == 400
+    batch = client.post("/api/impact/compute-batch", json={"items": [PAYLOADS[0], bad, PAYLOADS[2]]})
+    assert batch.status_code == 200
+    results = batch.json()["results"]
+    assert [r["ok"] for r in results] == [True, False, True]
+    assert results[1]["error"] == {"status_code": 400, "detail": single.json()["detail"]}
+
+
+def test_overflowing_row_does_not_cut_the_stream(client):
+    body = "".join(json.dumps(p) + "\n" for p in [PAYLOADS[0], *OVERFLOWING, PAYLOADS[1]])
+    response = client.post("/api/impact/stream", content=body, headers={"content-type": "application/x-ndjson"})
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line.get("ok") for line in lines[:-1]] == [True, False, False, True]
+    assert lines[-1] == {"done": True, "count": 4, "ok_count": 2, "error_count": 2}
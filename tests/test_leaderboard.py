@@ -0,0 +1,87 @@
+"""Leaderboards: top-K ordering, ties, window rollover and ETag revalidation."""
+import calendar
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+def _report(e_factor, atom_economy=50.0, pmi=10.0):
+    return {"e_factor": e_factor, "atom_economy_pct": atom_economy, "pmi": pmi}
+
+
+def _entries(boards, window, board, now):
+    _, body = boards.snapshot(window, 10, now=now)
+    return [(e["user"], e["value"]) for e in body["boards"][board]["entries"]]
+
+
+NOW = calendar.timegm((2026, 3, 4, 12, 0, 0))  # a Wednesday
+
+
+def test_rank_order_and_only_improvements_count():
+    boards = main.Leaderboards(k=3)
+    boards.ingest("a", "r", _report(5.0), now=NOW)
+    boards.ingest("b", "r", _report(2.0), now=NOW)
+    ranks = boards.ingest("c", "r", _report(8.0), now=NOW)
+    assert ranks["daily"]["e_factor"] == 3
+    assert boards.ingest("b", "r", _report(9.0), now=NOW)["daily"]["e_factor"] == 1  # worse score ignored
+    assert _entries(boards, "daily", "e_factor", NOW) == [("b", 2.0), ("a", 5.0), ("c", 8.0)]
+    boards.ingest("d", "r", _report(1.0), now=NOW)  # pushes c out of the top 3
+    assert _entries(boards, "daily", "e_factor", NOW) == [("d", 1.0), ("b", 2.0), ("a", 5.0)]
+    assert boards.ingest("c", "r", _report(7.0), now=NOW)["daily"]["e_factor"] is None
+
+
+def test_ties_rank_the_earlier_submission_first():
+    boards = main.Leaderboards(k=5)
+    for user in ("x", "y", "z"):
+        boards.ingest(user, "r", _report(3.0), now=NOW)
+    assert [u for u, _ in _entries(boards, "weekly", "e_factor", NOW)] == ["x", "y", "z"]
+    assert [u for u, _ in _entries(boards, "weekly", "atom_economy", NOW)] == ["x", "y", "z"]
+
+
+def test_pmi_improvement_against_first_pmi():
+    boards = main.Leaderboards(k=5)
+    assert boards.ingest("a", "r", _report(5.0, pmi=20.0), now=NOW)["all"]["pmi_improvement"] is None
+    boards.ingest("a", "r2", _report(5.0, pmi=15.0), now=NOW)
+    assert _entries(boards, "all", "pmi_improvement", NOW) == [("a", 25.0)]
+
+
+def test_window_rollover_starts_empty_boards():
+    boards = main.Leaderboards(k=5)
+    boards.ingest("a", "r", _report(5.0), now=NOW)
+    next_day, next_week = NOW + 86400, NOW + 7 * 86400
+    assert _entries(boards, "daily", "e_factor", next_day) == []
+    assert _entries(boards, "weekly", "e_factor", next_day) == [("a", 5.0)]
+    assert _entries(boards, "weekly", "e_factor", next_week) == []
+    assert _entries(boards, "all", "e_factor", next_week) == [("a", 5.0)]
+    _, body = boards.snapshot("daily", 10, now=next_day)
+    assert body["period"] == "2026-03-05"
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(main, "leaderboards", main.Leaderboards(main.LEADERBOARD_K))
+    return TestClient(main.create_app())
+
+
+SUBMIT = {"user": "ana", "reaction": "Aspirin",
+          "payload": {"product": {"mw": 180.16, "actual_mass_g": 10}, "reactants": [{"mw": 138.12, "mass_g": 12}]}}
+
+
+def test_etag_revalidates_only_while_the_body_is_unchanged(client):
+    assert client.post("/api/leaderboard/submit", json=SUBMIT).status_code == 200
+    first = client.get("/api/leaderboard?window=all")
+    etag = first.headers["etag"]
+    assert first.json()["boards"]["e_factor"]["entries"][0]["user"] == "ana"
+
+    client.post("/api/leaderboard/submit", json=SUBMIT)  # same score: top K unchanged
+    again = client.get("/api/leaderboard?window=all", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert client.get("/api/leaderboard?window=all").content == first.content
+
+    better = {**SUBMIT, "user": "bo", "payload": {**SUBMIT["payload"], "product": {"mw": 180.16, "actual_mass_g": 11}}}
+    client.post("/api/leaderboard/submit", json=better)
+    changed = client.get("/api/leaderboard?window=all", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["etag"] != etag
+    assert [e["user"] for e in changed.json()["boards"]["e_factor"]["entries"]] == ["bo", "ana"]
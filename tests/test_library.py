@@ -0,0 +1,60 @@
+"""/api/library/*: insert with per-row errors, filtered and keyset-paginated queries, lookup, rescoring."""
+import sqlite3
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+def _reaction(name, reactant_g):
+    return {"product": {"name": name, "mw": 180.16, "actual_mass_g": 10},
+            "reactants": [{"mw": 138.12, "mass_g": reactant_g}]}
+
+
+@pytest.fixture
+def library(tmp_path, monkeypatch):
+    lib = main.ReactionLibrary(tmp_path / "library.db")
+    monkeypatch.setattr(main, "get_reaction_library", lambda: lib)
+    return lib
+
+
+@pytest.fixture
+def client(library):
+    return TestClient(main.create_app())
+
+
+def _insert(client, items):
+    return client.post("/api/library/reactions", json={"items": items}).json()
+
+
+def test_insert_scores_rows_and_reports_errors(client):
+    out = _insert(client, [_reaction("a", 12), {"product": {"mw": 1}}, _reaction("b", 15)])
+    assert (out["count"], out["ok_count"], out["error_count"]) == (3, 2, 1)
+    assert [r["ok"] for r in out["results"]] == [True, False, True]
+    assert out["results"][1]["error"]["status_code"] == 422
+    entry = client.get(f"/api/library/reactions/{out['results'][2]['id']}").json()
+    assert entry["name"] == "b" and entry["payload"] == _reaction("b", 15)
+    assert entry["result"] == client.post("/api/impact/compute", json=_reaction("b", 15)).json()
+    assert client.get("/api/library/reactions/999").status_code == 404
+
+
+def test_query_filters_sorts_and_pages(client):
+    _insert(client, [_reaction(f"r{g}", g) for g in (14, 11, 20, 12, 13)])
+    first = client.post("/api/library/query", json={"where": {"pmi": {"lt": 2.0}}, "sort_by": "pmi", "limit": 2}).json()
+    assert [i["name"] for i in first["items"]] == ["r11", "r12"]
+    rest = client.post("/api/library/query", json={"where": {"pmi": {"lt": 2.0}}, "sort_by": "pmi", "limit": 2,
+                                                   "cursor": first["next_cursor"]}).json()
+    assert [i["name"] for i in rest["items"]] == ["r13", "r14"] and rest["next_cursor"] is None
+    desc = client.post("/api/library/query", json={"sort_by": "pmi", "descending": True, "limit": 1}).json()
+    assert desc["items"][0]["name"] == "r20" and "payload" not in desc["items"][0]
+    assert client.post("/api/library/query", json={"cursor": "not-a-cursor"}).status_code == 400
+
+
+def test_rows_are_rescored_after_a_formula_version_bump(library, client, monkeypatch):
+    rid = _insert(client, [_reaction("a", 12)])["results"][0]["id"]
+    monkeypatch.setattr(main, "IMPACT_FORMULA_VERSION", "test-bump")
+    reopened = main.ReactionLibrary(library.path)
+    assert reopened.get(rid)["result"]["pmi"] == 1.2
+    with sqlite3.connect(library.path) as conn:
+        assert conn.execute("SELECT DISTINCT formula_version FROM reactions").fetchall() == [("test-bump",)]
@@ -0,0 +1,101 @@
+"""Built-in formulas must agree with /api/impact/compute; the formula compiler must stay a whitelist."""
+import random
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+SOLVENTS = ["water", "H2O", "ethanol", "toluene", "deionized water", "acetone"]
+
+
+def _reaction(rng):
+    def maybe(value, p=0.7):
+        return value if rng.random() < p else None
+
+    reactants = []
+    for _ in range(rng.randint(1, 4)):
+        r = {"mw": round(rng.uniform(20, 600), 3), "mass_g": round(rng.uniform(0, 50), 3)}
+        r.update({k: v for k, v in (("carbon_atoms", maybe(rng.randint(0, 30), 0.8)),
+                                    ("eq_used", maybe(round(rng.uniform(0, 3), 2), 0.5)),
+                                    ("eq_stoich", maybe(round(rng.uniform(0.5, 2), 2), 0.5))) if v is not None})
+        reactants.append(r)
+    solvents = []
+    for _ in range(rng.randint(0, 3)):
+        s = {"name": rng.choice(SOLVENTS), "recovery_pct": rng.choice([0, 50, 80, 100])}
+        s["mass_g" if rng.random() < 0.5 else "volume_mL"] = round(rng.uniform(0, 200), 2)
+        solvents.append(s)
+    payload = {
+        "product": {"mw": round(rng.uniform(50, 800), 3), "actual_mass_g": round(rng.uniform(0.01, 40), 3)},
+        "reactants": reactants,
+        "solvents": solvents,
+        "catalysts": [{"mw": 106.42, "mass_g": round(rng.uniform(0, 2), 3)} for _ in range(rng.randint(0, 2))],
+        "workup": {"aqueous_washes_g": round(rng.uniform(0, 100), 2), "drying_agents_g": round(rng.uniform(0, 5), 2)},
+        "conditions": {"mode": rng.choice(["hotplate", "microwave", "reflux", "other"]), "time_h": round(rng.uniform(0, 24), 2)},
+    }
+    if rng.random() < 0.7:
+        payload["product"]["carbon_atoms"] = rng.randint(1, 40)
+    if rng.random() < 0.2:
+        payload["options"] = {"water_names": ["water"]}
+    return payload
+
+
+REACTIONS = [_reaction(random.Random(seed)) for seed in range(40)]
+
+
+@pytest.fixture(scope="module")
+def client():
+    return TestClient(main.create_app())
+
+
+@pytest.mark.parametrize("payload", REACTIONS)
+def test_builtin_formulas_match_compute(client, payload):
+    report = client.post("/api/impact/compute", json=payload).json()
+    metrics = client.post("/api/impact/metrics", json={"reaction": payload}).json()["metrics"]
+    assert metrics == {name: report[name] for name in main._BUILTIN_METRIC_NAMES}
+
+
+def test_builtin_formulas_match_batch(client):
+    batch = client.post("/api/impact/compute-batch", json={"items": REACTIONS}).json()["results"]
+    metrics = client.post("/api/impact/metrics", json={"items": REACTIONS}).json()["results"]
+    for single, scored in zip(batch, metrics):
+        assert scored["metrics"] == {name: single["result"][name] for name in main._BUILTIN_METRIC_NAMES}
+
+
+@pytest.mark.parametrize("formula", [
+    "product_mw.real",
+    "().__class__",
+    "[1, 2][0]",
+    "(lambda: 1)()",
+    "sum(x for x in [1])",
+    "__import__('os')",
+    "open('x')",
+    "'text'",
+])
+def test_compiler_rejects_non_whitelisted_syntax(formula):
+    with pytest.raises(main.FormulaError):
+        main.compile_formula(formula)
+
+
+def test_compiler_rejects_over_length_and_over_size():
+    with pytest.raises(main.FormulaError, match="longer than"):
+        main.compile_formula("1" + " + 1" * main.FORMULA_MAX_LENGTH)
+    with pytest.raises(main.FormulaError, match="terms"):
+        main.compile_formula("+".join(["pmi"] * main.FORMULA_MAX_NODES))
+
+
+def test_compile_cache_hit_by_text():
+    text = "pmi * 2 + 0.123456"
+    first = main.compile_formula(text)
+    assert main.compile_formula(text) is first
+    assert main.compile_formula(text + " ") is not first  # keyed by the exact text
+
+
+def test_custom_formula_endpoint_errors(client):
+    payload = {"reaction": REACTIONS[0], "formulas": [{"name": "bad", "formula": "pmi.real"}]}
+    response = client.post("/api/impact/metrics", json=payload)
+    assert response.status_code == 400 and "not allowed" in response.json()["detail"]
+    ok = {"reaction": REACTIONS[0], "metrics": ["my_pmi"],
+          "formulas": [{"name": "my_pmi", "formula": "total_input_mass_g / product_mass_g", "decimals": 3}]}
+    metrics = client.post("/api/impact/metrics", json=ok).json()["metrics"]
+    assert metrics == {"my_pmi": client.post("/api/impact/compute", json=REACTIONS[0]).json()["pmi"]}
@@ -0,0 +1,51 @@
+"""/api/impact/pareto: frontier and ranks, the same answer from items and overrides, and input caps."""
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+BASE = {"product": {"mw": 180.16, "actual_mass_g": 10},
+        "reactants": [{"mw": 138.12, "mass_g": 12}],
+        "solvents": [{"name": "ethanol", "mass_g": 50}], "conditions": {"time_h": 2}}
+OVERRIDES = {"solvents.0.mass_g": [50, 30, 20, 20, 60],
+             "conditions.time_h": [2, 2, 4, 1, 1]}
+
+
+def _items():
+    items = []
+    for mass, time_h in zip(*OVERRIDES.values()):
+        items.append({**BASE, "solvents": [{"name": "ethanol", "mass_g": mass}], "conditions": {"time_h": time_h}})
+    return items
+
+
+@pytest.fixture(scope="module")
+def client():
+    return TestClient(main.create_app())
+
+
+def test_frontier_and_ranks(client):
+    body = {"base": BASE, "overrides": OVERRIDES, "objectives": ["pmi", "energy_kWh_per_g"], "fronts": 3}
+    out = client.post("/api/impact/pareto", json=body).json()
+    # 3 (20 g, 1 h) dominates everything with more solvent or time; 2 (20 g, 4 h) is tied on PMI only.
+    assert [f["index"] for f in out["frontier"]] == [3]
+    assert out["rank"][3] == 1 and out["dominated_by"][3] == 0
+    assert all(r is None or r > 1 for i, r in enumerate(out["rank"]) if i != 3)
+    assert all(d == 1 for i, d in enumerate(out["dominated_by"]) if i != 3)
+
+
+def test_items_and_overrides_agree(client):
+    objectives = ["pmi", "e_factor", "energy_kWh_per_g"]
+    by_overrides = client.post("/api/impact/pareto", json={"base": BASE, "overrides": OVERRIDES, "objectives": objectives}).json()
+    by_items = client.post("/api/impact/pareto", json={"items": _items(), "objectives": objectives}).json()
+    assert by_items["frontier"] == by_overrides["frontier"]
+    assert by_items["rank"] == by_overrides["rank"]
+
+
+def test_variant_caps(client, monkeypatch):
+    monkeypatch.setattr(main, "IMPACT_BATCH_MAX_ITEMS", 3)
+    monkeypatch.setattr(main, "IMPACT_PARETO_MAX_VARIANTS", 4)
+    items = client.post("/api/impact/pareto", json={"items": _items()})
+    assert items.status_code == 413 and "base + overrides allows 4" in items.json()["detail"]
+    assert client.post("/api/impact/pareto", json={"base": BASE, "overrides": OVERRIDES}).status_code == 413
+    monkeypatch.setattr(main, "IMPACT_PARETO_MAX_VARIANTS", 5)
+    assert client.post("/api/impact/pareto", json={"base": BASE, "overrides": OVERRIDES}).status_code == 200
@@ -0,0 +1,58 @@
+"""/api/route/compute: roll-up of a convergent route, scaling, DAG validation and the per-step memo."""
+from collections import OrderedDict
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+def _step(step_id, product_g, reactant_masses, intermediates=()):
+    return {"id": step_id,
+            "reaction": {"product": {"mw": 200, "actual_mass_g": product_g},
+                         "reactants": [{"mw": 100, "mass_g": m} for m in reactant_masses]},
+            "intermediates": [{"step": s, "reactant": r} for s, r in intermediates]}
+
+
+# A: 12 g -> 10 g (1.2 g raw per g); B: 20 g -> 10 g (2.0); C: 5 g of A + 4 g of B + 3 g -> 8 g.
+ROUTE = {"steps": [_step("A", 10, [12]), _step("B", 10, [20]),
+                   _step("C", 8, [5, 4, 3], [("A", 0), ("B", 1)])]}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(main, "_route_step_memo", OrderedDict())
+    return TestClient(main.create_app())
+
+
+def test_convergent_route_rolls_up(client):
+    out = client.post("/api/route/compute", json={**ROUTE, "target_mass_g": 16}).json()
+    assert out["final_step"] == "C"
+    assert out["pmi"] == 2.125 and out["e_factor"] == 1.125  # (3 + 5 * 1.2 + 4 * 2.0) / 8
+    assert out["final_product_mass_g"] == 16 and out["raw_input_mass_g"] == 34
+    steps = {s["id"]: s for s in out["steps"]}
+    assert [steps[s]["scale"] for s in "ABC"] == [1.0, 0.8, 2.0]
+    assert [steps[s]["cumulative_pmi"] for s in "ABC"] == [1.2, 2.0, 2.125]
+    assert steps["C"]["metrics"] == client.post("/api/impact/compute", json=ROUTE["steps"][2]["reaction"]).json()
+    assert sum(s["raw_input_mass_g"] for s in out["steps"]) == pytest.approx(out["raw_input_mass_g"])
+
+
+def test_only_edited_steps_are_recomputed(client):
+    assert client.post("/api/route/compute", json=ROUTE).json()["recomputed_steps"] == ["A", "B", "C"]
+    edited = {"steps": [ROUTE["steps"][0], _step("B", 10, [25]), ROUTE["steps"][2]]}
+    out = client.post("/api/route/compute", json=edited).json()
+    assert out["recomputed_steps"] == ["B"]
+    assert out["pmi"] == 2.375  # (3 + 5 * 1.2 + 4 * 2.5) / 8
+
+
+@pytest.mark.parametrize("steps,final,detail", [
+    ([_step("A", 10, [12]), _step("A", 10, [12])], None, "Duplicate step id"),
+    ([_step("A", 10, [12], [("B", 0)]), _step("B", 10, [12], [("A", 0)])], None, "cycle"),
+    ([_step("A", 10, [12], [("X", 0)])], None, "unknown step"),
+    ([_step("A", 10, [12]), _step("B", 10, [12], [("A", 3)])], None, "out of range"),
+    ([_step("A", 10, [12]), _step("B", 10, [12])], None, "one final step"),
+    ([_step("A", 10, [12]), _step("B", 10, [12], [("A", 0)])], "A", "is consumed by"),
+])
+def test_invalid_routes_are_rejected(client, steps, final, detail):
+    response = client.post("/api/route/compute", json={"steps": steps, "final_step": final})
+    assert response.status_code == 400 and detail in response.json()["detail"]
@@ -0,0 +1,77 @@
+"""/ws/simulate: patches in, changed outputs out, sessions resumable and failures reported."""
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+PAYLOAD = {"product": {"mw": 180.16, "actual_mass_g": 10},
+           "reactants": [{"mw": 138.12, "mass_g": 12}],
+           "solvents": [{"name": "ethanol", "volume_mL": 40}]}
+
+
+@pytest.fixture(scope="module")
+def client():
+    return TestClient(main.create_app())
+
+
+def test_init_patch_and_delta(client):
+    with client.websocket_connect("/ws/simulate") as ws:
+        assert ws.receive_json()["type"] == "session"
+        ws.send_json({"type": "init", "seq": 1, "payload": PAYLOAD})
+        first = ws.receive_json()
+        assert first["type"] == "result" and first["seq"] == 1
+        expected = client.post("/api/impact/compute", json=PAYLOAD).json()
+        assert first["changed"]["pmi"] == expected["pmi"]
+
+        ws.send_json({"type": "patch", "seq": 2, "set": {"product.actual_mass_g": 20}})
+        second = ws.receive_json()
+        assert second["seq"] == 2
+        patched = client.post("/api/impact/compute",
+                              json={**PAYLOAD, "product": {"mw": 180.16, "actual_mass_g": 20}}).json()
+        assert second["changed"]["pmi"] == patched["pmi"]
+        assert "atom_economy_pct" not in second["changed"]  # unchanged outputs are not re-sent
+        assert len(second["changed"]) < len(first["changed"])
+
+
+def test_compute_error_reported_and_socket_recovers(client):
+    bad = {**PAYLOAD, "conditions": {"mode": "reflux", "time_h": 1},
+           "options": {"energy_presets_kw": {"hotplate": {"kw": 0.5, "duty": 1}}}}
+    assert client.post("/api/impact/compute", json=bad).status_code == 400
+    with client.websocket_connect("/ws/simulate") as ws:
+        ws.receive_json()
+        ws.send_json({"type": "init", "seq": 1, "payload": bad})
+        error = ws.receive_json()
+        assert error["type"] == "error" and error["seq"] == 1
+        assert error["detail"].startswith("Invalid input:")
+        ws.send_json({"type": "init", "seq": 2, "payload": PAYLOAD})
+        assert ws.receive_json()["type"] == "result"
+
+
+def test_message_errors(client):
+    with client.websocket_connect("/ws/simulate") as ws:
+        ws.receive_json()
+        ws.send_text("not json")
+        assert ws.receive_json() == {"type": "error", "seq": 0, "detail": "Invalid JSON."}  # unparsed: seq not advanced
+        ws.send_json({"type": "init", "seq": 2, "payload": {"product": {"mw": 180}}})
+        error = ws.receive_json()
+        assert error["type"] == "error" and isinstance(error["detail"], list)  # validation errors
+
+
+def test_resume_with_session(client):
+    with client.websocket_connect("/ws/simulate") as ws:
+        sid = ws.receive_json()["id"]
+        ws.send_json({"type": "init", "seq": 1, "payload": PAYLOAD})
+        outputs = ws.receive_json()["changed"]
+    with client.websocket_connect(f"/ws/simulate?session={sid}") as ws:
+        assert ws.receive_json() == {"type": "session", "id": sid, "seq": 1}
+        resumed = ws.receive_json()
+        assert resumed["type"] == "result" and resumed["changed"] == outputs  # full state for the new connection
+
+
+def test_idle_sessions_evicted_without_new_connections(client, monkeypatch):
+    store = main.SimSessionStore(max_sessions=10, idle_s=60)
+    sess = store.attach(None)
+    store.detach(sess)
+    monkeypatch.setattr(main.time, "monotonic", lambda: sess.last_seen + 61)
+    store.evict_idle()
+    assert store.stats()["sessions"] == 0
@@ -0,0 +1,65 @@
+"""/api/impact/stream and score_file.py share score_stream's pipeline: same bytes for the same input."""
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import score_file
+
+ROW = {"product": {"mw": 180.16, "actual_mass_g": 10}, "reactants": [{"mw": 138.12, "mass_g": 12}]}
+NDJSON = "\n".join([
+    json.dumps(ROW),
+    "",
+    "{not json",
+    json.dumps({"product": {"mw": 180}}),
+    "[1, 2]",
+    json.dumps({**ROW, "solvents": [{"name": "water", "mass_g": 30}]}),
+]).encode() + b"\n"
+CSV = (b"product.mw,product.actual_mass_g,reactants.0.mw,reactants.0.mass_g,solvents.0.name,solvents.0.mass_g\r\n"
+       b"180.16,10,138.12,12,,\r\n"
+       b"180.16,10,138.12,12,\"water, deionized\",30\r\n"
+       b"180.16,,138.12,12,,\r\n")
+
+
+@pytest.fixture(scope="module")
+def client():
+    return TestClient(main.create_app())
+
+
+def _split(data: bytes, size: int):
+    return (data[i:i + size] for i in range(0, len(data), size))
+
+
+@pytest.mark.parametrize("fmt,data", [("ndjson", NDJSON), ("csv", CSV)])
+def test_endpoint_matches_score_stream(client, fmt, data):
+    expected = "".join(main.score_stream([data], fmt=fmt))
+    for size in (len(data), 7):  # one body chunk, and records split across chunks
+        response = client.post(f"/api/impact/stream?format={fmt}", content=_split(data, size))
+        assert response.status_code == 200
+        assert response.text == expected
+    assert "".join(main.score_stream(_split(data, 3), fmt=fmt, chunk_rows=2)) == expected
+
+
+def test_rows_match_compute_and_errors_are_per_record(client):
+    lines = [json.loads(line) for line in "".join(main.score_stream([NDJSON])).splitlines()]
+    assert [line.get("ok") for line in lines[:-1]] == [True, False, False, False, True]
+    assert [line["error"]["status_code"] for line in lines[1:4]] == [400, 422, 400]
+    assert json.dumps(lines[0]["result"], separators=(",", ":")).encode() == client.post("/api/impact/compute", json=ROW).content
+    assert lines[-1] == {"done": True, "count": 5, "ok_count": 2, "error_count": 3}
+
+
+def test_oversized_record_ends_the_stream(client):
+    data = json.dumps(ROW).encode() + b"\n" + b"x" * (main.IMPACT_STREAM_MAX_RECORD_BYTES + 1)
+    response = client.post("/api/impact/stream", content=_split(data, 1 << 16))
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines[0]["ok"] is True
+    assert lines[-1]["done"] is False and "exceeds" in lines[-1]["detail"]
+    assert response.text == "".join(main.score_stream(_split(data, 1 << 16)))
+
+
+def test_score_file_matches_endpoint(client, tmp_path):
+    src, dst = tmp_path / "in.csv", tmp_path / "out.ndjson"
+    src.write_bytes(CSV)
+    assert score_file.main([str(src), "-o", str(dst)]) == 0
+    assert dst.read_text() == client.post("/api/impact/stream?format=csv", content=CSV).text
@@ -0,0 +1,87 @@
+"""/api/impact/sweep and /api/impact/uncertainty: grid points and samples agree with /api/impact/compute."""
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+BASE = {"product": {"mw": 180.16, "actual_mass_g": 10},
+        "reactants": [{"mw": 138.12, "mass_g": 12}],
+        "solvents": [{"name": "ethanol", "mass_g": 50, "recovery_pct": 0}],
+        "conditions": {"time_h": 2}}
+
+
+@pytest.fixture(scope="module")
+def client():
+    return TestClient(main.create_app())
+
+
+def _compute(client, solvent_mass, recovery, mode="hotplate"):
+    body = {**BASE, "solvents": [{"name": "ethanol", "mass_g": solvent_mass, "recovery_pct": recovery}],
+            "conditions": {"time_h": 2, "mode": mode}}
+    return client.post("/api/impact/compute", json=body).json()
+
+
+def test_sweep_grid_matches_compute(client):
+    body = {"base": BASE, "metrics": ["pmi", "energy_kWh_per_g"], "axes": [
+        {"field": "solvents.0.mass_g", "values": [10, 50]},
+        {"field": "solvents[0].recovery_pct", "start": 0, "stop": 80, "num": 3},
+        {"field": "conditions.mode", "values": ["hotplate", "microwave"]},
+    ]}
+    out = client.post("/api/impact/sweep", json=body).json()
+    assert out["shape"] == [2, 3, 2] and out["points"] == 12
+    assert out["axes"][1]["values"] == [0, 40, 80]
+    assert set(out["metrics"]) == {"pmi", "energy_kWh_per_g"}
+    for i, mass in enumerate([10, 50]):
+        for j, recovery in enumerate([0, 40, 80]):
+            for k, mode in enumerate(["hotplate", "microwave"]):
+                expected = _compute(client, mass, recovery, mode)
+                for metric, values in out["metrics"].items():
+                    assert values[i][j][k] == expected[metric], (mass, recovery, mode, metric)
+
+
+@pytest.mark.parametrize("body,status", [
+    ({"base": BASE, "axes": [{"field": "solvents.3.mass_g", "values": [1]}]}, 400),
+    ({"base": BASE, "axes": [{"field": "reactants.0.mass_g", "values": [1]}], "metrics": ["nope"]}, 400),
+    ({"base": BASE, "axes": [{"field": "reactants.0.mass_g", "start": 1, "stop": 2, "num": 1000},
+                             {"field": "solvents.0.mass_g", "start": 1, "stop": 2, "num": 1000}]}, 413),
+])
+def test_sweep_rejects(client, body, status):
+    assert client.post("/api/impact/sweep", json=body).status_code == status
+
+
+def test_uncertainty_is_seeded_and_clipped(client):
+    body = {"base": BASE, "samples": 2000, "seed": 7, "metrics": ["pmi"], "distributions": [
+        {"field": "solvents.0.recovery_pct", "dist": "normal", "mean": 90, "sd": 30},
+        {"field": "reactants.0.mass_g", "dist": "triangular", "low": 11, "high": 13},
+    ]}
+    first = client.post("/api/impact/uncertainty", json=body).json()
+    assert first == client.post("/api/impact/uncertainty", json=body).json()
+    assert first["seed"] == 7 and first["samples"] == 2000
+    assert first["nominal"]["pmi"] == _compute(client, 50, 0)["pmi"]
+    pmi = first["metrics"]["pmi"]
+    assert pmi["n_valid"] == 2000 and sum(pmi["histogram"]["counts"]) == 2000
+    # recovery is clipped to 100 %, so PMI never drops below reactants alone (11 g / 10 g).
+    assert pmi["histogram"]["edges"][0] >= 1.1
+    assert pmi["percentiles"]["2.5"] <= pmi["percentiles"]["50"] <= pmi["percentiles"]["97.5"]
+
+
+def test_uncertainty_point_distribution_equals_compute(client):
+    body = {"base": BASE, "samples": 100, "seed": 1, "distributions": [
+        {"field": "solvents.0.mass_g", "dist": "uniform", "low": 30, "high": 30}]}
+    out = client.post("/api/impact/uncertainty", json=body).json()
+    expected = _compute(client, 30, 0)
+    for metric, summary in out["metrics"].items():
+        if expected[metric] is None:
+            assert summary["n_valid"] == 0
+        else:
+            assert summary["std"] == 0 and summary["mean"] == expected[metric], metric
+
+
+@pytest.mark.parametrize("distribution,status", [
+    ({"field": "conditions.mode", "dist": "uniform", "low": 0, "high": 1}, 400),
+    ({"field": "reactants.0.mass_g", "dist": "uniform", "low": 2, "high": 1}, 400),
+    ({"field": "reactants.0.mass_g", "dist": "normal"}, 400),
+])
+def test_uncertainty_rejects(client, distribution, status):
+    body = {"base": BASE, "samples": 100, "distributions": [distribution]}
+    assert client.post("/api/impact/uncertainty", json=body).status_code == status